@@ -0,0 +1,102 @@
+#!/bin/bash
+
+SCRIPT_DIR="$(dirname "$(realpath "$0")")"
+
+
+usage() {
+cat <<EOM
+Usage: "$(basename $0)" <work-dir>
+  work-dir    output directory; a synthetic table is generated in it
+
+Learns, compresses and decompresses (with --validation-file) a synthetic
+table with compressed exception columns (dict overflow split by
+CharSetSplit, numbers as strings) and correlated columns, then each column
+on its own. Each decompression must either round-trip or refuse the tree;
+it must never exit 0 with different output.
+EOM
+}
+
+if [ "$#" -lt 1 ]; then
+	usage
+	exit 1
+fi
+work_dir="$1"
+
+
+generate_table() {
+	mkdir -p $work_dir
+	echo "id|sku|amount|city|city_code|const|ref" > $work_dir/t.header.csv
+	echo "integer not null|varchar(20)|varchar(16)|varchar(20)|varchar(10)|varchar(1)|varchar(10)" > $work_dir/t.datatypes.csv
+	python3 - $work_dir/t.csv <<'EOF'
+import sys
+import random
+random.seed(7)
+cities = ["Berlin", "Paris", "Rome", "Madrid", "Oslo", "Wien"]
+with open(sys.argv[1], 'w') as fd:
+	for i in range(40000):
+		# more than 32767 distinct values: the dict overflows into its exception column
+		sku = "{}-{}-{}".format(random.choice(["AB", "AC", "BX", "QQ"]), random.randint(100000, 119999), random.choice("XYZ"))
+		if random.random() < 0.03:
+			sku = "bad{}".format(i)
+		amount = str(random.randint(0, 5000000))
+		r = random.random()
+		if r < 0.02:
+			amount = "n/a"
+		elif r < 0.04:
+			amount = "null"
+		elif r < 0.06:
+			amount = "00" + amount
+		city = random.choice(cities) if random.random() > 0.03 else "null"
+		if random.random() < 0.005:
+			city = "Atlantis{}".format(i)
+		# correlated with city
+		city_code = city.upper()[:3] if city != "null" else "null"
+		const = "K" if random.random() > 0.03 else "J"
+		# high cardinality: spurious correlations with the sku fragments
+		ref = str(random.randint(0, 99999)) if random.random() > 0.03 else "n/a"
+		fd.write("|".join([str(i), sku, amount, city, city_code, const, ref]) + "\n")
+EOF
+}
+
+# decompress <name> [args]: round-trip or refuse
+decompress() {
+	name="$1"
+	shift
+	$SCRIPT_DIR/main.py --in-header-file $work_dir/out/t_out.header.csv --out-header-file $work_dir/t.header.csv \
+	--nulls-file $work_dir/out/t_out.nulls.csv --expr-tree-file $work_dir/tree/dec_tree.bin \
+	--output-file $work_dir/out/$name.csv --validation-file $work_dir/t.csv "$@" \
+	$work_dir/out/t_out.csv &> $work_dir/out/$name.log
+	ret=$?
+	if [ $ret -eq 0 ]; then
+		echo "[$name] ok"
+	elif grep -q "Unsupported decompression tree" $work_dir/out/$name.log; then
+		echo "[$name] refused: $(tail -n 1 $work_dir/out/$name.log)"
+	else
+		echo "[$name] error: see $work_dir/out/$name.log"
+		failed=1
+	fi
+}
+
+
+failed=0
+rm -rf $work_dir/tree $work_dir/out
+mkdir -p $work_dir/tree $work_dir/out
+generate_table
+
+$SCRIPT_DIR/../pattern_detection/main.py --header-file $work_dir/t.header.csv --datatypes-file $work_dir/t.datatypes.csv \
+--expr-tree-output-dir $work_dir/tree $work_dir/t.csv &> $work_dir/tree/learning.log || { echo "error: learning failed"; exit 1; }
+$SCRIPT_DIR/../pattern_detection/apply_expression.py --expr-tree-file $work_dir/tree/c_tree.bin \
+--header-file $work_dir/t.header.csv --datatypes-file $work_dir/t.datatypes.csv \
+--output-dir $work_dir/out --out-table-name t_out $work_dir/t.csv &> $work_dir/out/compression.log || { echo "error: compression failed"; exit 1; }
+
+decompress all
+for col in $(head -n 1 $work_dir/t.header.csv | tr '|' ' '); do
+	decompress col_$col --columns $col
+done
+
+exit $failed
+
+
+: <<'END_COMMENT'
+./decompression/check_roundtrip.sh /tmp/check_roundtrip; echo $?
+END_COMMENT
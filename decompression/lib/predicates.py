@@ -0,0 +1 @@
+../../lib/predicates.py
\ No newline at end of file
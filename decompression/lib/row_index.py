@@ -0,0 +1 @@
+../../lib/row_index.py
\ No newline at end of file
@@ -5,7 +5,11 @@ import sys
 import argparse
 import json
 import traceback
+from collections import defaultdict
 from lib.util import *
+from lib.instrumentation import instrumentation, add_instrumentation_arguments
+from lib.row_index import RowIndex, parse_rows
+from lib.predicates import parse_predicate
 from pattern_detection.patterns import *
 from pattern_detection.lib.expression_tree import *
 
@@ -16,20 +20,242 @@ class ValidationException(Exception):
 		self.diff = diff
 
 
+class DecompressionPlan(object):
+	"""
+	Projection pushdown: the part of the decompression tree needed to
+	decompress the output columns <projection> (column names of
+	output_header, in output order; None: all the columns of output_header)
+
+	NOTE-1: only the ancestors of the projected columns are kept (see
+			ExpressionTree.get_required_nodes()); the compressed columns that
+			feed them are the input columns and the exception columns of the
+			required columns
+	NOTE-2: the null mask is only needed for the required original columns
+	NOTE-3: filter_columns: columns (names of output_header) a row filter is
+			evaluated on (see RowFilter); their compressed columns are read
+			as well, but they are only decompressed if they are projected
+	NOTE-4: exception columns can be compressed themselves (i.e. they are
+			not input columns); they are decompressed before the nodes that
+			output the column they hold the exceptions of (see
+			get_node_order()) and only used for the rows where one of their
+			presence columns is not null (see get_presence_columns())
+	"""
+
+	def __init__(self, decompression_tree, output_header, projection=None, filter_columns=None):
+		if projection is not None:
+			for col_name in projection:
+				if col_name not in output_header:
+					raise Exception("Invalid projection column: {}".format(col_name))
+		self.projection = projection
+
+		# out_columns in output order
+		self.out_columns = [self.get_col_id(decompression_tree, col_name) for col_name in (projection if projection is not None else output_header)]
+		(node_ids, self.required_columns, self.compressed_exception_columns) = self.get_required_nodes(decompression_tree, self.out_columns)
+		""" compressed_exception_columns item format: ex_col_id (str): col_id (str) """
+		self.presence_columns = {ex_col_id: self.get_presence_columns(decompression_tree, ex_col_id)
+								 for ex_col_id in self.compressed_exception_columns.keys()}
+		""" presence_columns item format: ex_col_id (str): list(col_id) """
+		# nodes in topological order
+		self.node_ids = self.get_node_order(decompression_tree, node_ids, self.compressed_exception_columns)
+		self.node_count = len(decompression_tree.nodes)
+
+		# compressed columns to read
+		in_columns = decompression_tree.get_in_columns()
+		self.in_columns = [col_id for col_id in in_columns if col_id in self.required_columns]
+		self.exception_columns = dict()
+		""" exception_columns item format: ex_col_id (str): col_id (str) """
+		for col_id in sorted(self.required_columns):
+			ex_col_id = OutputColumnManager.get_exception_col_id(col_id)
+			if ex_col_id in decompression_tree.columns and ex_col_id not in self.compressed_exception_columns:
+				self.exception_columns[ex_col_id] = col_id
+		self.in_column_count = len(in_columns)
+
+		# original columns whose null mask is read
+		self.null_columns = [self.get_col_id(decompression_tree, col_name) for col_name in output_header]
+		self.null_columns = [col_id for col_id in self.null_columns if col_id in self.required_columns]
+
+		# plan of the filter columns
+		self.filter_plan = None
+		if filter_columns is not None and len(filter_columns) > 0:
+			self.filter_plan = DecompressionPlan(decompression_tree, output_header, filter_columns)
+
+	@classmethod
+	def get_required_nodes(cls, decompression_tree, col_ids):
+		"""
+		Returns: (node_ids, required_col_ids, compressed_exception_columns);
+				 see ExpressionTree.get_required_nodes(); the compressed
+				 exception columns of the required columns are required as well
+		"""
+		in_columns = set(decompression_tree.get_in_columns())
+		col_ids = list(col_ids)
+		compressed_exception_columns = dict()
+		while True:
+			(node_ids, required_col_ids) = decompression_tree.get_required_nodes(col_ids)
+			new_columns = dict()
+			for col_id in required_col_ids:
+				ex_col_id = OutputColumnManager.get_exception_col_id(col_id)
+				if (ex_col_id in decompression_tree.columns and ex_col_id not in in_columns and
+					ex_col_id not in compressed_exception_columns):
+					new_columns[ex_col_id] = col_id
+			if len(new_columns) == 0:
+				return (node_ids, required_col_ids, compressed_exception_columns)
+			compressed_exception_columns.update(new_columns)
+			col_ids.extend(sorted(new_columns.keys()))
+
+	@classmethod
+	def get_presence_columns(cls, decompression_tree, ex_col_id):
+		"""
+		Returns: list(col_id) of the input columns that store (part of) the
+				 value of the compressed exception column <ex_col_id>; at least
+				 one of them is not null iff the row has an exception
+
+		NOTE: compression only writes non-null values into the columns
+			  derived from a non-null value; nodes that store nothing (e.g.
+			  ConstantPatternDetector, ColumnCorrelation) do not mark
+			  the presence of the value
+		Raises: if the presence of the value can not be determined (i.e. it
+				may be fully encoded by nodes that store nothing)
+		"""
+		in_columns = set(decompression_tree.get_in_columns())
+
+		def visit(col_id):
+			"""
+			Returns: list(col_id) or None if the presence can not be determined
+			"""
+			if col_id in in_columns:
+				return [col_id]
+			node_ids = decompression_tree.get_column(col_id)["output_of"]
+			if len(node_ids) == 0:
+				return None
+			res = []
+			# each row takes one of the nodes; all of them must mark the presence
+			for node_id in node_ids:
+				node_res = []
+				for col in decompression_tree.get_node(node_id).cols_in_consumed:
+					col_res = visit(col.col_id)
+					if col_res is not None:
+						node_res.extend(col_res)
+				if len(node_res) == 0:
+					return None
+				res.extend(node_res)
+			# values not handled by any node are stored in the exception column
+			c_ex_col_id = OutputColumnManager.get_exception_col_id(col_id)
+			if c_ex_col_id in decompression_tree.columns:
+				ex_res = visit(c_ex_col_id)
+				if ex_res is None:
+					return None
+				res.extend(ex_res)
+			return res
+
+		res = visit(ex_col_id)
+		if res is None:
+			raise Exception("Unsupported decompression tree: the presence of the compressed exception column can not be determined: ex_col_id={}".format(ex_col_id))
+		return sorted(set(res))
+
+	@classmethod
+	def get_node_order(cls, decompression_tree, node_ids, compressed_exception_columns):
+		"""
+		Returns: list(node_id) of <node_ids> in topological order, where a node
+				 also depends on the nodes that output the (compressed)
+				 exception columns of its output columns
+
+		NOTE: ties are broken by the topological order of the tree (e.g. nodes
+			  with the same output column keep their relative order)
+		"""
+		tree_order = [node_id for node_id in decompression_tree.get_topological_order() if node_id in node_ids]
+		positions = {node_id: idx for idx, node_id in enumerate(tree_order)}
+
+		def get_deps(node_id):
+			expr_n = decompression_tree.get_node(node_id)
+			dep_col_ids = [col.col_id for col in expr_n.cols_in]
+			for col in expr_n.cols_out:
+				ex_col_id = OutputColumnManager.get_exception_col_id(col.col_id)
+				if ex_col_id in compressed_exception_columns:
+					dep_col_ids.append(ex_col_id)
+			deps = {dep_id for col_id in dep_col_ids for dep_id in decompression_tree.get_column(col_id)["output_of"] if dep_id in positions}
+			return sorted(deps, key=lambda dep_id: positions[dep_id])
+
+		res, visited, in_progress = [], set(), set()
+
+		def visit(node_id):
+			if node_id in visited:
+				return
+			if node_id in in_progress:
+				raise Exception("Cycle in decompression plan: node_id={}".format(node_id))
+			in_progress.add(node_id)
+			for dep_id in get_deps(node_id):
+				visit(dep_id)
+			in_progress.remove(node_id)
+			visited.add(node_id)
+			res.append(node_id)
+
+		for node_id in tree_order:
+			visit(node_id)
+		return res
+
+	def get_node_exception_columns(self, expr_n):
+		"""
+		Returns: list((ex_col_id, col_id, presence_columns)) of the compressed
+				 exception columns of the output columns of <expr_n>
+		"""
+		res = []
+		for col in expr_n.cols_out:
+			ex_col_id = OutputColumnManager.get_exception_col_id(col.col_id)
+			if ex_col_id in self.compressed_exception_columns:
+				res.append((ex_col_id, col.col_id, self.presence_columns[ex_col_id]))
+		return res
+
+	@classmethod
+	def get_col_id(cls, decompression_tree, col_name):
+		col_item = decompression_tree.get_column_by_name(col_name)
+		if col_item is None:
+			raise Exception("Invalid col_name: {}".format(col_name))
+		return col_item["col_info"].col_id
+
+	def get_read_columns(self):
+		"""
+		Returns: list(col_id) of the compressed columns read by the plan
+		"""
+		res = self.in_columns + [ex_col_id for ex_col_id in self.exception_columns.keys() if ex_col_id not in self.in_columns]
+		if self.filter_plan is not None:
+			res += [col_id for col_id in self.filter_plan.get_read_columns() if col_id not in res]
+		return res
+
+	def get_null_columns(self):
+		"""
+		Returns: list(col_id) of the original columns whose null mask is read
+		"""
+		res = list(self.null_columns)
+		if self.filter_plan is not None:
+			res += [col_id for col_id in self.filter_plan.null_columns if col_id not in res]
+		return res
+
+	def __repr__(self):
+		return "DecompressionPlan(out_columns={}, nodes={}/{}, read_columns={}/{}, null_columns={}, filter_plan={})".format(
+			len(self.out_columns), len(self.node_ids), self.node_count,
+			len(self.get_read_columns()), self.in_column_count, len(self.get_null_columns()), self.filter_plan)
+
+
 class DecompressionContext(object):
-	def __init__(self, decompression_tree, input_header, output_header, null_value):
+	"""
+	NOTE-1: only the nodes of the decompression plan (see DecompressionPlan)
+			are applied and only the compressed columns of the plan are read
+	NOTE-2: the input & null mask tuples only need to be split up to the last
+			position read (see in_maxsplit, nulls_maxsplit)
+	"""
+
+	def __init__(self, decompression_tree, input_header, output_header, null_value, projection=None, filter_columns=None):
 		self.decompression_tree = decompression_tree
 		self.null_value = null_value
+		self.projection = projection
+		self.plan = DecompressionPlan(decompression_tree, output_header, projection, filter_columns)
+		print("[plan] {}".format(self.plan))
 
-		def get_col_by_name(col_name):
-			for col_id, col_item in decompression_tree.columns.items():
-				if col_item["col_info"].name == col_name:
-					return col_item["col_info"]
-			raise Exception("Invalid col_name: {}".format(col_name))
+		get_col_id = lambda col_name: DecompressionPlan.get_col_id(decompression_tree, col_name)
 
 		# in_columns, out_columns
-		self.in_columns = decompression_tree.get_in_columns()
-		self.out_columns = decompression_tree.get_out_columns()
+		self.in_columns = self.plan.in_columns
+		self.out_columns = self.plan.out_columns
 
 		# # unused out columns dict
 		# self.unused_out_columns = [col_id for col_id in decompression_tree.get_unused_columns()
@@ -37,42 +263,362 @@ class DecompressionContext(object):
 		# print("unused_out_columns: {}".format(self.unused_out_columns))
 
 		# exception columns dict
-		self.exception_columns = dict()
-		for col_id in decompression_tree.columns.keys():
-			ex_col_id = OutputColumnManager.get_exception_col_id(col_id)
-			if ex_col_id in decompression_tree.columns:
-				self.exception_columns[ex_col_id] = col_id
+		self.exception_columns = self.plan.exception_columns
+		self.compressed_exception_columns = self.plan.compressed_exception_columns
 		print("exception_columns: {}".format(self.exception_columns))
+		print("compressed_exception_columns: {}".format(self.compressed_exception_columns))
+		print("presence_columns: {}".format(self.plan.presence_columns))
 
 		# column positions
-		self.in_column_positions, self.out_column_positions = dict(), dict()
+		self.in_column_positions, self.out_column_positions, self.null_mask_positions = dict(), dict(), dict()
 		for idx, col_name in enumerate(input_header):
-			col_id = get_col_by_name(col_name).col_id
-			self.in_column_positions[col_id] = idx
-		for idx, col_name in enumerate(output_header):
-			col_id = get_col_by_name(col_name).col_id
+			self.in_column_positions[get_col_id(col_name)] = idx
+		for idx, col_id in enumerate(self.out_columns):
 			self.out_column_positions[col_id] = idx
+		for idx, col_name in enumerate(output_header):
+			self.null_mask_positions[get_col_id(col_name)] = idx
 		print("in_column_positions: {}".format(self.in_column_positions))
 		print("out_column_positions: {}".format(self.out_column_positions))
 
+		self.null_columns = self.plan.null_columns
+		# maxsplit for in_line.split() & nulls_line.split()
+		in_positions = [self.in_column_positions[col_id] for col_id in self.plan.get_read_columns()]
+		self.in_maxsplit = max(in_positions) + 1 if len(in_positions) > 0 else 0
+		null_positions = [self.null_mask_positions[col_id] for col_id in self.plan.get_null_columns()]
+		self.nulls_maxsplit = max(null_positions) + 1 if len(null_positions) > 0 else 0
+
 		# topological order for evalution
 		# self.topological_order = decompression_tree.get_topological_order()
 		# print("topological_order: {}".format(self.topological_order))
 
 		# decompression nodes in topological order
 		self.decompression_nodes = []
-		for node_id in decompression_tree.get_topological_order():
+		for node_id in self.plan.node_ids:
 			expr_n = decompression_tree.get_node(node_id)
 			pd = get_pattern_detector(expr_n.p_id)
 			operator = pd.get_operator_dec(expr_n.cols_in, expr_n.cols_out, expr_n.operator_info, self.null_value)
+			operator = instrumentation.instrument("operator_dec.{}.{}".format(node_id, expr_n.p_id), operator)
+			dec_n_stats = {
+				"attempted_count": 0,
+				"matched_count": 0,
+				"failed_count": 0,
+				"aborted_count": 0,
+				"operator_time_s": 0
+			}
+			# NOTE: operator_time_s is measured only with instrumentation enabled
+			operator = instrumentation.instrument_stats(dec_n_stats, "operator_time_s", operator)
 			self.decompression_nodes.append({
 				"node_id": node_id,
 				"expr_n": expr_n,
-				"operator": operator
+				"operator": operator,
+				"exception_columns": [(ex_col_id, col_id, [self.in_column_positions[c_id] for c_id in presence_columns])
+									  for (ex_col_id, col_id, presence_columns) in self.plan.get_node_exception_columns(expr_n)],
+				"stats": dec_n_stats
 			})
 
 		# sys.exit(1)
 
+	def project(self, tpl):
+		"""
+		Returns: the columns of an original tuple (e.g. validation tuple) in output order
+		"""
+		if self.projection is None:
+			return tpl
+		return [tpl[self.null_mask_positions[col_id]] for col_id in self.out_columns]
+
+	def get_stats(self, total_tuple_count):
+		"""
+		Returns: stats with one item for each decompression node, where:
+			attempted_count: number of rows the operator was applied on
+			matched_count: number of rows the operator succeeded on
+			failed_count: number of rows the operator raised OperatorException on
+			aborted_count: number of rows with missing input values (i.e. the node was not used in the compression)
+			operator_time_s: cumulative time spent in the operator (only with instrumentation enabled)
+		"""
+		res = []
+		for dec_n in self.decompression_nodes:
+			dec_n_stats = deepcopy(dec_n["stats"])
+			attempted_count, matched_count = dec_n_stats["attempted_count"], dec_n_stats["matched_count"]
+			dec_n_stats.update({
+				"node_id": dec_n["node_id"],
+				"p_id": dec_n["expr_n"].p_id,
+				"cols_in": [c.col_id for c in dec_n["expr_n"].cols_in],
+				"cols_out": [c.col_id for c in dec_n["expr_n"].cols_out],
+				"match_ratio": float(matched_count) / attempted_count if attempted_count > 0 else None,
+				"operator_time_per_match_us": 1000000 * dec_n_stats["operator_time_s"] / matched_count if matched_count > 0 and instrumentation.enabled else None
+			})
+			res.append(dec_n_stats)
+		return {
+			"total_tuple_count": total_tuple_count,
+			"decompression_nodes": res
+		}
+
+
+class RowFilter(object):
+	"""
+	Evaluates a conjunction of predicates (see lib/predicates.py) on the
+	compressed tuples, so that only the matching rows are decompressed
+
+	For each predicate column the value is taken, in this order, from:
+		1) the null mask (nulls never match)
+		2) the exception column (the predicate is evaluated on the original
+		   value); a compressed exception column is evaluated in the same way
+		   as the column itself (i.e. 4), for the rows it has a value in (see
+		   DecompressionPlan.get_presence_columns())
+		3) the input column, if the column was not compressed
+		4) the decompression nodes with the column as output (in topological
+		   order, same as decompress()): the predicate is evaluated on the
+		   input attrs of the node when the pattern supports it (see
+		   PatternDetector.get_predicate_dec()); otherwise the node's input
+		   attrs are decompressed (only as far as needed) and the predicate
+		   is evaluated on the output attr
+
+	NOTE: the compressed columns of the predicate columns are read by the
+		  decompression context (see DecompressionPlan filter_columns)
+	"""
+
+	def __init__(self, context, predicates):
+		self.context = context
+		self.predicates = predicates
+		self.null_value = context.null_value
+		self.plan = context.plan.filter_plan
+		decompression_tree = context.decompression_tree
+
+		# producer nodes of each column, in topological order
+		self.producers = defaultdict(list)
+		for node_id in self.plan.node_ids:
+			expr_n = decompression_tree.get_node(node_id)
+			pd = get_pattern_detector(expr_n.p_id)
+			operator = pd.get_operator_dec(expr_n.cols_in, expr_n.cols_out, expr_n.operator_info, self.null_value)
+			node = {
+				"node_id": node_id,
+				"expr_n": expr_n,
+				"operator": operator,
+				"pd": pd
+			}
+			for col in expr_n.cols_out:
+				self.producers[col.col_id].append(node)
+		# col_id: ex_col_id
+		self.compressed_exception_columns = {col_id: ex_col_id for ex_col_id, col_id in self.plan.compressed_exception_columns.items()}
+		self.presence_positions = {ex_col_id: [context.in_column_positions[c_id] for c_id in presence_columns]
+								   for ex_col_id, presence_columns in self.plan.presence_columns.items()}
+		# compressed exception columns with a value in the current row (see match())
+		self.present_exceptions = set()
+
+		self.filter_items = []
+		for predicate in predicates:
+			col_id = DecompressionPlan.get_col_id(decompression_tree, predicate.col_name)
+			# producer nodes of the column and of its compressed exception columns
+			nodes = dict()
+			c_id = col_id
+			while c_id is not None:
+				nodes[c_id] = []
+				for node in self.producers[c_id]:
+					expr_n = node["expr_n"]
+					predicate_f = None
+					if len(expr_n.cols_out) == 1:
+						predicate_f = node["pd"].get_predicate_dec(expr_n.cols_in, expr_n.cols_out, expr_n.operator_info, self.null_value, predicate)
+					nodes[c_id].append((node, predicate_f))
+				c_id = self.compressed_exception_columns.get(c_id)
+			self.filter_items.append({
+				"predicate": predicate,
+				"col_id": col_id,
+				"nodes": nodes,
+				"stats": {
+					"evaluated_count": 0,
+					"matched_count": 0,
+					"null_count": 0,
+					"exception_count": 0,
+					"compressed_count": 0,
+					"decompressed_count": 0
+				}
+			})
+			node_list = [item for c_nodes in nodes.values() for item in c_nodes]
+			print("[filter] {}: col_id={}, compressed_domain_nodes={}/{}".format(predicate, col_id,
+				len([1 for (_, predicate_f) in node_list if predicate_f is not None]), len(node_list)))
+
+		self.total_matched_count = 0
+
+	def get_value(self, col_id, values):
+		"""
+		Decompresses the value of <col_id> (lazily, same rules as decompress())
+
+		Returns: the value or None if none of the producer nodes was used
+		"""
+		if col_id in values:
+			return values[col_id]
+		ex_col_id = self.compressed_exception_columns.get(col_id)
+		if ex_col_id in self.present_exceptions:
+			attr = self.get_value(ex_col_id, values)
+			if attr is None or attr == self.null_value:
+				raise Exception("error: exception value not filled: col_id={}, ex_col_id={}".format(col_id, ex_col_id))
+			values[col_id] = attr
+			return attr
+		for node in self.producers[col_id]:
+			in_attrs = self.get_in_attrs(node["expr_n"], values)
+			if in_attrs is None:
+				continue
+			try:
+				out_attrs = node["operator"](in_attrs)
+			except OperatorException as e:
+				continue
+			self.fill_values(node["expr_n"], out_attrs, values)
+			return values[col_id]
+		return None
+
+	def get_in_attrs(self, expr_n, values):
+		in_attrs = []
+		for in_col in expr_n.cols_in:
+			in_attr = self.get_value(in_col.col_id, values)
+			if in_attr is None:
+				return None
+			in_attrs.append(in_attr)
+		return in_attrs
+
+	def fill_values(self, expr_n, out_attrs, values):
+		for out_col_idx, out_col in enumerate(expr_n.cols_out):
+			if out_col.col_id not in values:
+				values[out_col.col_id] = out_attrs[out_col_idx]
+
+	def evaluate_column(self, filter_item, col_id, values, is_exception=False):
+		"""
+		Returns: the predicate result on the value of <col_id> or None if
+				 the column has no value (e.g. exception column of a row
+				 without exception)
+		"""
+		predicate, stats = filter_item["predicate"], filter_item["stats"]
+
+		# null, exception or not compressed
+		if col_id in values:
+			attr = values[col_id]
+			if attr == self.null_value:
+				if is_exception:
+					return None
+				stats["null_count"] += 1
+				return False
+			stats["exception_count"] += 1
+			return predicate.evaluate(attr)
+
+		# compressed exception
+		ex_col_id = self.compressed_exception_columns.get(col_id)
+		if ex_col_id in self.present_exceptions:
+			res = self.evaluate_column(filter_item, ex_col_id, values, is_exception=True)
+			if res is None:
+				raise Exception("error: exception value not filled: col_id={}, ex_col_id={}".format(col_id, ex_col_id))
+			return res
+
+		for (node, predicate_f) in filter_item["nodes"][col_id]:
+			in_attrs = self.get_in_attrs(node["expr_n"], values)
+			if in_attrs is None:
+				continue
+			if predicate_f is None:
+				try:
+					out_attrs = node["operator"](in_attrs)
+				except OperatorException as e:
+					continue
+				self.fill_values(node["expr_n"], out_attrs, values)
+				if is_exception and values[col_id] == self.null_value:
+					return None
+				stats["decompressed_count"] += 1
+				return predicate.evaluate(values[col_id])
+			try:
+				res = predicate_f(in_attrs)
+			except OperatorException as e:
+				continue
+			stats["compressed_count"] += 1
+			return res
+
+		return None
+
+	def evaluate(self, filter_item, values):
+		res = self.evaluate_column(filter_item, filter_item["col_id"], values)
+		if res is None:
+			raise Exception("error: value not filled: col_id={}".format(filter_item["col_id"]))
+		return res
+
+	def match(self, in_tpl, null_mask):
+		"""
+		Returns: True if the compressed tuple matches all the predicates
+		"""
+		values = dict()
+		for col_id in self.plan.in_columns:
+			values[col_id] = in_tpl[self.context.in_column_positions[col_id]]
+		for ex_col_id, col_id in self.plan.exception_columns.items():
+			attr = in_tpl[self.context.in_column_positions[ex_col_id]]
+			if attr != self.null_value:
+				values[col_id] = attr
+		for col_id in self.plan.null_columns:
+			if null_mask[self.context.null_mask_positions[col_id]]:
+				values[col_id] = self.null_value
+		self.present_exceptions = {ex_col_id for ex_col_id, positions in self.presence_positions.items()
+								   if any(in_tpl[pos] != self.null_value for pos in positions)}
+
+		for filter_item in self.filter_items:
+			filter_item["stats"]["evaluated_count"] += 1
+			if not self.evaluate(filter_item, values):
+				return False
+			filter_item["stats"]["matched_count"] += 1
+		self.total_matched_count += 1
+		return True
+
+	def match_original(self, tpl):
+		"""
+		Returns: True if the original tuple (e.g. validation tuple) matches all the predicates
+		"""
+		for filter_item in self.filter_items:
+			attr = tpl[self.context.null_mask_positions[filter_item["col_id"]]]
+			if attr == self.null_value or not filter_item["predicate"].evaluate(attr):
+				return False
+		return True
+
+	def get_stats(self):
+		"""
+		Returns: stats with one item for each predicate, where:
+			evaluated_count: number of rows the predicate was evaluated on
+			matched_count: number of rows matching the predicate
+			null_count: number of null values
+			exception_count: number of values read from the exception (or uncompressed) column
+			compressed_count: number of values evaluated on the compressed attrs
+			decompressed_count: number of values decompressed for evaluation
+		"""
+		return {
+			"total_matched_count": self.total_matched_count,
+			"predicates": [dict(predicate=repr(item["predicate"]), col_id=item["col_id"], **item["stats"]) for item in self.filter_items]
+		}
+
+
+class ColumnarDriver(object):
+	"""
+	Reads the input tuples from the compressed column files (see
+	apply_expression.py --compressed-columns) instead of the compressed csv
+	file: only the column files of the decompression plan are opened
+
+	NOTE: nextTuple() returns the tuple already split; the positions of the
+		  columns that are not read are None
+	"""
+
+	def __init__(self, columns_dir, context, null_value, row_start=0):
+		# NOTE: column_codecs needs numpy; import it only when used
+		from pattern_detection.lib.column_codecs import iter_column_file, CompressedColumnsWriter
+
+		read_columns = context.plan.get_read_columns()
+		if len(read_columns) == 0:
+			raise Exception("No compressed columns to read in: {}".format(columns_dir))
+		self.tpl_size = context.in_maxsplit + 1
+		self.iterators = []
+		for col_id in read_columns:
+			column_file = CompressedColumnsWriter.get_column_file(columns_dir, col_id)
+			self.iterators.append((context.in_column_positions[col_id], iter_column_file(column_file, null_value, row_start)))
+
+	def nextTuple(self):
+		tpl = [None] * self.tpl_size
+		try:
+			for (pos, it) in self.iterators:
+				tpl[pos] = next(it)
+		except StopIteration:
+			return None
+		return tpl
+
 
 def parse_args():
 	parser = argparse.ArgumentParser(
@@ -98,10 +644,21 @@ def parse_args():
 		required=True)
 	parser.add_argument('--validation-file', dest='validation_file', type=str,
 		help="Original uncompressed file to check (de)compression correctness")
+	parser.add_argument('--columns-dir', dest='columns_dir', type=str,
+		help="Read the compressed columns from their column files in <columns-dir> (see apply_expression.py --compressed-columns) instead of FILE; only the columns needed for --columns are read")
+	parser.add_argument("--columns", dest="columns", type=str,
+		help="Comma separated names of the columns (of <out-header-file>) to decompress, in this order (default: all)")
+	parser.add_argument("--where", dest="where", type=parse_where, action="append",
+		help="Only decompress the rows matching the predicate (see lib/predicates.py), e.g. \"city = 'Berlin'\", \"price >= 100\", \"code LIKE 'AB%%'\"; evaluated on the compressed columns; can be given multiple times (AND)")
+	parser.add_argument("--rows", dest="rows", type=parse_rows,
+		help="Row range <start>:<end> to decompress (end exclusive; default: all)", default=(0, None))
+	parser.add_argument('--row-index-file', dest='row_index_file', type=str,
+		help="Row-offset index of FILE, used to seek to the start of --rows (default: <FILE without extension>.row_index.bin, if present)")
 	parser.add_argument("-F", "--fdelim", dest="fdelim",
 		help="Use <fdelim> as delimiter between fields", default="|")
 	parser.add_argument("--null", dest="null", type=str,
 		help="Interprets <NULL> as NULLs", default="null")
+	add_instrumentation_arguments(parser)
 
 	return parser.parse_args()
 
@@ -136,9 +693,8 @@ def decompress(in_tpl, null_mask, context):
 			# print("[exceptions] col_id={}".format(col_id))
 
 	# null values
-	for col_id in context.out_columns:
-		out_col_pos = context.out_column_positions[col_id]
-		if null_mask[out_col_pos]:
+	for col_id in context.null_columns:
+		if null_mask[context.null_mask_positions[col_id]]:
 			# debug
 			# if col_id == "19":
 			# 	print("null_values")
@@ -149,7 +705,18 @@ def decompress(in_tpl, null_mask, context):
 
 	# apply operators in topological order
 	for expr_n in context.decompression_nodes:
-		node_id, expr_n, operator = expr_n["node_id"], expr_n["expr_n"], expr_n["operator"]
+		node_id, expr_n, operator, expr_n_exception_columns, expr_n_stats = expr_n["node_id"], expr_n["expr_n"], expr_n["operator"], expr_n["exception_columns"], expr_n["stats"]
+
+		# compressed exceptions of the output columns (already decompressed; see DecompressionPlan.get_node_order())
+		for ex_col_id, col_id, presence_positions in expr_n_exception_columns:
+			if col_id in values:
+				continue
+			if all(in_tpl[pos] == context.null_value for pos in presence_positions):
+				continue
+			attr = values.get(ex_col_id, context.null_value)
+			if attr == context.null_value:
+				raise Exception("error: exception value not filled: col_id={}, ex_col_id={}".format(col_id, ex_col_id))
+			values[col_id] = attr
 
 		# fill in in_attrs
 		in_attrs = []
@@ -173,18 +740,22 @@ def decompress(in_tpl, null_mask, context):
 		# end-debug
 
 		if abort:
+			expr_n_stats["aborted_count"] += 1
 			continue
 
 		# apply operator
+		expr_n_stats["attempted_count"] += 1
 		try:
 			out_attrs = operator(in_attrs)
 		except OperatorException as e:
+			expr_n_stats["failed_count"] += 1
 			# debug
 			# if "19" in {c.col_id for c in expr_n.cols_out}:
 			# 	print("OperatorException:", e)
 			# end-debug
 			# expr_n was not used in the compression
 			continue
+		expr_n_stats["matched_count"] += 1
 
 		# fill in values with out_attrs
 		for out_col_idx, out_col in enumerate(expr_n.cols_out):
@@ -217,6 +788,61 @@ def decompress(in_tpl, null_mask, context):
 	return out_tpl
 
 
+def parse_where(predicate_s):
+	try:
+		return parse_predicate(predicate_s)
+	except Exception as e:
+		raise argparse.ArgumentTypeError(str(e))
+
+
+def seek_rows(fd_in, fd_nulls, row_start, row_index=None):
+	"""
+	Positions fd_in & fd_nulls at row <row_start>: seeks to the closest
+	indexed row (see lib/row_index.py), then skips the rows until row_start
+
+	NOTE: without a row index (or for non-seekable inputs, e.g. stdin), all
+		  the rows before row_start are skipped
+	NOTE: fd_in is None when the input is read from the column files (see
+		  ColumnarDriver); only fd_nulls is positioned
+	"""
+	row = 0
+	if row_index is not None and (fd_in is None or fd_in.seekable()) and fd_nulls.seekable():
+		(row, data_offset, nulls_offset) = row_index.seek(row_start)
+		if fd_in is not None:
+			fd_in.seek(data_offset)
+		fd_nulls.seek(nulls_offset)
+	while row < row_start:
+		if fd_in is not None and not fd_in.readline():
+			break
+		if not fd_nulls.readline():
+			break
+		row += 1
+
+
+def decompress_rows(context, fd_in, fd_nulls, fdelim, row_start=0, row_end=None, row_index=None, row_filter=None):
+	"""
+	Decompression API: decompresses the rows [row_start, row_end) of the
+	compressed data (fd_in) & null mask (fd_nulls) files
+
+	Returns: iterator over the decompressed tuples; the columns are the
+			 projection of <context> (see DecompressionContext); with
+			 <row_filter> (see RowFilter), only the matching rows
+	"""
+	seek_rows(fd_in, fd_nulls, row_start, row_index)
+	driver_in, driver_nulls = FileDriver(fd_in), FileDriver(fd_nulls)
+	row = row_start
+	while row_end is None or row < row_end:
+		in_line = driver_in.nextTuple()
+		if in_line is None:
+			break
+		in_tpl = in_line.split(fdelim, context.in_maxsplit)
+		null_mask = [True if v == "1" else False for v in driver_nulls.nextTuple().split(fdelim, context.nulls_maxsplit)]
+		row += 1
+		if row_filter is not None and not row_filter.match(in_tpl, null_mask):
+			continue
+		yield decompress(in_tpl, null_mask, context)
+
+
 def validate(out_tpl, valid_tpl):
 	if len(out_tpl) != len(valid_tpl):
 		raise ValidationException("Tuple length mismatch",
@@ -235,25 +861,41 @@ def validate(out_tpl, valid_tpl):
 
 
 def driver_loop(driver_in, driver_nulls, fdelim, fd_out,
-				decompression_context):
+				decompression_context, row_count=None, columnar=False, row_filter=None):
+	"""
+	NOTE: decompresses at most <row_count> rows (None: until the end of the input)
+	NOTE: columnar: driver_in is a ColumnarDriver (tuples are already split)
+	NOTE: row_filter: only the matching rows are decompressed (see RowFilter);
+		  row_count still counts all the rows read
+	"""
 	global total_tuple_count
 	total_tuple_count = 0
 
-	while True:
-		in_line = driver.nextTuple()
+	next_in_tuple = instrumentation.instrument("io.read", driver_in.nextTuple)
+	next_nulls_tuple = instrumentation.instrument("io.read_nulls", driver_nulls.nextTuple)
+	decompress_f = instrumentation.instrument("decompress", decompress)
+	write_out = instrumentation.instrument("io.write", fd_out.write)
+	if row_filter is not None:
+		match_f = instrumentation.instrument("filter", row_filter.match)
+
+	while row_count is None or total_tuple_count < row_count:
+		in_line = next_in_tuple()
 		if in_line is None:
 			break
 		total_tuple_count += 1
 
-		in_tpl = in_line.split(fdelim)
+		in_tpl = in_line if columnar else in_line.split(fdelim, decompression_context.in_maxsplit)
 
-		nulls_line = driver_nulls.nextTuple()
-		null_mask = [True if v == "1" else False for v in nulls_line.split(fdelim)]
+		nulls_line = next_nulls_tuple()
+		null_mask = [True if v == "1" else False for v in nulls_line.split(fdelim, decompression_context.nulls_maxsplit)]
+
+		if row_filter is not None and not match_f(in_tpl, null_mask):
+			continue
 
-		out_tpl = decompress(in_tpl, null_mask, decompression_context)
+		out_tpl = decompress_f(in_tpl, null_mask, decompression_context)
 
 		line_new = fdelim.join(out_tpl)
-		fd_out.write(line_new + "\n")
+		write_out(line_new + "\n")
 
 		# debug: print progress
 		if total_tuple_count % 100000 == 0:
@@ -262,13 +904,22 @@ def driver_loop(driver_in, driver_nulls, fdelim, fd_out,
 
 
 def driver_loop_valid(driver_in, driver_nulls, driver_valid, fdelim, fd_out,
-					  decompression_context):
+					  decompression_context, row_count=None, columnar=False, row_filter=None):
 	global total_tuple_count
 	total_tuple_count = 0
 
-	while True:
-		in_line = driver_in.nextTuple()
-		valid_line = driver_valid.nextTuple()
+	next_in_tuple = instrumentation.instrument("io.read", driver_in.nextTuple)
+	next_valid_tuple = instrumentation.instrument("io.read_validation", driver_valid.nextTuple)
+	next_nulls_tuple = instrumentation.instrument("io.read_nulls", driver_nulls.nextTuple)
+	decompress_f = instrumentation.instrument("decompress", decompress)
+	validate_f = instrumentation.instrument("validate", validate)
+	write_out = instrumentation.instrument("io.write", fd_out.write)
+	if row_filter is not None:
+		match_f = instrumentation.instrument("filter", row_filter.match)
+
+	while row_count is None or total_tuple_count < row_count:
+		in_line = next_in_tuple()
+		valid_line = next_valid_tuple()
 		if in_line is None and valid_line is None:
 			break
 		if not (in_line is not None and valid_line is not None):
@@ -276,16 +927,26 @@ def driver_loop_valid(driver_in, driver_nulls, driver_valid, fdelim, fd_out,
 			break
 		total_tuple_count += 1
 
-		in_tpl = in_line.split(fdelim)
+		in_tpl = in_line if columnar else in_line.split(fdelim, decompression_context.in_maxsplit)
 		valid_tpl = valid_line.split(fdelim)
 
-		nulls_line = driver_nulls.nextTuple()
-		null_mask = [True if v == "1" else False for v in nulls_line.split(fdelim)]
+		nulls_line = next_nulls_tuple()
+		null_mask = [True if v == "1" else False for v in nulls_line.split(fdelim, decompression_context.nulls_maxsplit)]
+
+		# check the filter result against the original tuple
+		if row_filter is not None:
+			matched = match_f(in_tpl, null_mask)
+			if matched != row_filter.match_original(valid_tpl):
+				print("error: filter mismatch: total_tuple_count={}, matched={}".format(total_tuple_count, matched))
+				sys.exit(1)
+			if not matched:
+				continue
+		valid_tpl = decompression_context.project(valid_tpl)
 
-		out_tpl = decompress(in_tpl, null_mask, decompression_context)
+		out_tpl = decompress_f(in_tpl, null_mask, decompression_context)
 
 		try:
-			validate(out_tpl, valid_tpl)
+			validate_f(out_tpl, valid_tpl)
 		except ValidationException as e:
 			print("error:", e)
 			# debug: debug-values
@@ -296,7 +957,7 @@ def driver_loop_valid(driver_in, driver_nulls, driver_valid, fdelim, fd_out,
 			# end-debug: debug-values
 
 		line_new = fdelim.join(out_tpl)
-		fd_out.write(line_new + "\n")
+		write_out(line_new + "\n")
 
 		# debug: print progress
 		if total_tuple_count % 100000 == 0:
@@ -307,6 +968,7 @@ def driver_loop_valid(driver_in, driver_nulls, driver_valid, fdelim, fd_out,
 def main():
 	args = parse_args()
 	print(args)
+	instrumentation.enable_from_args(args)
 
 	# load headers
 	with open(args.in_header_file, 'r') as fd:
@@ -321,31 +983,68 @@ def main():
 		return
 
 	# build decompression context
-	decompression_context = DecompressionContext(decompression_tree, input_header, output_header, args.null)
+	projection = args.columns.split(",") if args.columns is not None else None
+	filter_columns = [predicate.col_name for predicate in args.where] if args.where is not None else None
+	decompression_context = DecompressionContext(decompression_tree, input_header, output_header, args.null, projection, filter_columns)
+	row_filter = RowFilter(decompression_context, args.where) if args.where is not None else None
+	columnar = args.columns_dir is not None
+
+	# row range
+	(row_start, row_end) = args.rows
+	row_count = row_end - row_start if row_end is not None else None
+	row_index = None
+	row_index_file = args.row_index_file
+	if row_index_file is None and args.file is not None and not columnar:
+		row_index_file = "{}.row_index.bin".format(os.path.splitext(args.file)[0])
+		if not os.path.exists(row_index_file):
+			row_index_file = None
+	if row_index_file is not None and row_start > 0:
+		row_index = RowIndex.read(row_index_file)
 
 	# apply decompression tree and generate the decompressed csv file
+	fd_in = None
 	try:
-		if args.file is None:
-			fd_in = os.fdopen(os.dup(sys.stdin.fileno()))
+		if columnar:
+			with instrumentation.timer("io.open_columns"):
+				driver_in = ColumnarDriver(args.columns_dir, decompression_context, args.null, row_start)
 		else:
-			fd_in = open(args.file, 'r')
-		driver_in = FileDriver(fd_in)
+			if args.file is None:
+				fd_in = os.fdopen(os.dup(sys.stdin.fileno()))
+			else:
+				fd_in = open(args.file, 'r')
+			driver_in = FileDriver(fd_in)
 		with open(args.output_file, 'w') as fd_out, open(args.nulls_file, 'r') as fd_nulls:
 			driver_nulls = FileDriver(fd_nulls)
-			if args.validation_file is None:
-				driver_loop(driver_in, driver_nulls, args.fdelim, fd_out,
-							decompression_context)
-			else:
-				with open(args.validation_file, 'r') as fd_valid:
-					driver_valid = FileDriver(fd_valid)
-					driver_loop_valid(driver_in, driver_nulls, driver_valid, args.fdelim, fd_out,
-									  decompression_context)
+			with instrumentation.timer("io.seek_rows"):
+				seek_rows(fd_in, fd_nulls, row_start, row_index)
+			with instrumentation.timer("stage.driver_loop"):
+				if args.validation_file is None:
+					driver_loop(driver_in, driver_nulls, args.fdelim, fd_out,
+								decompression_context, row_count, columnar, row_filter)
+				else:
+					with open(args.validation_file, 'r') as fd_valid:
+						for _ in range(row_start):
+							fd_valid.readline()
+						driver_valid = FileDriver(fd_valid)
+						driver_loop_valid(driver_in, driver_nulls, driver_valid, args.fdelim, fd_out,
+										  decompression_context, row_count, columnar, row_filter)
 	finally:
 		try:
 			fd_in.close()
 		except:
 			pass
 
+	# write stats
+	stats_file = "{}.stats.json".format(os.path.splitext(args.output_file)[0])
+	stats = decompression_context.get_stats(total_tuple_count)
+	if row_filter is not None:
+		stats["filter"] = row_filter.get_stats()
+		print("[filter] total_tuple_count={}, matched_tuple_count={}".format(total_tuple_count, row_filter.total_matched_count))
+	with open(stats_file, 'w') as fd:
+		json.dump(stats, fd, indent=2)
+
+	instrumentation.dump_report("{}.instrumentation.json".format(os.path.splitext(args.output_file)[0]))
+
 
 if __name__ == "__main__":
 	main()
@@ -371,7 +1070,7 @@ table=Generico_2
 ================================================================================
 in_header_file=$wbs_dir/$wb/$table.poc_1_out/${table}_out.header.csv
 out_header_file=$repo_wbs_dir/$wb/samples/$table.header-renamed.csv
-expr_tree_file=$wbs_dir/$wb/$table.expr_tree/dec_tree.json
+expr_tree_file=$wbs_dir/$wb/$table.expr_tree/dec_tree.bin
 output_file=$wbs_dir/$wb/$table.poc_1_out/$table.decompressed.csv
 validation_file=$wbs_dir/$wb/$table.csv
 input_file=$wbs_dir/$wb/$table.poc_1_out/${table}_out.csv
@@ -381,4 +1080,25 @@ time ./decompression/main.py --in-header-file $in_header_file --nulls-file $null
 --output-file $output_file --out-header-file $out_header_file \
 --validation-file $validation_file \
 $input_file
+
+# [random access]
+# only the sub-DAG needed for the projected columns is applied; --rows seeks through $input_file.row_index.bin
+time ./decompression/main.py --in-header-file $in_header_file --nulls-file $nulls_file --expr-tree-file $expr_tree_file \
+--output-file $output_file --out-header-file $out_header_file \
+--columns col_1,col_5 --rows 1000000:1010000 \
+$input_file
+
+# [columnar input]
+# apply_expression.py --compressed-columns; only the column files needed for --columns are read
+columns_dir=$wbs_dir/$wb/$table.poc_1_out/${table}_out.columns
+time ./decompression/main.py --in-header-file $in_header_file --nulls-file $nulls_file --expr-tree-file $expr_tree_file \
+--output-file $output_file --out-header-file $out_header_file \
+--columns-dir $columns_dir --columns col_1,col_5
+
+# [filter]
+# predicates are evaluated on the compressed columns; only the matching rows are decompressed
+time ./decompression/main.py --in-header-file $in_header_file --nulls-file $nulls_file --expr-tree-file $expr_tree_file \
+--output-file $output_file --out-header-file $out_header_file \
+--where "col_1 = 'value'" --where "col_5 >= 100" --columns col_1,col_2,col_5 \
+$input_file
 """
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import json
+import time
+from lib.util import *
+from pattern_detection.lib.column_codecs import *
+
+
+"""
+Decode-throughput benchmark for the column files written by
+apply_expression.py --compressed-columns; optionally checks that the decoded
+columns match the csv output of apply_expression.py
+"""
+
+
+def benchmark_column(col_file, null_value, repeat):
+	"""
+	Returns: (attrs, results) where attrs are the decoded attrs of the column
+	"""
+	size_B = os.path.getsize(col_file)
+	durations = []
+	for r in range(repeat):
+		start = time.perf_counter()
+		attrs = read_column_file(col_file, null_value)
+		durations.append(time.perf_counter() - start)
+
+	duration = min(durations)
+	res = {
+		"row_count": len(attrs),
+		"size_B": size_B,
+		"size_human_readable": sizeof_fmt(size_B),
+		"decode_s": duration,
+		"rows_per_s": len(attrs) / duration if duration > 0 else None,
+		"MiB_per_s": size_B / (1024 * 1024) / duration if duration > 0 else None
+	}
+	return (attrs, res)
+
+
+def validate_columns(columns_attrs, csv_file, fdelim):
+	with open(csv_file, 'r') as fd:
+		driver = FileDriver(fd)
+		row_idx = 0
+		while True:
+			line = driver.nextTuple()
+			if line is None:
+				break
+			tpl = line.split(fdelim)
+			for col_idx, attrs in enumerate(columns_attrs):
+				if attrs[row_idx] != tpl[col_idx]:
+					raise Exception("Validation failed: row={}, col_idx={}, expected={}, decoded={}".format(row_idx, col_idx, tpl[col_idx], attrs[row_idx]))
+			row_idx += 1
+	for attrs in columns_attrs:
+		if len(attrs) != row_idx:
+			raise Exception("Validation failed: expected {} rows, decoded {}".format(row_idx, len(attrs)))
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description="""Benchmark decoding of compressed column files."""
+	)
+
+	parser.add_argument('--output-dir', dest='output_dir', type=str,
+		help="Output dir of apply_expression.py", required=True)
+	parser.add_argument('--out-table-name', dest='out_table_name', type=str,
+		help="Name of the output table of apply_expression.py", required=True)
+	parser.add_argument('--repeat', dest='repeat', type=int,
+		help="Decode each column <repeat> times and keep the fastest run", default=3)
+	parser.add_argument('--validate', dest='validate', action='store_true',
+		help="Check the decoded columns against <output-dir>/<out-table-name>.csv")
+	parser.add_argument('--output-file', dest='output_file', type=str,
+		help="JSON file to write the results to (default: stdout)", default=None)
+	parser.add_argument("-F", "--fdelim", dest="fdelim",
+		help="Use <fdelim> as delimiter between fields", default="|")
+	parser.add_argument("--null", dest="null", type=str,
+		help="Interprets <NULL> as NULLs", default="null")
+
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+
+	stats_file = os.path.join(args.output_dir, "{}.stats.json".format(args.out_table_name))
+	with open(stats_file, 'r') as fd:
+		stats = json.load(fd)
+	if "compressed_columns" not in stats:
+		raise Exception("No compressed columns; run apply_expression.py with --compressed-columns")
+	columns_dir = os.path.join(args.output_dir, "{}.columns".format(args.out_table_name))
+
+	res_columns, columns_attrs = {}, []
+	total_rows, total_size_B, total_duration = 0, 0, 0
+	# NOTE: compressed_columns is in the order of the output columns
+	for col_id, col_stats in stats["compressed_columns"].items():
+		col_file = CompressedColumnsWriter.get_column_file(columns_dir, col_id)
+		(attrs, col_res) = benchmark_column(col_file, args.null, args.repeat)
+		col_res["codecs"] = col_stats["codecs"]
+		res_columns[col_id] = col_res
+		total_rows += col_res["row_count"]
+		total_size_B += col_res["size_B"]
+		total_duration += col_res["decode_s"]
+		if args.validate:
+			columns_attrs.append(attrs)
+
+	if args.validate:
+		output_file = os.path.join(args.output_dir, "{}.csv".format(args.out_table_name))
+		validate_columns(columns_attrs, output_file, args.fdelim)
+
+	res = {
+		"columns": res_columns,
+		"table": {
+			"size_B": total_size_B,
+			"size_human_readable": sizeof_fmt(total_size_B),
+			"decode_s": total_duration,
+			"values_per_s": total_rows / total_duration if total_duration > 0 else None,
+			"MiB_per_s": total_size_B / (1024 * 1024) / total_duration if total_duration > 0 else None,
+			"validated": args.validate
+		}
+	}
+
+	if args.output_file is None:
+		print(json.dumps(res, indent=2))
+	else:
+		with open(args.output_file, 'w') as f:
+			json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import json
+import time
+import numpy as np
+from lib.util import *
+import theoretical_evaluation
+
+
+"""
+Micro-benchmark for the integer estimators: generates synthetic integer
+columns and reports, for each estimator, the estimated size and the
+throughput (rows/s) of the train + test passes
+"""
+
+
+def gen_sequential_ids(nb_rows, rng):
+	return np.arange(1, nb_rows + 1, dtype=np.int64)
+
+
+def gen_timestamps(nb_rows, rng):
+	# one event per second, with a few seconds of jitter
+	base = 1546300800
+	jitter = rng.integers(-3, 4, size=nb_rows)
+	return base + np.arange(nb_rows, dtype=np.int64) + jitter
+
+
+def gen_small_random(nb_rows, rng):
+	return rng.integers(0, 100, size=nb_rows, dtype=np.int64)
+
+
+def gen_sorted_with_outliers(nb_rows, rng):
+	values = np.sort(rng.integers(0, 1000000, size=nb_rows, dtype=np.int64))
+	outliers = rng.random(nb_rows) < 0.01
+	values[outliers] = rng.integers(1 << 40, 1 << 41, size=int(outliers.sum()), dtype=np.int64)
+	return values
+
+
+generators = {
+	"sequential_ids": gen_sequential_ids,
+	"timestamps": gen_timestamps,
+	"small_random": gen_small_random,
+	"sorted_with_outliers": gen_sorted_with_outliers
+}
+
+
+def gen_columns(nb_rows, seed):
+	rng = np.random.default_rng(seed)
+	columns, data = [], []
+	for col_idx, (col_name, gen_f) in enumerate(generators.items()):
+		columns.append(Column(str(col_idx), col_name, DataType(name="bigint")))
+		data.append([str(v) for v in gen_f(nb_rows, rng)])
+	return (columns, data)
+
+
+def benchmark(columns, data, nb_rows, null_value):
+	"""
+	Returns:
+		results: dict(col_name, dict(estimator_name, dict(size_B, rows_per_s)))
+	"""
+	res = {col.name: {} for col in columns}
+	durations = {}
+
+	def timed_evaluate(estimator):
+		start = time.perf_counter()
+		estimator.feed_columns(data, nb_rows)
+		estimator_res = estimator.evaluate()
+		durations[estimator.name] = durations.get(estimator.name, 0) + time.perf_counter() - start
+		return estimator_res
+
+	estimator_train_list = theoretical_evaluation.init_estimators_train(columns, null_value)
+	metadata = {estimator.name: timed_evaluate(estimator) for estimator in estimator_train_list}
+
+	estimator_test_list = theoretical_evaluation.init_estimators_test(columns, metadata, null_value)
+	for estimator in estimator_test_list:
+		sizes = timed_evaluate(estimator)
+		# NOTE: rows of all the columns handled by the estimator
+		nb_values = nb_rows * len(sizes)
+		duration = durations[estimator.name]
+
+		for col in columns:
+			if col.col_id not in sizes:
+				continue
+			(values_size, metadata_size, exceptions_size, null_size) = sizes[col.col_id]
+			size_B = values_size + metadata_size + exceptions_size + null_size
+			res[col.name][estimator.name] = {
+				"size_B": size_B,
+				"size_human_readable": sizeof_fmt(size_B),
+				"rows_per_s": nb_values / duration if duration > 0 else None
+			}
+
+	return res
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description="""Benchmark the integer estimators on synthetic columns."""
+	)
+
+	parser.add_argument('--nb-rows', dest='nb_rows', type=int,
+		help="Number of rows of each synthetic column", default=1000000)
+	parser.add_argument('--seed', dest='seed', type=int,
+		help="Seed of the random number generator", default=0)
+	parser.add_argument('--output-file', dest='output_file', type=str,
+		help="JSON file to write the results to (default: stdout)", default=None)
+	parser.add_argument("--null", dest="null", type=str,
+		help="Interprets <NULL> as NULLs", default="null")
+
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+
+	(columns, data) = gen_columns(args.nb_rows, args.seed)
+	res = {
+		"nb_rows": args.nb_rows,
+		"columns": benchmark(columns, data, args.nb_rows, args.null)
+	}
+
+	if args.output_file is None:
+		print(json.dumps(res, indent=2))
+	else:
+		with open(args.output_file, 'w') as f:
+			json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import json
+import re
+import time
+import subprocess
+from statistics import median
+
+
+"""
+Startup-time benchmark for the CLI entry points: each entry point is run with
+--help (imports all its modules, parses the arguments and exits) and the wall
+time of the whole process is measured; the slowest imports are taken from
+python -X importtime
+"""
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = [
+	"pattern_detection/main.py",
+	"pattern_detection/apply_expression.py",
+	"pattern_detection/render.py",
+	"pattern_detection/row_groups.py",
+	"decompression/main.py",
+	"evaluation/main-theoretical.py",
+	"evaluation/compare_stats.py"
+]
+IMPORTTIME_REGEX = re.compile(r'^import time:\s*(\d+) \|\s*(\d+) \|(\s*)(\S+)$')
+
+
+def run_entry_point(entry_point, extra_args=[]):
+	"""
+	Returns: (duration_s, stderr)
+	"""
+	cmd = [sys.executable] + extra_args + [os.path.join(REPO_DIR, entry_point), "--help"]
+	start = time.perf_counter()
+	p = subprocess.run(cmd, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+	duration = time.perf_counter() - start
+	if p.returncode != 0:
+		raise Exception("Entry point failed: {}\n{}".format(entry_point, p.stderr))
+	return (duration, p.stderr)
+
+
+def get_top_imports(entry_point, top):
+	"""
+	Returns: list of the <top> imports with the highest cumulative time (only
+			 the first import level under the entry point)
+	"""
+	(_, stderr) = run_entry_point(entry_point, ["-X", "importtime"])
+	imports = []
+	for line in stderr.splitlines():
+		m = IMPORTTIME_REGEX.match(line)
+		if m is None:
+			continue
+		(self_us, cumulative_us, indent, module) = m.groups()
+		imports.append({"module": module, "depth": len(indent) // 2, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+	imports = sorted(imports, key=lambda x: x["cumulative_ms"], reverse=True)
+	return imports[:top]
+
+
+def benchmark_entry_point(entry_point, repeat, top):
+	durations = [run_entry_point(entry_point)[0] for r in range(repeat)]
+	return {
+		"min_s": min(durations),
+		"median_s": median(durations),
+		"max_s": max(durations),
+		"top_imports": get_top_imports(entry_point, top) if top > 0 else []
+	}
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description="""Benchmark the startup time of the CLI entry points."""
+	)
+
+	parser.add_argument('entry_points', metavar='ENTRY_POINT', nargs='*',
+		help="Entry points relative to the repo dir (default: all)")
+	parser.add_argument('--repeat', dest='repeat', type=int,
+		help="Run each entry point <repeat> times", default=5)
+	parser.add_argument('--top-imports', dest='top_imports', type=int,
+		help="Report the <top-imports> slowest imports of each entry point; 0: disable", default=10)
+	parser.add_argument('--output-file', dest='output_file', type=str,
+		help="JSON file to write the results to (default: stdout)", default=None)
+
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+
+	entry_points = args.entry_points if len(args.entry_points) > 0 else ENTRY_POINTS
+	res = {
+		"python": sys.executable,
+		"baseline": benchmark_entry_point("evaluation/benchmark_startup.py", args.repeat, 0),
+		"entry_points": {}
+	}
+	for entry_point in entry_points:
+		res["entry_points"][entry_point] = benchmark_entry_point(entry_point, args.repeat, args.top_imports)
+
+	if args.output_file is None:
+		print(json.dumps(res, indent=2))
+	else:
+		with open(args.output_file, 'w') as f:
+			json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+	main()
+
+
+"""
+./evaluation/benchmark_startup.py --output-file startup.json
+"""
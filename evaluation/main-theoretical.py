@@ -5,6 +5,7 @@ import sys
 import argparse
 import json
 from lib.util import *
+from lib.instrumentation import instrumentation, add_instrumentation_arguments
 import theoretical_evaluation
 
 
@@ -80,6 +81,11 @@ def parse_args():
 		help="Interprets <NULL> as NULLs", default="null")
 	parser.add_argument('--no-compression', dest='no_compression', action='store_true',
 		help="Estimate uncompressed size")
+	parser.add_argument('--fused', dest='fused', action='store_true',
+		help="Parse each input file only once into an in-memory columnar cache (shared if train and test are the same file)")
+	parser.add_argument('--jobs', dest='jobs', type=int,
+		help="Number of worker processes to evaluate the columns with (implies --fused)", default=1)
+	add_instrumentation_arguments(parser)
 
 	return parser.parse_args()
 
@@ -87,16 +93,21 @@ def parse_args():
 def main():
 	args = parse_args()
 	print(args)
+	instrumentation.enable_from_args(args)
 
 	schema = parse_schema_file(args.schema_file)
 
 	stats = theoretical_evaluation.main(schema, args.train_file, args.test_file, args.full_file_linecount,
-										args.fdelim, args.null, args.no_compression)
+										args.fdelim, args.null, args.no_compression,
+										fused=args.fused, jobs=args.jobs)
 
 	agg_stats = aggregate_stats(schema, stats)
 
 	output_agg_stats(agg_stats, args.table_name, args.output_dir)
 
+	# NOTE: with --jobs > 1 the estimators run in the worker processes and are not part of the report
+	instrumentation.dump_report(os.path.join(args.output_dir, "{}.instrumentation.json".format(args.table_name)))
+
 
 if __name__ == "__main__":
 	main()
@@ -1,10 +1,13 @@
 import os
 import sys
+import multiprocessing
 from lib.util import *
+from lib.instrumentation import instrumentation
 from pattern_detection.patterns import *
 
 
 max_dict_size = 64 * 1024
+pfor_percentile = 0.9
 
 
 def init_columns(schema):
@@ -26,7 +29,11 @@ def init_estimators_train(columns, null_value, no_compression=False):
 			DictEstimatorTrain(columns, null_value,
 						  	   max_dict_size),
 			RleEstimatorTrain(columns, null_value),
-			ForEstimatorTrain(columns, null_value)
+			ForEstimatorTrain(columns, null_value),
+			PforEstimatorTrain(columns, null_value,
+							   pfor_percentile),
+			DeltaEstimatorTrain(columns, null_value),
+			DeltaForEstimatorTrain(columns, null_value)
 		]
 	return res
 
@@ -41,7 +48,10 @@ def init_estimators_test(columns, metadata, null_value, no_compression=False):
 			NoCompressionEstimatorTest(columns, metadata["NoCompressionEstimator"], null_value),
 			DictEstimatorTest(columns, metadata["DictEstimator"], null_value),
 			RleEstimatorTest(columns, metadata["RleEstimator"], null_value),
-			ForEstimatorTest(columns, metadata["ForEstimator"], null_value)
+			ForEstimatorTest(columns, metadata["ForEstimator"], null_value),
+			PforEstimatorTest(columns, metadata["PforEstimator"], null_value),
+			DeltaEstimatorTest(columns, metadata["DeltaEstimator"], null_value),
+			DeltaForEstimatorTest(columns, metadata["DeltaForEstimator"], null_value)
 		]
 	return res
 
@@ -49,16 +59,20 @@ def init_estimators_test(columns, metadata, null_value, no_compression=False):
 def driver_loop(driver, estimator_list, fdelim, null_value):
 	total_tuple_count = 0
 
+	next_tuple = instrumentation.instrument("io.read", driver.nextTuple)
+	feed_functions = [instrumentation.instrument("estimator.{}.feed_tuple".format(estimator.__class__.__name__), estimator.feed_tuple)
+					  for estimator in estimator_list]
+
 	while True:
-		line = driver.nextTuple()
+		line = next_tuple()
 		if line is None:
 			break
 		total_tuple_count += 1
 
 		tpl = line.split(fdelim)
 
-		for estimator in estimator_list:
-			estimator.feed_tuple(tpl)
+		for feed_f in feed_functions:
+			feed_f(tpl)
 
 		# debug: print progress
 		if total_tuple_count % 100000 == 0:
@@ -69,18 +83,85 @@ def driver_loop(driver, estimator_list, fdelim, null_value):
 	return total_tuple_count
 
 
+class ColumnarCache(object):
+	"""
+	Data of a CSV file, parsed once and stored column by column; used to feed
+	the train and the test estimators without reading and splitting the same
+	file multiple times
+	"""
+	def __init__(self, nb_columns):
+		self.columns = [[] for _ in range(nb_columns)]
+		self.row_count = 0
+
+	def read(self, driver, fdelim):
+		nb_columns = len(self.columns)
+
+		while True:
+			line = driver.nextTuple()
+			if line is None:
+				break
+			self.row_count += 1
+
+			tpl = line.split(fdelim)
+			if len(tpl) < nb_columns:
+				raise Exception("Invalid tuple: row={}, len(tpl)={}, nb_columns={}".format(self.row_count, len(tpl), nb_columns))
+
+			for idx in range(nb_columns):
+				self.columns[idx].append(tpl[idx])
+
+			# debug: print progress
+			if self.row_count % 100000 == 0:
+				print("[progress] row_count={}M".format(
+					float(self.row_count) / 1000000))
+			# end-debug
+
+		return self.row_count
+
+
+	def select(self, col_indices):
+		"""
+		Returns: ColumnarCache with only the given columns, in the given order;
+				 the column lists are shared, not copied
+		"""
+		res = ColumnarCache(0)
+		res.columns = [self.columns[idx] for idx in col_indices]
+		res.row_count = self.row_count
+		return res
+
+
+def read_columnar_cache(in_file, nb_columns, fdelim):
+	cache = ColumnarCache(nb_columns)
+	with open(in_file, 'r') as fd:
+		driver = FileDriver(fd)
+		cache.read(driver, fdelim)
+	return cache
+
+
+def columnar_loop(cache, estimator_list):
+	for estimator in estimator_list:
+		with instrumentation.timer("estimator.{}.feed_columns".format(estimator.__class__.__name__)):
+			estimator.feed_columns(cache.columns, cache.row_count)
+
+	return cache.row_count
+
+
 def estimator_train(columns, train_file, 
-					fdelim, null_value, no_compression):
+					fdelim, null_value, no_compression,
+					cache=None):
 
 	estimator_train_list = init_estimators_train(columns, null_value, no_compression)
 
-	with open(train_file, 'r') as fd:
-		driver = FileDriver(fd)
-		sample_tuple_count_train = driver_loop(driver, estimator_train_list, fdelim, null_value)
+	if cache is not None:
+		sample_tuple_count_train = columnar_loop(cache, estimator_train_list)
+	else:
+		with open(train_file, 'r') as fd:
+			driver = FileDriver(fd)
+			sample_tuple_count_train = driver_loop(driver, estimator_train_list, fdelim, null_value)
 
 	metadata = {}
 	for estimator in estimator_train_list:
-		res = estimator.evaluate()
+		with instrumentation.timer("estimator.{}.evaluate".format(estimator.__class__.__name__)):
+			res = estimator.evaluate()
 		metadata[estimator.name] = res
 
 	return metadata
@@ -88,18 +169,23 @@ def estimator_train(columns, train_file,
 
 def estimator_test(columns, test_file, 
 				   fdelim, null_value, no_compression, 
-				   full_file_linecount, metadata):
+				   full_file_linecount, metadata,
+				   cache=None):
 	estimator_test_list = init_estimators_test(columns, metadata, null_value, no_compression)
 
-	with open(test_file, 'r') as fd:
-		driver = FileDriver(fd)
-		sample_tuple_count_test = driver_loop(driver, estimator_test_list, fdelim, null_value)
+	if cache is not None:
+		sample_tuple_count_test = columnar_loop(cache, estimator_test_list)
+	else:
+		with open(test_file, 'r') as fd:
+			driver = FileDriver(fd)
+			sample_tuple_count_test = driver_loop(driver, estimator_test_list, fdelim, null_value)
 
 	sample_ratio = float(full_file_linecount) / sample_tuple_count_test
 
 	stats = {col.col_id: {} for col in columns}
 	for estimator in estimator_test_list:
-		res = estimator.evaluate()
+		with instrumentation.timer("estimator.{}.evaluate".format(estimator.__class__.__name__)):
+			res = estimator.evaluate()
 		for col_id, (values_size, metadata_size, exceptions_size, null_size) in res.items():
 			# debug
 			# print("[col_id={}][{}] values_size={}, metadata_size={}, exceptions_size={}, null_size={}".format(
@@ -120,8 +206,75 @@ def estimator_test(columns, test_file,
 	return stats
 
 
-def main(schema, train_file, test_file, full_file_linecount, fdelim, null_value, no_compression=False):
+"""
+NOTE: the worker processes are forked after the caches are populated; they
+	  inherit this context (copy-on-write) instead of parsing the files again
+"""
+worker_context = None
+
+
+def partition_columns(nb_columns, nb_partitions):
+	# round-robin, to spread wide (e.g. varchar) and narrow columns evenly
+	partitions = [list(range(p, nb_columns, nb_partitions)) for p in range(nb_partitions)]
+	return [p for p in partitions if len(p) > 0]
+
+
+def evaluate_partition(col_indices):
+	columns, train_cache, test_cache = worker_context["columns"], worker_context["train_cache"], worker_context["test_cache"]
+	fdelim, null_value = worker_context["fdelim"], worker_context["null_value"]
+	no_compression, full_file_linecount = worker_context["no_compression"], worker_context["full_file_linecount"]
+
+	p_columns = [columns[idx] for idx in col_indices]
+	p_train_cache, p_test_cache = train_cache.select(col_indices), test_cache.select(col_indices)
+
+	metadata = estimator_train(p_columns, None,
+							   fdelim, null_value, no_compression,
+							   cache=p_train_cache)
+	stats = estimator_test(p_columns, None,
+						   fdelim, null_value, no_compression,
+						   full_file_linecount, metadata,
+						   cache=p_test_cache)
+
+	return stats
+
+
+def evaluate_parallel(columns, train_cache, test_cache,
+					  fdelim, null_value, no_compression,
+					  full_file_linecount, jobs):
+	global worker_context
+	worker_context = {
+		"columns": columns,
+		"train_cache": train_cache,
+		"test_cache": test_cache,
+		"fdelim": fdelim,
+		"null_value": null_value,
+		"no_compression": no_compression,
+		"full_file_linecount": full_file_linecount
+	}
+
+	# NOTE: more partitions than jobs, for better load balancing
+	partitions = partition_columns(len(columns), jobs * 4)
+
+	stats = {}
+	try:
+		with multiprocessing.get_context("fork").Pool(processes=jobs) as pool:
+			for p_stats in pool.imap_unordered(evaluate_partition, partitions):
+				stats.update(p_stats)
+	finally:
+		worker_context = None
+
+	# keep the column order of the sequential evaluation
+	return {col.col_id: stats[col.col_id] for col in columns}
+
+
+def main(schema, train_file, test_file, full_file_linecount, fdelim, null_value, no_compression=False, fused=False, jobs=1):
 	"""
+	Params:
+		fused: parse each file only once into a ColumnarCache and feed the
+			   estimators from it; train_file and test_file share the same
+			   cache if they are the same file
+		jobs: number of worker processes; the columns are partitioned across
+			  the workers; jobs > 1 implies fused
 	Returns:
 		stats: dict(col_id, estimators) where:
 			col_id: # id of the column
@@ -134,11 +287,27 @@ def main(schema, train_file, test_file, full_file_linecount, fdelim, null_value,
 	"""
 
 	columns = init_columns(schema)
-	
+
+	train_cache, test_cache = None, None
+	if fused or jobs > 1:
+		with instrumentation.timer("io.read_columnar_cache"):
+			train_cache = read_columnar_cache(train_file, len(columns), fdelim)
+			if os.path.samefile(train_file, test_file):
+				test_cache = train_cache
+			else:
+				test_cache = read_columnar_cache(test_file, len(columns), fdelim)
+
+	if jobs > 1:
+		return evaluate_parallel(columns, train_cache, test_cache,
+								 fdelim, null_value, no_compression,
+								 full_file_linecount, jobs)
+
 	metadata = estimator_train(columns, train_file, 
-						   	   fdelim, null_value, no_compression)
+						   	   fdelim, null_value, no_compression,
+						   	   cache=train_cache)
 	stats = estimator_test(columns, test_file, 
 						   fdelim, null_value, no_compression, 
-						   full_file_linecount, metadata)
+						   full_file_linecount, metadata,
+						   cache=test_cache)
 
 	return stats
@@ -0,0 +1,231 @@
+import sys
+import os
+import json
+import time
+import signal
+import cProfile
+from collections import Counter
+
+
+"""
+Timers, counters and an optional profiler hook, shared by all entry points
+through the module level <instrumentation> object
+
+NOTE: disabled by default; when disabled, timer() returns a shared no-op
+	  context manager and instrument() returns the function unchanged, so hot
+	  paths pay nothing unless instrumentation is enabled
+NOTE: import it as lib.instrumentation (like lib.util), otherwise a second
+	  copy of the module (and of the <instrumentation> object) is created
+"""
+PROFILE_MODES = ["cprofile", "sampling"]
+
+
+class NoOpTimer(object):
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		return False
+
+NOOP_TIMER = NoOpTimer()
+
+
+class Timer(object):
+	def __init__(self, instr, name):
+		self.instr = instr
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		self.instr.add_time(self.name, time.perf_counter() - self.start)
+		return False
+
+
+class SamplingProfiler(object):
+	"""
+	Statistical profiler: samples the call stack every <interval> seconds of
+	CPU time (SIGPROF)
+	"""
+	def __init__(self, interval=0.005):
+		self.interval = interval
+		self.sample_count = 0
+		self.self_samples = Counter()
+		self.cumulative_samples = Counter()
+		self.prev_handler = None
+
+	@classmethod
+	def frame_key(cls, frame):
+		code = frame.f_code
+		return "{}:{}:{}".format(os.path.basename(code.co_filename), code.co_firstlineno, code.co_name)
+
+	def handler(self, signum, frame):
+		self.sample_count += 1
+		self.self_samples[self.frame_key(frame)] += 1
+		seen = set()
+		while frame is not None:
+			key = self.frame_key(frame)
+			# NOTE: count recursive functions once per sample
+			if key not in seen:
+				self.cumulative_samples[key] += 1
+				seen.add(key)
+			frame = frame.f_back
+
+	def start(self):
+		self.prev_handler = signal.signal(signal.SIGPROF, self.handler)
+		signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+	def stop(self):
+		signal.setitimer(signal.ITIMER_PROF, 0, 0)
+		signal.signal(signal.SIGPROF, self.prev_handler)
+
+	def get_report(self, top=50):
+		def to_list(samples):
+			return [{"function": key, "samples": count, "ratio": float(count) / self.sample_count}
+					for key, count in samples.most_common(top)]
+		return {
+			"interval_s": self.interval,
+			"sample_count": self.sample_count,
+			"self": to_list(self.self_samples),
+			"cumulative": to_list(self.cumulative_samples)
+		}
+
+
+class Instrumentation(object):
+	def __init__(self):
+		self.enabled = False
+		self.timers = {}
+		self.counters = Counter()
+		self.profile_mode = None
+		self.profiler = None
+
+	def enable(self, profile_mode=None):
+		self.enabled = True
+		self.profile_mode = profile_mode
+		if profile_mode == "cprofile":
+			self.profiler = cProfile.Profile()
+			self.profiler.enable()
+		elif profile_mode == "sampling":
+			self.profiler = SamplingProfiler()
+			self.profiler.start()
+		elif profile_mode is not None:
+			raise Exception("Invalid profile mode: {}".format(profile_mode))
+
+	def enable_from_args(self, args):
+		if args.instrument or args.profile is not None:
+			self.enable(args.profile)
+
+	def timer(self, name):
+		"""
+		Usage: with instrumentation.timer(name): ...
+		"""
+		if not self.enabled:
+			return NOOP_TIMER
+		return Timer(self, name)
+
+	def add_time(self, name, seconds, calls=1):
+		if name not in self.timers:
+			self.timers[name] = {"calls": 0, "total_s": 0}
+		t = self.timers[name]
+		t["calls"] += calls
+		t["total_s"] += seconds
+
+	def incr(self, name, value=1):
+		if self.enabled:
+			self.counters[name] += value
+
+	def instrument(self, name, func):
+		"""
+		Returns: func wrapped with a timer; exceptions raised by func are counted
+				 in the <name>.exceptions counter and re-raised
+
+		NOTE: wrap once, outside of the hot loop
+		"""
+		if not self.enabled:
+			return func
+
+		timers, counters, perf_counter = self.timers, self.counters, time.perf_counter
+		timers[name] = t = timers.get(name, {"calls": 0, "total_s": 0})
+		ex_name = "{}.exceptions".format(name)
+
+		def wrapper(*args, **kwargs):
+			start = perf_counter()
+			try:
+				return func(*args, **kwargs)
+			except Exception:
+				counters[ex_name] += 1
+				raise
+			finally:
+				t["calls"] += 1
+				t["total_s"] += perf_counter() - start
+
+		return wrapper
+
+	def instrument_stats(self, stats, key, func):
+		"""
+		Returns: func wrapped with a timer that adds its run time to stats[key]
+
+		NOTE: wrap once, outside of the hot loop; per-call timing is too
+			  expensive for the default run, so func is returned as-is unless
+			  instrumentation is enabled
+		"""
+		if not self.enabled:
+			return func
+
+		perf_counter = time.perf_counter
+
+		def wrapper(*args, **kwargs):
+			start = perf_counter()
+			try:
+				return func(*args, **kwargs)
+			finally:
+				stats[key] += perf_counter() - start
+
+		return wrapper
+
+	def get_report(self):
+		timers = {}
+		for name, t in sorted(self.timers.items(), key=lambda x: x[1]["total_s"], reverse=True):
+			timers[name] = {
+				"calls": t["calls"],
+				"total_s": t["total_s"],
+				"avg_us": 1000000 * t["total_s"] / t["calls"] if t["calls"] > 0 else None
+			}
+		return {
+			"timers": timers,
+			"counters": dict(sorted(self.counters.items()))
+		}
+
+	def dump_report(self, out_file):
+		"""
+		Writes the report to <out_file> (json); with cProfile, the raw profile
+		is written to <out_file without extension>.prof (see pstats)
+		"""
+		if not self.enabled:
+			return
+
+		report = self.get_report()
+		if self.profile_mode == "cprofile":
+			self.profiler.disable()
+			profile_file = os.path.splitext(out_file)[0] + ".prof"
+			self.profiler.dump_stats(profile_file)
+			report["profile"] = {"mode": "cprofile", "file": profile_file}
+		elif self.profile_mode == "sampling":
+			self.profiler.stop()
+			report["profile"] = dict(mode="sampling", **self.profiler.get_report())
+
+		with open(out_file, 'w') as fd:
+			json.dump(report, fd, indent=2)
+		print("[instrumentation] report: {}".format(out_file))
+
+
+def add_instrumentation_arguments(parser):
+	parser.add_argument("--instrument", dest="instrument", action='store_true',
+		help="Collect timers and counters and write them to a json report")
+	parser.add_argument("--profile", dest="profile", type=str, choices=PROFILE_MODES,
+		help="Also profile the run (implies --instrument)")
+
+
+instrumentation = Instrumentation()
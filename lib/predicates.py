@@ -0,0 +1,111 @@
+import re
+import operator
+
+
+"""
+Simple predicates on the columns of the original table, evaluated on the
+compressed table (see decompression/main.py --where)
+
+Syntax: <column> <op> <literal>, where:
+	column: column name; double quoted if it contains spaces or operator chars
+	op: =, !=, <>, <, <=, >, >=, LIKE
+	literal: 'string' (quote escaped as '') or number
+	e.g. city = 'Berlin', price >= 100, code LIKE 'AB%'
+
+NOTE: string literals compare the attrs as strings; number literals compare
+	  them as numbers (attrs that are not numeric do not match)
+NOTE: LIKE supports the % and _ wildcards
+"""
+PREDICATE_REGEX = re.compile(r'^\s*(?P<col>"[^"]+"|[^\s=!<>]+)\s*(?P<op><=|>=|!=|<>|=|<|>|(?i:like)(?=[\s\']))\s*(?P<lit>.*?)\s*$')
+COMPARISON_OPERATORS = {
+	"=": operator.eq,
+	"!=": operator.ne,
+	"<>": operator.ne,
+	"<": operator.lt,
+	"<=": operator.le,
+	">": operator.gt,
+	">=": operator.ge
+}
+
+
+class Predicate(object):
+	"""
+	NOTE: null values never match (SQL semantics); the caller checks for
+		  nulls, evaluate() only gets non-null attrs
+	"""
+
+	def __init__(self, col_name, op, literal, numeric=False):
+		self.col_name = col_name
+		self.op = op.upper()
+		self.literal = literal
+		self.numeric = numeric
+
+		# prefix: set for <prefix>% LIKE patterns, checked without regex
+		self.prefix = None
+		self.regex = None
+		if self.op == "LIKE":
+			if numeric:
+				raise Exception("Invalid LIKE pattern: {}".format(literal))
+			if "%" not in literal and "_" not in literal:
+				# no wildcards: equality
+				self.op = "="
+			elif literal.endswith("%") and "%" not in literal[:-1] and "_" not in literal[:-1]:
+				self.prefix = literal[:-1]
+			else:
+				self.regex = re.compile("".join([".*" if c == "%" else "." if c == "_" else re.escape(c) for c in literal]), re.DOTALL)
+		elif self.op not in COMPARISON_OPERATORS:
+			raise Exception("Invalid predicate operator: {}".format(op))
+		self.cmp = COMPARISON_OPERATORS.get(self.op)
+
+	def evaluate(self, attr):
+		if self.numeric:
+			try:
+				n_val = float(attr)
+			except ValueError:
+				return False
+			return self.evaluate_number(n_val)
+		if self.prefix is not None:
+			return attr.startswith(self.prefix)
+		if self.regex is not None:
+			return self.regex.fullmatch(attr) is not None
+		return self.cmp(attr, self.literal)
+
+	def evaluate_number(self, n_val):
+		return self.cmp(n_val, self.literal)
+
+	def is_string_equality(self):
+		return self.op == "=" and not self.numeric
+
+	def __repr__(self):
+		literal = self.literal if self.numeric else "'{}'".format(self.literal.replace("'", "''"))
+		return "{} {} {}".format(self.col_name, self.op, literal)
+
+
+def parse_literal(literal):
+	"""
+	Returns: (value, numeric)
+	"""
+	if len(literal) >= 2 and literal[0] == "'" and literal[-1] == "'":
+		value = literal[1:-1]
+		if "'" in value.replace("''", ""):
+			raise Exception("Invalid string literal: {}".format(literal))
+		return (value.replace("''", "'"), False)
+	try:
+		return (int(literal), True)
+	except ValueError:
+		pass
+	try:
+		return (float(literal), True)
+	except ValueError:
+		raise Exception("Invalid predicate literal: {}".format(literal))
+
+
+def parse_predicate(predicate_s):
+	m = PREDICATE_REGEX.match(predicate_s)
+	if m is None:
+		raise Exception("Invalid predicate: {}".format(predicate_s))
+	col_name = m.group("col")
+	if col_name.startswith('"'):
+		col_name = col_name[1:-1]
+	(literal, numeric) = parse_literal(m.group("lit"))
+	return Predicate(col_name, m.group("op").strip(), literal, numeric)
@@ -0,0 +1,103 @@
+import sys
+import struct
+import argparse
+from array import array
+
+
+"""
+Row-offset index of a compressed table: the byte offsets of every
+<interval>-th row in the data file and in the null mask file, so that a row
+range can be read without scanning the files from the beginning
+
+File format (little endian):
+	ROW_INDEX_MAGIC
+	version: uint32, interval: uint64, row_count: uint64, entry_count: uint64
+	entry_count * (data_offset: uint64, nulls_offset: uint64) # entry i: offsets of row i * interval
+"""
+ROW_INDEX_MAGIC = b"ROWINDEX"
+ROW_INDEX_VERSION = 1
+ROW_INDEX_HEADER_FORMAT = "<IQQQ"
+DEFAULT_ROW_INDEX_INTERVAL = 1000
+
+
+def parse_rows(rows):
+	"""
+	Params:
+		rows: "<start>:<end>" (end exclusive; either can be empty)
+	Returns: (start, end); end=None: until the end of the table
+
+	NOTE: argparse type; start=end is a valid (empty) range
+	"""
+	try:
+		(start, end) = rows.split(":")
+		(start, end) = (int(start) if start != "" else 0, int(end) if end != "" else None)
+	except ValueError:
+		raise argparse.ArgumentTypeError("Invalid row range: {}".format(rows))
+	if start < 0 or (end is not None and end < start):
+		raise argparse.ArgumentTypeError("Invalid row range: {}".format(rows))
+	return (start, end)
+
+
+class RowIndexWriter(object):
+	"""
+	NOTE: add() must be called before each row is written; the offsets are
+		  taken with tell() (byte positions of the text files) only once
+		  every <interval> rows
+	"""
+
+	def __init__(self, interval=DEFAULT_ROW_INDEX_INTERVAL):
+		if interval <= 0:
+			raise Exception("Invalid row index interval: {}".format(interval))
+		self.interval = interval
+		self.row_count = 0
+		self.offsets = array("Q")
+
+	def add(self, fd_data, fd_nulls):
+		if self.row_count % self.interval == 0:
+			self.offsets.append(fd_data.tell())
+			self.offsets.append(fd_nulls.tell())
+		self.row_count += 1
+
+	def write(self, row_index_file):
+		offsets = array("Q", self.offsets)
+		if sys.byteorder == "big":
+			offsets.byteswap()
+		with open(row_index_file, 'wb') as f:
+			f.write(ROW_INDEX_MAGIC)
+			f.write(struct.pack(ROW_INDEX_HEADER_FORMAT, ROW_INDEX_VERSION, self.interval, self.row_count, len(offsets) // 2))
+			f.write(offsets.tobytes())
+
+
+class RowIndex(object):
+	def __init__(self, interval, row_count, offsets):
+		self.interval = interval
+		self.row_count = row_count
+		self.offsets = offsets
+
+	@classmethod
+	def read(cls, row_index_file):
+		with open(row_index_file, 'rb') as f:
+			buf = f.read()
+		if buf[:len(ROW_INDEX_MAGIC)] != ROW_INDEX_MAGIC:
+			raise Exception("Invalid row index file: {}".format(row_index_file))
+		pos = len(ROW_INDEX_MAGIC)
+		(version, interval, row_count, entry_count) = struct.unpack_from(ROW_INDEX_HEADER_FORMAT, buf, pos)
+		if version != ROW_INDEX_VERSION:
+			raise Exception("Unsupported row index version: {}".format(version))
+		pos += struct.calcsize(ROW_INDEX_HEADER_FORMAT)
+		offsets = array("Q")
+		offsets.frombytes(buf[pos:pos + entry_count * 2 * offsets.itemsize])
+		if sys.byteorder == "big":
+			offsets.byteswap()
+		return cls(interval, row_count, offsets)
+
+	def seek(self, row):
+		"""
+		Returns: (indexed_row, data_offset, nulls_offset) of the closest
+				 indexed row before or at <row>
+		"""
+		entry_count = len(self.offsets) // 2
+		if entry_count == 0:
+			return (0, 0, 0)
+		entry = min(row // self.interval, entry_count - 1)
+		return (entry * self.interval, self.offsets[2 * entry], self.offsets[2 * entry + 1])
@@ -3,6 +3,7 @@ import os
 import json
 import re
 import math
+import importlib
 from copy import deepcopy
 
 
@@ -105,6 +106,54 @@ class PatternLog(object):
 		return self.columns[col_id]
 
 
+class DisjointSet(object):
+	"""
+	Union-find with path compression and union by size
+
+	NOTE: items must be hashable; find() & union() raise KeyError for items
+		  that were not added
+	"""
+	def __init__(self, items=()):
+		self.parent = {}
+		self.size = {}
+		for item in items:
+			self.add(item)
+
+	def add(self, item):
+		if item not in self.parent:
+			self.parent[item] = item
+			self.size[item] = 1
+
+	def find(self, item):
+		root = item
+		while self.parent[root] != root:
+			root = self.parent[root]
+		# path compression
+		while self.parent[item] != root:
+			self.parent[item], item = root, self.parent[item]
+		return root
+
+	def union(self, item_a, item_b):
+		root_a, root_b = self.find(item_a), self.find(item_b)
+		if root_a == root_b:
+			return root_a
+		if self.size[root_a] < self.size[root_b]:
+			root_a, root_b = root_b, root_a
+		self.parent[root_b] = root_a
+		self.size[root_a] += self.size[root_b]
+		return root_a
+
+	def get_sets(self):
+		"""
+		Returns: list(list(item)); both the sets and their items are in the
+				 order in which the items were added
+		"""
+		res = {}
+		for item in self.parent:
+			res.setdefault(self.find(item), []).append(item)
+		return list(res.values())
+
+
 class DataType(object):
 	regex_sql = re.compile(r'^(.*?)(\(.*?\))?( not null)?,?$')
 
@@ -191,6 +240,50 @@ class Column(object):
 		return cls.from_dict(res_d)
 
 
+class LazyModule(object):
+	"""
+	Stands in for a module that is imported on first attribute access; used
+	for heavy dependencies (e.g. numpy) that are not needed by every entry point
+
+	Usage: np = LazyModule("numpy")
+	"""
+	def __init__(self, module_name):
+		self._module_name = module_name
+		self._module = None
+
+	def __getattr__(self, name):
+		# NOTE: special attributes (e.g. copy & pickle hooks) do not load the module
+		if name.startswith("__"):
+			raise AttributeError(name)
+		if self._module is None:
+			self._module = importlib.import_module(self._module_name)
+		return getattr(self._module, name)
+
+
+def get_value(value):
+	return value
+
+
+class LazyValue(object):
+	"""
+	Placeholder for a value that is loaded on first access (see ExpressionNode.operator_info)
+
+	NOTE: deepcopy & pickle materialize the value; load_f may hold objects that
+		  can not be copied or pickled (e.g. memoryviews of the tree file)
+	"""
+	def __init__(self, load_f):
+		self.load_f = load_f
+
+	def load(self):
+		return self.load_f()
+
+	def __deepcopy__(self, memo):
+		return deepcopy(self.load(), memo)
+
+	def __reduce__(self):
+		return (get_value, (self.load(),))
+
+
 class ExpressionNode(object):
 	def __init__(self, p_id, p_name, cols_in, cols_in_consumed, cols_out, operator_info, details, pattern_signature,
 				 parents=None, children=None):
@@ -210,6 +303,31 @@ class ExpressionNode(object):
 	def __repr__(self):
 		return "ExpressionNode(p_id=%r,p_name=%r,cols_in=%r,cols_in_consumed=%r,cols_out=%r,operator_info=%r,details=%r,pattern_signature=%r,parents=%r,children=%r)" % (self.p_id, self.p_name, self.cols_in, self.cols_in_consumed, self.cols_out, self.operator_info, self.details, self.pattern_signature, self.parents, self.children)
 
+	@property
+	def operator_info(self):
+		"""
+		NOTE: operator_info can be loaded lazily (e.g. binary expression tree files)
+		"""
+		if isinstance(self._operator_info, LazyValue):
+			self._operator_info = self._operator_info.load()
+		return self._operator_info
+
+	@operator_info.setter
+	def operator_info(self, value):
+		self._operator_info = value
+
+	def copy(self):
+		"""
+		Returns: shallow copy of the node; only parents & children (the tree
+				 links) are copied, everything else (e.g. operator_info) is
+				 shared and must be treated as immutable
+		"""
+		res = self.__class__.__new__(self.__class__)
+		res.__dict__.update(self.__dict__)
+		res.parents = set(self.parents)
+		res.children = set(self.children)
+		return res
+
 	def repr_short(self):
 		return "p_id=%r,cols_in=%s,cols_out=%s" % (
 				self.p_id, 
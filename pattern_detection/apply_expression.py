@@ -4,9 +4,23 @@ import os
 import sys
 import argparse
 import json
+import random
+import subprocess
 from lib.expression_tree import *
 from patterns import *
 from lib.util import *
+from lib.instrumentation import instrumentation, add_instrumentation_arguments
+from lib.row_index import RowIndexWriter, DEFAULT_ROW_INDEX_INTERVAL
+
+
+OPERATOR_ORDERS = ["tree", "coverage", "adaptive"]
+ADAPTIVE_REORDER_INTERVAL = 10000
+DEFAULT_DRIFT_WINDOW = 0
+DEFAULT_DRIFT_MAX_EXCEPTION_RATE_INCREASE = 0.05
+DEFAULT_DRIFT_SAMPLE_SIZE = 10000
+DRIFT_MIN_EXCEPTION_COUNT = 10
+DEFAULT_ADAPTIVE_DICT_MAX_SIZE = 64 * 1024
+LEARNING_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
 
 
 class ExpressionManager(object):
@@ -20,21 +34,96 @@ class ExpressionManager(object):
 	NOTE-2: it is the operator's responsibility to handle null values and raise
 			exception if not supported; for now, they will be added to the
 			exceptions column; TODO: handle them better in the future
+	NOTE-3: operator_order decides which of the candidate nodes (nodes with
+			the same input columns) is tried first:
+				- tree: tree order (default)
+				- coverage: highest learned coverage first
+				- adaptive: like coverage, then every ADAPTIVE_REORDER_INTERVAL
+				  tuples by the observed matched_count
+			candidates only swap positions among themselves, so the order with
+			respect to all other nodes is the tree order; decompression does
+			not depend on the order
+	NOTE-4: if the pattern detector has a pre-check (see
+			PatternDetector.get_operator_dispatch()), the operators whose key
+			does not match are skipped without being called
+	NOTE-5: if adaptive_max_size is set, the pattern detectors that support
+			it (see PatternDetector.get_adaptive_operator()) extend their
+			operator info with the values they do not cover, instead of
+			sending them to the exception column; the extended operator info
+			is kept in expr_n_item["adaptive"]
+	NOTE-6: operator_time_s is measured only with instrumentation enabled
+			(see instrumentation.instrument_stats()); the counters are always on
 	"""
 
-	def __init__(self, in_columns, expr_nodes, null_value):
+	def __init__(self, in_columns, expr_nodes, null_value, operator_order="tree", dispatch=True, adaptive_max_size=None):
+		if operator_order not in OPERATOR_ORDERS:
+			raise Exception("Invalid operator order: {}".format(operator_order))
 		self.null_value = null_value
+		self.operator_order = operator_order
 		self.expr_nodes = []
+		self.dispatch_groups = []
+		self.tuple_count = 0
 
 		# populate expr_nodes
+		dispatch_groups_map = {}
 		for expr_n in expr_nodes:
 			pd = get_pattern_detector(expr_n.p_id)
-			operator = pd.get_operator(expr_n.cols_in, expr_n.cols_out, expr_n.operator_info, self.null_value)
+			operator, adaptive = None, None
+			if adaptive_max_size is not None:
+				adaptive_operator = pd.get_adaptive_operator(expr_n.cols_in, expr_n.cols_out, expr_n.operator_info, self.null_value, adaptive_max_size)
+				if adaptive_operator is not None:
+					(operator, adaptive) = adaptive_operator
+			if operator is None:
+				operator = pd.get_operator(expr_n.cols_in, expr_n.cols_out, expr_n.operator_info, self.null_value)
+			operator = instrumentation.instrument("operator.{}({})".format(expr_n.p_id, ",".join(c.col_id for c in expr_n.cols_in)), operator)
+			# pre-dispatch
+			dispatch_group, dispatch_key = None, None
+			dispatch_info = pd.get_operator_dispatch(expr_n.cols_in, expr_n.operator_info, self.null_value) if dispatch else None
+			if dispatch_info is not None:
+				(dispatch_id, key_f, dispatch_key) = dispatch_info
+				group_key = (tuple(c.col_id for c in expr_n.cols_in), dispatch_id)
+				if group_key not in dispatch_groups_map:
+					dispatch_groups_map[group_key] = len(self.dispatch_groups)
+					self.dispatch_groups.append({
+						"key_f": key_f,
+						"cols_in": [c.col_id for c in expr_n.cols_in]
+					})
+				dispatch_group = dispatch_groups_map[group_key]
+			expr_n_stats = {
+				"attempted_count": 0,
+				"matched_count": 0,
+				"failed_count": 0,
+				"skipped_count": 0,
+				"exception_count": 0,
+				"operator_time_s": 0
+			}
+			operator = instrumentation.instrument_stats(expr_n_stats, "operator_time_s", operator)
 			self.expr_nodes.append({
 				"expr_n": expr_n,
-				"operator": operator
+				"operator": operator,
+				"cols_in_consumed": {c.col_id for c in expr_n.cols_in_consumed},
+				"dispatch_group": dispatch_group,
+				"dispatch_key": dispatch_key,
+				"adaptive": adaptive,
+				"stats": expr_n_stats
 			})
 
+		# candidate nodes: nodes with the same input columns
+		self.candidate_groups = []
+		candidate_groups_map = {}
+		for expr_n_idx, expr_n in enumerate(expr_nodes):
+			cols_in_key = tuple(c.col_id for c in expr_n.cols_in)
+			if cols_in_key not in candidate_groups_map:
+				candidate_groups_map[cols_in_key] = len(self.candidate_groups)
+				self.candidate_groups.append([])
+			self.candidate_groups[candidate_groups_map[cols_in_key]].append(expr_n_idx)
+		self.candidate_groups = [g for g in self.candidate_groups if len(g) > 1]
+
+		# execution order of expr_nodes
+		self.expr_nodes_order = list(self.expr_nodes)
+		if self.operator_order != "tree":
+			self.reorder_expr_nodes(lambda expr_n_idx: -self.expr_nodes[expr_n_idx]["expr_n"].details.get("coverage", 0))
+
 		self.in_columns, self.out_columns, self.in_columns_map, self.out_columns_map = [], [], {}, {}
 
 		# populate in_columns & save their indices
@@ -44,27 +133,31 @@ class ExpressionManager(object):
 
 		# populate out_columns with:
 		# 1) unused columns
+		used_columns = {c.col_id for expr_n in expr_nodes for c in expr_n.cols_in}
 		for in_col in in_columns:
 			# add original column if not present as input in any expression node
-			used_columns = [c.col_id for expr_n in expr_nodes for c in expr_n.cols_in]
 			if in_col.col_id not in used_columns:
 				self.out_columns.append(in_col)
-				continue
+		out_column_ids = {c.col_id for c in self.out_columns}
 		# [2) output, 3) exception, 4) unconsumed input] columns from expression nodes
 		for expr_n in expr_nodes:
 			# output columns
 			self.out_columns.extend(expr_n.cols_out)
+			out_column_ids.update(c.col_id for c in expr_n.cols_out)
 			# exception columns
 			for ex_col in expr_n.cols_ex:
 				# NOTE: multiple expr_n can have the same ex_col; add it only once
-				if ex_col.col_id not in [c.col_id for c in self.out_columns]:
+				if ex_col.col_id not in out_column_ids:
 					self.out_columns.append(ex_col)
+					out_column_ids.add(ex_col.col_id)
 			# unconsumed input columns
+			cols_in_consumed = {c.col_id for c in expr_n.cols_in_consumed}
 			for in_col in expr_n.cols_in:
-				if in_col.col_id not in {c.col_id for c in expr_n.cols_in_consumed}:
+				if in_col.col_id not in cols_in_consumed:
 					# NOTE: in_col may have been added already by other expr_n; add it only once
-					if in_col.col_id not in [c.col_id for c in self.out_columns]:
+					if in_col.col_id not in out_column_ids:
 						self.out_columns.append(in_col)
+						out_column_ids.add(in_col.col_id)
 
 		# save output & exception column indices
 		for idx, out_col in enumerate(self.out_columns):
@@ -110,6 +203,24 @@ class ExpressionManager(object):
 		# 	print(k,c)
 		# # TODO: end-debug
 
+	def reorder_expr_nodes(self, sort_key):
+		"""
+		Reorders the candidate nodes of each group among their own slots (tree
+		positions); ties keep the tree order
+		"""
+		for group in self.candidate_groups:
+			ordered = sorted(group, key=lambda expr_n_idx: (sort_key(expr_n_idx), expr_n_idx))
+			for slot, expr_n_idx in zip(group, ordered):
+				self.expr_nodes_order[slot] = self.expr_nodes[expr_n_idx]
+
+	def update_operator_order(self):
+		"""
+		Called once for each tuple
+		"""
+		self.tuple_count += 1
+		if self.operator_order == "adaptive" and self.tuple_count % ADAPTIVE_REORDER_INTERVAL == 0:
+			self.reorder_expr_nodes(lambda expr_n_idx: -self.expr_nodes[expr_n_idx]["stats"]["matched_count"])
+
 	def get_out_columns(self):
 		return self.out_columns
 
@@ -145,10 +256,39 @@ class ExpressionManager(object):
 		for out_col_s in out_columns_stats:
 			out_col_s["null_ratio"] = float(out_col_s["null_count"]) / valid_tuple_count if valid_tuple_count > 0 else float("inf")
 		stats = {
-			"out_columns": out_columns_stats
+			"out_columns": out_columns_stats,
+			"expr_nodes": self.get_expr_nodes_stats(valid_tuple_count)
 		}
 		return stats
 
+	def get_expr_nodes_stats(self, valid_tuple_count):
+		"""
+		Returns: list(stats) with one item for each expression node, where:
+			attempted_count: number of rows the operator was applied on
+			matched_count: number of rows the operator succeeded on
+			failed_count: number of rows the operator raised OperatorException on
+			skipped_count: number of rows the operator was not called on because of the pre-dispatch check
+			exception_count: number of failed or skipped rows that ended up in the exception column (i.e. no other node matched them)
+			operator_time_s: cumulative time spent in the operator (only with instrumentation enabled)
+			adaptive: stats of the extended operator info (only for adaptive operators)
+		"""
+		res = []
+		for expr_n in self.expr_nodes:
+			expr_n_stats = deepcopy(expr_n["stats"])
+			attempted_count, matched_count = expr_n_stats["attempted_count"], expr_n_stats["matched_count"]
+			expr_n_stats.update({
+				"p_id": expr_n["expr_n"].p_id,
+				"cols_in": [c.col_id for c in expr_n["expr_n"].cols_in],
+				"cols_out": [c.col_id for c in expr_n["expr_n"].cols_out],
+				"match_ratio": float(matched_count) / attempted_count if attempted_count > 0 else None,
+				"exception_ratio": float(expr_n_stats["exception_count"]) / valid_tuple_count if valid_tuple_count > 0 else None,
+				"operator_time_per_match_us": 1000000 * expr_n_stats["operator_time_s"] / matched_count if matched_count > 0 and instrumentation.enabled else None
+			})
+			if expr_n["adaptive"] is not None:
+				expr_n_stats["adaptive"] = expr_n["adaptive"].get_stats()
+			res.append(expr_n_stats)
+		return res
+
 	def is_valid_tuple(self, tpl):
 		if len(tpl) != len(self.in_columns):
 			return False
@@ -160,10 +300,19 @@ class ExpressionManager(object):
 		if not self.is_valid_tuple(in_tpl):
 			return None
 
+		self.update_operator_order()
+
+		# pre-dispatch keys
+		dispatch_keys = []
+		for group in self.dispatch_groups:
+			in_attrs = [in_tpl[self.in_columns_map[col_id]] for col_id in group["cols_in"]]
+			dispatch_keys.append(group["key_f"](in_attrs))
+
 		# fill out_tpl in for each expression node
 		in_columns_consumed = set()
-		for expr_n_idx, expr_n in enumerate(self.expr_nodes):
-			expr_n, operator = expr_n["expr_n"], expr_n["operator"]
+		failed_expr_nodes = []
+		for expr_n_item in self.expr_nodes_order:
+			expr_n, operator, expr_n_stats = expr_n_item["expr_n"], expr_n_item["operator"], expr_n_item["stats"]
 			in_attrs = []
 			# mark in_col as referenced & get in_attrs
 			used = False
@@ -176,16 +325,25 @@ class ExpressionManager(object):
 				in_attrs.append(in_attr)
 			if used:
 				continue
+			# pre-dispatch check
+			if expr_n_item["dispatch_group"] is not None and dispatch_keys[expr_n_item["dispatch_group"]] != expr_n_item["dispatch_key"]:
+				expr_n_stats["skipped_count"] += 1
+				failed_expr_nodes.append(expr_n_item)
+				continue
 			# apply operator
+			expr_n_stats["attempted_count"] += 1
 			try:
 				out_attrs = operator(in_attrs)
 			except OperatorException as e:
+				expr_n_stats["failed_count"] += 1
+				failed_expr_nodes.append(expr_n_item)
 				# this operator cannot be applied, but others may be; in the worst case, attr is added to the exception column at the end
 				# print("debug: OperatorException: {}".format(e))
 				# for in_col in expr_n.cols_in:
 				# 	in_col_idx = self.in_columns_map[in_col.col_id]
 				# 	self.in_columns_stats[in_col_idx]["exception_count"] += 1
 				continue
+			expr_n_stats["matched_count"] += 1
 			# mark in_col as used
 			for in_col in expr_n.cols_in_consumed:
 				in_columns_consumed.add(in_col.col_id)
@@ -218,6 +376,10 @@ class ExpressionManager(object):
 					out_col_id = in_col.col_id
 				else: # exception
 					out_col_id = OutputColumnManager.get_exception_col_id(in_col.col_id)
+					# blame the nodes that failed on this attr
+					for expr_n_item in failed_expr_nodes:
+						if in_col.col_id in expr_n_item["cols_in_consumed"]:
+							expr_n_item["stats"]["exception_count"] += 1
 				out_col_idx = self.out_columns_map[out_col_id]
 				# add attr to out_tpl
 				out_tpl[out_col_idx] = str(in_tpl[in_col_idx])
@@ -281,32 +443,384 @@ def apply_expression_manager_list(tpl, expr_manager_list):
 	return tpl
 
 
-def driver_loop(driver, expr_manager_list, fdelim, null_value, fd_out, fd_null_mask):
+class FusedExpressionProgram(object):
+	"""
+	All the levels of the expression tree (i.e. expr_manager_list) compiled
+	into a single per-tuple program over a register file with one slot for
+	each column of the tree; same output as apply_expression_manager_list()
+
+	NOTE-1: a level only touches the slots of its expression nodes (inputs,
+			outputs, exception columns); columns that are not used by a level
+			are not copied, and the output tuple is built only once, after the
+			last level
+	NOTE-2: operator outputs are converted with str() exactly once, when they
+			are written to their slot; they can not be kept as-is because the
+			operators of the next levels expect the same attrs as in the
+			learning phase (i.e. str)
+	NOTE-3: the expression managers keep the operators, operator order and
+			expr_nodes stats; null stats are counted only for the slots written
+			by each level (see update_null_stats())
+	"""
+
+	def __init__(self, expr_manager_list, null_value):
+		self.expr_manager_list = expr_manager_list
+		self.null_value = null_value
+		self.slots = {}
+
+		def get_slot(col_id):
+			if col_id not in self.slots:
+				self.slots[col_id] = len(self.slots)
+			return self.slots[col_id]
+
+		# input columns first, so that the input tuple is the prefix of the register file
+		in_columns = expr_manager_list[0].in_columns
+		self.in_column_count = len(in_columns)
+		for in_col in in_columns:
+			get_slot(in_col.col_id)
+		# level -1: input columns
+		self.last_written = {in_col.col_id: (-1, idx) for idx, in_col in enumerate(in_columns)}
+		self.in_null_counts = [0] * len(in_columns)
+
+		self.levels = []
+		for level_idx, expr_mgr in enumerate(expr_manager_list):
+			level = {
+				"expr_manager": expr_mgr,
+				"dispatch_groups": [(group["key_f"], [get_slot(col_id) for col_id in group["cols_in"]]) for group in expr_mgr.dispatch_groups],
+				"unused": [],
+				"written_slots": []
+			}
+			written_columns = []
+			node_in_columns = {}
+			for expr_n_item in expr_mgr.expr_nodes:
+				expr_n = expr_n_item["expr_n"]
+				expr_n_item["in_slots"] = [get_slot(c.col_id) for c in expr_n.cols_in]
+				expr_n_item["consumed_slots"] = [get_slot(c.col_id) for c in expr_n.cols_in_consumed]
+				expr_n_item["out_slots"] = [get_slot(c.col_id) for c in expr_n.cols_out]
+				written_columns.extend(c.col_id for c in expr_n.cols_out)
+				for in_col in expr_n.cols_in:
+					node_in_columns[in_col.col_id] = in_col
+			# input columns of the expression nodes that are not consumed: see "handle unused attrs" in ExpressionManager.apply_expressions()
+			for col_id in node_in_columns.keys():
+				if col_id in expr_mgr.out_columns_map:
+					# unconsumed input column; null if consumed by another node
+					level["unused"].append((get_slot(col_id), None))
+					written_columns.append(col_id)
+					continue
+				ex_col_id = OutputColumnManager.get_exception_col_id(col_id)
+				if ex_col_id not in expr_mgr.out_columns_map:
+					raise Exception("Exception column not found: col_id={}".format(ex_col_id))
+				level["unused"].append((get_slot(col_id), get_slot(ex_col_id)))
+				written_columns.append(ex_col_id)
+			# NOTE: output columns that are never written (e.g. the exception column of an unconsumed input column) are always null
+			written_columns.extend(c.col_id for c in expr_mgr.out_columns if c.col_id not in self.last_written)
+			# null stats
+			for col_id in dict.fromkeys(written_columns):
+				self.last_written[col_id] = (level_idx, len(level["written_slots"]))
+				level["written_slots"].append(get_slot(col_id))
+			level["null_counts"] = [0] * len(level["written_slots"])
+			level["null_count_refs"] = [self.last_written[out_col.col_id] for out_col in expr_mgr.out_columns]
+			self.levels.append(level)
+
+		self.out_slots = [self.slots[out_col.col_id] for out_col in expr_manager_list[-1].out_columns]
+		self.null_regs = [self.null_value] * (len(self.slots) - self.in_column_count)
+
+	def apply_expressions(self, in_tpl):
+		if len(in_tpl) != self.in_column_count:
+			return None
+		null_value = self.null_value
+
+		regs = in_tpl + self.null_regs
+		for idx, attr in enumerate(in_tpl):
+			if attr == null_value:
+				self.in_null_counts[idx] += 1
+
+		for level in self.levels:
+			expr_mgr = level["expr_manager"]
+			expr_mgr.update_operator_order()
+
+			# pre-dispatch keys
+			dispatch_keys = [key_f([regs[slot] for slot in slots]) for (key_f, slots) in level["dispatch_groups"]]
+
+			# apply the expression nodes; see ExpressionManager.apply_expressions()
+			consumed_slots = set()
+			failed_expr_nodes = []
+			for expr_n_item in expr_mgr.expr_nodes_order:
+				in_slots, expr_n_stats = expr_n_item["in_slots"], expr_n_item["stats"]
+				if not consumed_slots.isdisjoint(in_slots):
+					continue
+				if expr_n_item["dispatch_group"] is not None and dispatch_keys[expr_n_item["dispatch_group"]] != expr_n_item["dispatch_key"]:
+					expr_n_stats["skipped_count"] += 1
+					failed_expr_nodes.append(expr_n_item)
+					continue
+				expr_n_stats["attempted_count"] += 1
+				try:
+					out_attrs = expr_n_item["operator"]([regs[slot] for slot in in_slots])
+				except OperatorException as e:
+					expr_n_stats["failed_count"] += 1
+					failed_expr_nodes.append(expr_n_item)
+					continue
+				expr_n_stats["matched_count"] += 1
+				consumed_slots.update(expr_n_item["consumed_slots"])
+				for slot, out_attr in zip(expr_n_item["out_slots"], out_attrs):
+					regs[slot] = str(out_attr)
+
+			# handle unused attrs
+			for (in_slot, ex_slot) in level["unused"]:
+				if ex_slot is None:
+					if in_slot in consumed_slots:
+						regs[in_slot] = null_value
+					continue
+				if in_slot in consumed_slots or regs[in_slot] == null_value:
+					continue
+				regs[ex_slot] = regs[in_slot]
+				# blame the nodes that failed on this attr
+				for expr_n_item in failed_expr_nodes:
+					if in_slot in expr_n_item["consumed_slots"]:
+						expr_n_item["stats"]["exception_count"] += 1
+
+			# count nulls for stats
+			null_counts = level["null_counts"]
+			for idx, slot in enumerate(level["written_slots"]):
+				if regs[slot] == null_value:
+					null_counts[idx] += 1
+
+		return [regs[slot] for slot in self.out_slots]
+
+	def update_null_stats(self):
+		"""
+		Copies the null counts to the out_columns_stats of the expression managers
+		"""
+		for level in self.levels:
+			for out_col_s, (level_idx, idx) in zip(level["expr_manager"].out_columns_stats, level["null_count_refs"]):
+				if level_idx == -1:
+					out_col_s["null_count"] = self.in_null_counts[idx]
+				else:
+					out_col_s["null_count"] = self.levels[level_idx]["null_counts"][idx]
+
+
+class DriftMonitor(object):
+	"""
+	Windowed exception-rate tracking of the expression nodes: every
+	<window_size> valid tuples, the exception rate of each node in the last
+	window (exception_count / window tuples) is checked against:
+		- max_exception_rate: absolute limit
+		- max_exception_rate_increase: limit over the exception rate of the
+		  node while learning (1 - coverage - null_coverage)
+	an alarm is raised for each node over any of the limits
+
+	NOTE-1: the rates are computed from the expr_nodes stats (exception_count)
+			of the expression managers, so they are the same for the fused
+			program and for the level by level application
+	NOTE-2: the learned exception rate of a node with candidates (see
+			ExpressionManager NOTE-3) is an upper bound: the rows it does not
+			cover may be covered by the other candidates
+	NOTE-3: windows with less than DRIFT_MIN_EXCEPTION_COUNT exceptions for a
+			node never raise an alarm for it (e.g. the last, partial window)
+	NOTE-4: if relearn_dir is set, a reservoir sample of the input lines of
+			the current window is kept; when a node raises its first alarm,
+			the sample is written to <relearn_dir>/window_<idx>.csv and a new
+			expression tree is learned from it (pattern_detection/main.py
+			<relearn_args>) in a background process, into
+			<relearn_dir>/window_<idx>.expr_tree/; the sample is seeded with the
+			window index, so the same input gives the same sample
+	"""
+
+	def __init__(self, expr_manager_list, node_ids, window_size,
+				 max_exception_rate=None, max_exception_rate_increase=DEFAULT_DRIFT_MAX_EXCEPTION_RATE_INCREASE,
+				 relearn_dir=None, sample_size=DEFAULT_DRIFT_SAMPLE_SIZE, relearn_args=None):
+		"""
+		Params:
+			node_ids: list(list(node_id)) node ids of each level, in the same order as expr_manager.expr_nodes
+		"""
+		if window_size <= 0:
+			raise Exception("Invalid drift window: {}".format(window_size))
+		self.window_size = window_size
+		self.max_exception_rate = max_exception_rate
+		self.max_exception_rate_increase = max_exception_rate_increase
+		self.relearn_dir = relearn_dir
+		self.sample_size = sample_size
+		self.relearn_args = relearn_args if relearn_args is not None else []
+
+		self.nodes = []
+		for level_idx, (expr_mgr, level_node_ids) in enumerate(zip(expr_manager_list, node_ids)):
+			for expr_n_item, node_id in zip(expr_mgr.expr_nodes, level_node_ids):
+				expr_n = expr_n_item["expr_n"]
+				learned_exception_rate = 1 - expr_n.details.get("coverage", 1) - expr_n.details.get("null_coverage", 0)
+				self.nodes.append({
+					"node_id": node_id,
+					"level": level_idx,
+					"p_id": expr_n.p_id,
+					"cols_in": [c.col_id for c in expr_n.cols_in],
+					"stats": expr_n_item["stats"],
+					"learned_exception_rate": max(0.0, learned_exception_rate),
+					"last_exception_count": 0,
+					"relearned": False
+				})
+
+		self.window_idx = 0
+		self.window_start = 0
+		self.window_tuple_count = 0
+		self.sample = []
+		self.rand = random.Random(self.window_idx)
+		self.alarms = []
+		self.relearn_jobs = []
+
+	def feed(self, line):
+		"""
+		Called once for each valid tuple, after it was compressed
+		"""
+		self.window_tuple_count += 1
+		if self.relearn_dir is not None:
+			# reservoir sampling (algorithm R)
+			if len(self.sample) < self.sample_size:
+				self.sample.append(line)
+			else:
+				r = self.rand.randrange(self.window_tuple_count)
+				if r < self.sample_size:
+					self.sample[r] = line
+		if self.window_tuple_count == self.window_size:
+			self.end_window()
+
+	def end_window(self):
+		"""
+		Checks the exception rates of the current window & starts a new one
+		NOTE: must also be called after the last tuple (partial window)
+		"""
+		if self.window_tuple_count == 0:
+			return
+		alarm_nodes = []
+		for node in self.nodes:
+			exception_count = node["stats"]["exception_count"] - node["last_exception_count"]
+			node["last_exception_count"] = node["stats"]["exception_count"]
+			if exception_count < DRIFT_MIN_EXCEPTION_COUNT:
+				continue
+			exception_rate = float(exception_count) / self.window_tuple_count
+			reasons = []
+			if self.max_exception_rate is not None and exception_rate > self.max_exception_rate:
+				reasons.append("max_exception_rate")
+			if self.max_exception_rate_increase is not None and exception_rate - node["learned_exception_rate"] > self.max_exception_rate_increase:
+				reasons.append("max_exception_rate_increase")
+			if len(reasons) == 0:
+				continue
+			alarm = {
+				"window": self.window_idx,
+				"rows": [self.window_start, self.window_start + self.window_tuple_count],
+				"node_id": node["node_id"],
+				"level": node["level"],
+				"p_id": node["p_id"],
+				"cols_in": node["cols_in"],
+				"exception_count": exception_count,
+				"exception_rate": exception_rate,
+				"learned_exception_rate": node["learned_exception_rate"],
+				"reasons": reasons
+			}
+			print("[drift] alarm: window={}, rows={}, node_id={}, p_id={}, cols_in={}, exception_rate={:.4f}, learned_exception_rate={:.4f}, reasons={}".format(
+				alarm["window"], alarm["rows"], alarm["node_id"], alarm["p_id"], alarm["cols_in"],
+				alarm["exception_rate"], alarm["learned_exception_rate"], ",".join(reasons)))
+			self.alarms.append(alarm)
+			alarm_nodes.append(node)
+
+		if self.relearn_dir is not None and any(not node["relearned"] for node in alarm_nodes):
+			for node in alarm_nodes:
+				node["relearned"] = True
+			self.relearn([node["node_id"] for node in alarm_nodes])
+
+		self.window_idx += 1
+		self.window_start += self.window_tuple_count
+		self.window_tuple_count = 0
+		self.sample = []
+		self.rand = random.Random(self.window_idx)
+
+	def relearn(self, node_ids):
+		name = "window_{}".format(self.window_idx)
+		sample_file = os.path.join(self.relearn_dir, "{}.csv".format(name))
+		expr_tree_dir = os.path.join(self.relearn_dir, "{}.expr_tree".format(name))
+		log_file = os.path.join(self.relearn_dir, "{}.log".format(name))
+		if not os.path.exists(expr_tree_dir):
+			os.makedirs(expr_tree_dir)
+		with open(sample_file, 'w') as fd:
+			for line in self.sample:
+				fd.write(line + "\n")
+
+		cmd = [sys.executable, LEARNING_SCRIPT] + self.relearn_args + ["--expr-tree-output-dir", expr_tree_dir, sample_file]
+		with open(log_file, 'w') as fd_log:
+			process = subprocess.Popen(cmd, stdout=fd_log, stderr=subprocess.STDOUT)
+		print("[drift] relearn: window={}, node_ids={}, sample_file={}, expr_tree_dir={}".format(self.window_idx, node_ids, sample_file, expr_tree_dir))
+		self.relearn_jobs.append({
+			"window": self.window_idx,
+			"node_ids": node_ids,
+			"sample_file": sample_file,
+			"sample_size": len(self.sample),
+			"expr_tree_dir": expr_tree_dir,
+			"log_file": log_file,
+			"process": process
+		})
+
+	def wait(self):
+		"""
+		Waits for the background re-learning processes
+		"""
+		for job in self.relearn_jobs:
+			job["returncode"] = job["process"].wait()
+			if job["returncode"] != 0:
+				print("[drift] relearn failed: window={}, returncode={}, log_file={}".format(job["window"], job["returncode"], job["log_file"]))
+
+	def get_stats(self):
+		return {
+			"window_size": self.window_size,
+			"window_count": self.window_idx,
+			"max_exception_rate": self.max_exception_rate,
+			"max_exception_rate_increase": self.max_exception_rate_increase,
+			"alarms": self.alarms,
+			"relearn": [{k: v for k, v in job.items() if k != "process"} for job in self.relearn_jobs]
+		}
+
+
+def driver_loop(driver, expr_manager_list, fdelim, null_value, fd_out, fd_null_mask, columns_writer=None, fused_program=None, drift_monitor=None, row_index_writer=None):
 	global total_tuple_count
 	global valid_tuple_count
 	total_tuple_count = 0
 	valid_tuple_count = 0
 
+	if fused_program is not None:
+		apply_f = instrumentation.instrument("fused.apply_expressions", fused_program.apply_expressions)
+	else:
+		apply_f = lambda tpl: apply_expression_manager_list(tpl, expr_manager_list)
+	next_tuple = instrumentation.instrument("io.read", driver.nextTuple)
+	write_out = instrumentation.instrument("io.write", fd_out.write)
+	write_null_mask = instrumentation.instrument("io.write_null_mask", fd_null_mask.write)
+	if columns_writer is not None:
+		append_columns = instrumentation.instrument("io.write_compressed_columns", columns_writer.append_tpl)
+
 	while True:
-		line = driver.nextTuple()
+		line = next_tuple()
 		if line is None:
 			break
 		total_tuple_count += 1
 
 		in_tpl = line.split(fdelim)
 
-		out_tpl = apply_expression_manager_list(in_tpl, expr_manager_list)
+		out_tpl = apply_f(in_tpl)
 		if out_tpl is None:
 			continue
 		valid_tuple_count += 1
 
 		null_mask = ["1" if attr == null_value else "0" for attr in in_tpl]
 
+		if row_index_writer is not None:
+			row_index_writer.add(fd_out, fd_null_mask)
+
 		line_new = fdelim.join(out_tpl)
-		fd_out.write(line_new + "\n")
+		write_out(line_new + "\n")
 
 		line_new = fdelim.join(null_mask)
-		fd_null_mask.write(line_new + "\n")
+		write_null_mask(line_new + "\n")
+
+		if columns_writer is not None:
+			append_columns(out_tpl)
+
+		if drift_monitor is not None:
+			drift_monitor.feed(line)
 
 		# debug: print progress
 		if total_tuple_count % 100000 == 0:
@@ -315,9 +829,50 @@ def driver_loop(driver, expr_manager_list, fdelim, null_value, fd_out, fd_null_m
 				float(valid_tuple_count) / 1000000))
 		# end-debug
 
+	if drift_monitor is not None:
+		drift_monitor.end_window()
+
 	return (total_tuple_count, valid_tuple_count)
 
 
+def save_adaptive_expr_trees(expression_tree, dec_tree, expr_manager_list, output_dir, tree_format):
+	"""
+	Writes the expression trees with the operator info extended during
+	compression (see ExpressionManager NOTE-5) to <output_dir>/{c_tree,dec_tree}.<ext>;
+	the output of this run can only be decompressed with this dec_tree
+
+	NOTE: the decompression node of a compression node is the one that
+		  consumes its output columns (see PatternDetector.get_decompression_node())
+
+	Returns: list(node_id) of the extended compression nodes
+	"""
+	dec_node_ids = {}
+	for dec_node_id, dec_n in dec_tree.nodes.items():
+		dec_node_ids[tuple(c.col_id for c in dec_n.cols_in_consumed)] = dec_node_id
+
+	extended_node_ids = []
+	for expr_mgr, level in zip(expr_manager_list, expression_tree.levels):
+		for expr_n_item, node_id in zip(expr_mgr.expr_nodes, level):
+			adaptive = expr_n_item["adaptive"]
+			if adaptive is None or not adaptive.is_extended():
+				continue
+			expr_n = expr_n_item["expr_n"]
+			dec_node_key = tuple(c.col_id for c in expr_n.cols_out)
+			if dec_node_key not in dec_node_ids:
+				raise Exception("Decompression node not found: node_id={}, cols_out={}".format(node_id, dec_node_key))
+			operator_info = adaptive.get_operator_info()
+			pd = get_pattern_detector(expr_n.p_id)
+			expression_tree.update_operator_info(node_id, operator_info)
+			dec_tree.update_operator_info(dec_node_ids[dec_node_key], pd.get_operator_dec_info(operator_info))
+			extended_node_ids.append(node_id)
+
+	if not os.path.exists(output_dir):
+		os.makedirs(output_dir)
+	write_expr_tree(expression_tree, get_expr_tree_file(output_dir, "c_tree", tree_format), tree_format)
+	write_expr_tree(dec_tree, get_expr_tree_file(output_dir, "dec_tree", tree_format), tree_format)
+	return extended_node_ids
+
+
 def parse_args():
 	parser = argparse.ArgumentParser(
 		description="""Detect column patterns in CSV file."""
@@ -344,6 +899,37 @@ def parse_args():
 		help="Use <fdelim> as delimiter between fields", default="|")
 	parser.add_argument("--null", dest="null", type=str,
 		help="Interprets <NULL> as NULLs", default="null")
+	parser.add_argument("--operator-order", dest="operator_order", type=str, choices=OPERATOR_ORDERS,
+		help="Order in which the nodes with the same input columns are tried (see ExpressionManager); coverage and adaptive are opt-in", default="tree")
+	parser.add_argument("--no-operator-dispatch", dest="operator_dispatch", action='store_false',
+		help="Disable the pre-dispatch check of the operators")
+	parser.add_argument("--no-fused", dest="fused", action='store_false',
+		help="Apply the levels of the expression tree one after the other instead of the fused program")
+	parser.add_argument("--compressed-columns", dest="compressed_columns", action='store_true',
+		help="Also write the output columns compressed (Dict, RLE, FOR) to <output-dir>/<out-table-name>.columns/")
+	parser.add_argument("--block-size", dest="block_size", type=int,
+		help="Number of rows per block of the compressed columns; each block is encoded with its best codec (default: lib.column_codecs.DEFAULT_BLOCK_SIZE)")
+	parser.add_argument("--row-index-interval", dest="row_index_interval", type=int,
+		help="Write the offsets of every <row-index-interval>-th row to <output-dir>/<out-table-name>.row_index.bin (see lib/row_index.py); 0: disable", default=DEFAULT_ROW_INDEX_INTERVAL)
+	parser.add_argument("--adaptive-dict", dest="adaptive_dict", action='store_true',
+		help="Add the values that are not in the dictionaries to them (see AdaptiveDictionary); the extended trees are written to <output-dir>/<out-table-name>.expr_tree/")
+	parser.add_argument("--adaptive-dict-max-size", dest="adaptive_dict_max_size", type=int,
+		help="Maximum size (bytes) of an adaptive dictionary", default=DEFAULT_ADAPTIVE_DICT_MAX_SIZE)
+	parser.add_argument("--dec-tree-file", dest="dec_tree_file", type=str,
+		help="Decompression tree of <expr-tree-file>; required with --adaptive-dict")
+	parser.add_argument("--tree-format", dest="tree_format", type=str, choices=TREE_FORMATS,
+		help="Format of the extended expression tree files (--adaptive-dict)", default="binary")
+	parser.add_argument("--drift-window", dest="drift_window", type=int,
+		help="Check the exception rate of each expression node every <drift-window> rows (see DriftMonitor); 0: disable (default); e.g. 100000", default=DEFAULT_DRIFT_WINDOW)
+	parser.add_argument("--drift-max-exception-rate", dest="drift_max_exception_rate", type=float,
+		help="Drift alarm if the exception rate of a node in a window is above <drift-max-exception-rate>", default=None)
+	parser.add_argument("--drift-max-exception-rate-increase", dest="drift_max_exception_rate_increase", type=float,
+		help="Drift alarm if the exception rate of a node in a window is above its learned exception rate + <drift-max-exception-rate-increase>", default=DEFAULT_DRIFT_MAX_EXCEPTION_RATE_INCREASE)
+	parser.add_argument("--drift-relearn-dir", dest="drift_relearn_dir", type=str,
+		help="On drift alarms, learn a new expression tree from a sample of the window in <drift-relearn-dir>/window_<idx>.expr_tree/")
+	parser.add_argument("--drift-sample-size", dest="drift_sample_size", type=int,
+		help="Number of rows of the window sample used for re-learning", default=DEFAULT_DRIFT_SAMPLE_SIZE)
+	add_instrumentation_arguments(parser)
 
 	return parser.parse_args()
 
@@ -351,6 +937,9 @@ def parse_args():
 def main():
 	args = parse_args()
 	print(args)
+	instrumentation.enable_from_args(args)
+	if args.adaptive_dict and args.dec_tree_file is None:
+		raise Exception("--adaptive-dict requires --dec-tree-file")
 
 	with open(args.header_file, 'r') as fd:
 		header = list(map(lambda x: x.strip(), fd.readline().split(args.fdelim)))
@@ -382,10 +971,21 @@ def main():
 	in_columns = columns
 	for idx, level in enumerate(expression_tree.levels):
 		expr_nodes = [expression_tree.get_node(node_id) for node_id in level]
-		expr_manager = ExpressionManager(in_columns, expr_nodes, args.null)
+		expr_manager = ExpressionManager(in_columns, expr_nodes, args.null, args.operator_order, args.operator_dispatch,
+			args.adaptive_dict_max_size if args.adaptive_dict else None)
+		expr_manager.apply_expressions = instrumentation.instrument("level_{}.apply_expressions".format(idx), expr_manager.apply_expressions)
 		expr_manager_list.append(expr_manager)
 		# out_columns becomes in_columns for the next level
 		in_columns = expr_manager.get_out_columns()
+	fused_program = FusedExpressionProgram(expr_manager_list, args.null) if args.fused else None
+	drift_monitor = None
+	if args.drift_window > 0:
+		relearn_args = ["--header-file", args.header_file, "--datatypes-file", args.datatypes_file, "-F", args.fdelim, "--null", args.null]
+		if args.drift_relearn_dir is not None and not os.path.exists(args.drift_relearn_dir):
+			os.makedirs(args.drift_relearn_dir)
+		drift_monitor = DriftMonitor(expr_manager_list, expression_tree.levels, args.drift_window,
+			args.drift_max_exception_rate, args.drift_max_exception_rate_increase,
+			args.drift_relearn_dir, args.drift_sample_size, relearn_args)
 
 	# generate header and schema files with output columns
 	out_header_file = os.path.join(args.output_dir, "{}.header.csv".format(args.out_table_name))
@@ -398,6 +998,16 @@ def main():
 	# apply expression tree and generate the new csv file
 	output_file = os.path.join(args.output_dir, "{}.csv".format(args.out_table_name))
 	null_mask_file = os.path.join(args.output_dir, "{}.nulls.csv".format(args.out_table_name))
+	row_index_writer = RowIndexWriter(args.row_index_interval) if args.row_index_interval > 0 else None
+	columns_writer = None
+	if args.compressed_columns:
+		# NOTE: column_codecs needs numpy; import it only when used
+		from lib.column_codecs import CompressedColumnsWriter, DEFAULT_BLOCK_SIZE
+		block_size = args.block_size if args.block_size is not None else DEFAULT_BLOCK_SIZE
+		columns_dir = os.path.join(args.output_dir, "{}.columns".format(args.out_table_name))
+		if not os.path.exists(columns_dir):
+			os.makedirs(columns_dir)
+		columns_writer = CompressedColumnsWriter(expr_manager_list[-1].get_out_columns(), columns_dir, args.null, block_size)
 	try:
 		if args.file is None:
 			fd_in = os.fdopen(os.dup(sys.stdin.fileno()))
@@ -405,14 +1015,30 @@ def main():
 			fd_in = open(args.file, 'r')
 		driver = FileDriver(fd_in)
 		with open(output_file, 'w') as fd_out, open(null_mask_file, 'w') as fd_null_mask:
-			(total_tuple_count, valid_tuple_count) = driver_loop(driver, expr_manager_list, args.fdelim, args.null, fd_out, fd_null_mask)
+			with instrumentation.timer("stage.driver_loop"):
+				(total_tuple_count, valid_tuple_count) = driver_loop(driver, expr_manager_list, args.fdelim, args.null, fd_out, fd_null_mask, columns_writer, fused_program, drift_monitor, row_index_writer)
 	finally:
 		try:
 			fd_in.close()
 		except:
 			pass
+		if columns_writer is not None:
+			with instrumentation.timer("io.close_compressed_columns"):
+				columns_writer.close()
+
+	if row_index_writer is not None:
+		row_index_writer.write(os.path.join(args.output_dir, "{}.row_index.bin".format(args.out_table_name)))
+
+	if args.adaptive_dict:
+		adaptive_expr_tree_dir = os.path.join(args.output_dir, "{}.expr_tree".format(args.out_table_name))
+		with instrumentation.timer("io.write_adaptive_expr_trees"):
+			extended_node_ids = save_adaptive_expr_trees(expression_tree, read_expr_tree(args.dec_tree_file), expr_manager_list,
+				adaptive_expr_tree_dir, args.tree_format)
+		print("[adaptive_dict] extended_node_ids={}, expr_tree_dir={}".format(extended_node_ids, adaptive_expr_tree_dir))
 
 	# output stats
+	if fused_program is not None:
+		fused_program.update_null_stats()
 	valid_tuple_ratio = float(valid_tuple_count) / total_tuple_count if total_tuple_count > 0 else float("inf")
 	out_columns_stats = expr_manager_list[-1].get_stats(valid_tuple_count, total_tuple_count)["out_columns"]
 	stats = {
@@ -424,9 +1050,16 @@ def main():
 	}
 	for level, expr_mgr in enumerate(expr_manager_list):
 		stats["level_stats"][level] = expr_mgr.get_stats(valid_tuple_count, total_tuple_count)
+	if columns_writer is not None:
+		stats["compressed_columns"] = columns_writer.get_stats()
+	if drift_monitor is not None:
+		with instrumentation.timer("drift.relearn_wait"):
+			drift_monitor.wait()
+		stats["drift"] = drift_monitor.get_stats()
 	stats_file = os.path.join(args.output_dir, "{}.stats.json".format(args.out_table_name))
 	with open(stats_file, 'w') as fd_s:
 		json.dump(stats, fd_s, indent=2)
+	instrumentation.dump_report(os.path.join(args.output_dir, "{}.instrumentation.json".format(args.out_table_name)))
 
 	print("total_tuple_count={}, valid_tuple_count={}".format(total_tuple_count, valid_tuple_count))
 
@@ -461,7 +1094,7 @@ table=Generico_2
 
 
 ================================================================================
-expr_tree_file=$wbs_dir/$wb/$table.expr_tree/c_tree.json
+expr_tree_file=$wbs_dir/$wb/$table.expr_tree/c_tree.bin
 out_table="${table}_out"
 
 # [apply-expression]
@@ -478,6 +1111,27 @@ time ./pattern_detection/apply_expression.py --expr-tree-file $expr_tree_file --
 
 cat $output_dir/$out_table.stats.json | less
 
+# [apply-expression-drift]
+# drift alarms & re-learning on a sample of the offending windows
+input_file=$wbs_dir/$wb/$table.csv
+output_dir=$wbs_dir/$wb/$table.poc_1_out
+mkdir -p $output_dir && \
+time ./pattern_detection/apply_expression.py --expr-tree-file $expr_tree_file --header-file $repo_wbs_dir/$wb/samples/$table.header-renamed.csv --datatypes-file $repo_wbs_dir/$wb/samples/$table.datatypes.csv --output-dir $output_dir --out-table-name $out_table \
+--drift-window 100000 --drift-max-exception-rate-increase 0.05 --drift-relearn-dir $output_dir/drift \
+$input_file
+
+cat $output_dir/$out_table.stats.json | jq .drift
+
+# [apply-expression-adaptive-dict]
+# decompress with $output_dir/$out_table.expr_tree/dec_tree.bin
+input_file=$wbs_dir/$wb/$table.csv
+output_dir=$wbs_dir/$wb/$table.poc_1_out
+dec_tree_file=$wbs_dir/$wb/$table.expr_tree/dec_tree.bin
+mkdir -p $output_dir && \
+time ./pattern_detection/apply_expression.py --expr-tree-file $expr_tree_file --header-file $repo_wbs_dir/$wb/samples/$table.header-renamed.csv --datatypes-file $repo_wbs_dir/$wb/samples/$table.datatypes.csv --output-dir $output_dir --out-table-name $out_table \
+--adaptive-dict --dec-tree-file $dec_tree_file \
+$input_file
+
 
 # [load & evaluation]
 n_input_file=$output_dir/$out_table.csv
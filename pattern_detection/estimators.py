@@ -3,7 +3,6 @@ import sys
 from copy import deepcopy
 import math
 from statistics import mean, median
-import numpy as np
 from collections import Counter, defaultdict
 from overrides import overrides
 
@@ -12,6 +11,8 @@ sys.path.insert(1, SCRIPT_DIR)
 
 from pattern_detection.lib.util import *
 from pattern_detection.lib.datatype_analyzer import *
+# NOTE: numpy is only loaded when a bit-packing estimator is evaluated
+bitpacking = LazyModule("pattern_detection.lib.bitpacking")
 
 
 class Estimator(object):
@@ -52,6 +53,26 @@ class Estimator(object):
 			attr = tpl[idx]
 			self.handle_attr(attr, idx)
 
+	def handle_column(self, attrs, idx):
+		'''Handles all the attributes of a column at once
+
+		NOTE: estimators that can process a whole column faster than one attr
+			  at a time should override this method
+		'''
+		for attr in attrs:
+			self.handle_attr(attr, idx)
+
+	def feed_columns(self, columns, row_count):
+		'''Columnar alternative to feed_tuple()
+
+		Params:
+			columns: list(list(attr)) where columns[idx] holds all the attrs of column idx
+			row_count: number of rows in each column
+		'''
+		self.row_count += row_count
+		for idx in self.columns.keys():
+			self.handle_column(columns[idx], idx)
+
 	def evaluate(self):
 		'''Estimates size based on the data fed so far
 
@@ -556,6 +577,12 @@ class RleEstimatorTest(EstimatorTest):
 
 
 class ForEstimatorTrain(EstimatorTrain):
+	"""
+	NOTE: the size of (val - reference) grows with val, except for decimals,
+		  where it also depends on the exponent of val; thus, it is enough to
+		  keep the max value for each exponent, instead of storing all attrs
+		  for a second pass in evaluate_col()
+	"""
 	def __init__(self, columns, null_value):
 		EstimatorTrain.__init__(self, columns, null_value)
 
@@ -567,10 +594,16 @@ class ForEstimatorTrain(EstimatorTrain):
 	def empty_col_item(cls, col):
 		res = Estimator.empty_col_item(col)
 		res["reference"] = float("inf")
-		res["attrs"] = []
+		res["max_values"] = {}
 		res["max_diff_size"] = 1
 		return res
 
+	@classmethod
+	def get_value_key(cls, val):
+		if isinstance(val, Decimal):
+			return val.as_tuple().exponent
+		return None
+
 	@overrides
 	def handle_attr(self, attr, idx):
 		col = self.columns[idx]
@@ -579,13 +612,14 @@ class ForEstimatorTrain(EstimatorTrain):
 			return True
 		col["valid_count"] += 1
 
-		# store attr to compute difference in the evaluation step
-		col["attrs"].append(attr)
-
 		val = DatatypeCast.cast(attr, col["info"].datatype)
 		# update reference value
 		if val < col["reference"]:
 			col["reference"] = val
+		# update max value; used to compute max_diff_size in the evaluation step
+		key = self.get_value_key(val)
+		if key not in col["max_values"] or val > col["max_values"][key]:
+			col["max_values"][key] = val
 
 		return True
 
@@ -594,9 +628,8 @@ class ForEstimatorTrain(EstimatorTrain):
 		reference = col_item["reference"]
 		hint = DatatypeAnalyzer.get_value_size_hint(col_item["info"].datatype)
 
-		# compute differences & max_diff_size
-		for attr in col_item["attrs"]:
-			val = DatatypeCast.cast(attr, col_item["info"].datatype)
+		# compute max_diff_size
+		for val in col_item["max_values"].values():
 			diff = val - reference
 			diff_size = DatatypeAnalyzer.get_value_size(diff, hint=hint, bits=True)
 			if diff_size > col_item["max_diff_size"]:
@@ -672,3 +705,257 @@ class ForEstimatorTest(EstimatorTest):
 	def get_exceptions_size(self, col_item):
 		datatype_size = DatatypeAnalyzer.get_datatype_size(col_item["info"].datatype)
 		return datatype_size * col_item["exception_count"]
+
+
+# =========================================================================== #
+# BitPacking (base classes for Pfor, Delta, DeltaFor)
+# =========================================================================== #
+
+
+class BitPackingEstimatorTrain(EstimatorTrain):
+	"""
+	Base class for estimators that bit-pack integer columns; the (non-null)
+	values are buffered and evaluated with the vectorized kernels in
+	lib/bitpacking.py
+	"""
+	def __init__(self, columns, null_value):
+		EstimatorTrain.__init__(self, columns, null_value)
+
+	@classmethod
+	def select_column(cls, col):
+		return NumericDatatype.is_integer_datatype(col.datatype)
+
+	@classmethod
+	def empty_col_item(cls, col):
+		res = EstimatorTrain.empty_col_item(col)
+		res["values"] = []
+		return res
+
+	@overrides
+	def handle_attr(self, attr, idx):
+		col = self.columns[idx]
+
+		if attr == self.null_value:
+			return True
+		col["valid_count"] += 1
+
+		col["values"].append(int(attr))
+
+		return True
+
+	@overrides
+	def handle_column(self, attrs, idx):
+		col = self.columns[idx]
+		values = [int(attr) for attr in attrs if attr != self.null_value]
+		col["valid_count"] += len(values)
+		col["values"].extend(values)
+
+
+class BitPackingEstimatorTest(EstimatorTest):
+	def __init__(self, columns, metadata, null_value):
+		EstimatorTest.__init__(self, columns, metadata, null_value)
+
+	@classmethod
+	def supports_exceptions(cls):
+		return True
+
+	@classmethod
+	def empty_col_item(cls, col):
+		res = EstimatorTest.empty_col_item(col)
+		res["values"] = []
+		res["packed_count"] = 0
+		res["exception_count"] = 0
+		return res
+
+	@overrides
+	def handle_attr(self, attr, idx):
+		col = self.columns[idx]
+
+		if attr == self.null_value:
+			return True
+		col["valid_count"] += 1
+
+		col["values"].append(int(attr))
+
+		return True
+
+	@overrides
+	def handle_column(self, attrs, idx):
+		col = self.columns[idx]
+		values = [int(attr) for attr in attrs if attr != self.null_value]
+		col["valid_count"] += len(values)
+		col["values"].extend(values)
+
+	@overrides
+	def evaluate_col(self, col_item):
+		col_metadata = self.metadata[col_item["info"].col_id]
+		values = bitpacking.to_int_array(col_item["values"])
+		(col_item["packed_count"], col_item["exception_count"]) = self.count_packed(values, col_metadata)
+		# call super method
+		return EstimatorTest.evaluate_col(self, col_item)
+
+	def count_packed(self, values, col_metadata):
+		"""
+		Returns: (packed_count, exception_count)
+		"""
+		raise Exception("Not implemented")
+
+	@overrides
+	def get_values_size(self, col_item):
+		col_metadata = self.metadata[col_item["info"].col_id]
+		res_bits = col_metadata["bit_width"] * col_item["packed_count"]
+		return math.ceil(res_bits / 8)
+
+	@overrides
+	def get_exceptions_size(self, col_item):
+		datatype_size = DatatypeAnalyzer.get_datatype_size(col_item["info"].datatype)
+		return datatype_size * col_item["exception_count"]
+
+
+# =========================================================================== #
+# Pfor
+# =========================================================================== #
+
+
+class PforEstimatorTrain(BitPackingEstimatorTrain):
+	"""
+	Patched FOR: like FOR, but the bit width is chosen such that (at least) a
+	percentile of the values fit in it; the rest of the values are exceptions
+	"""
+	def __init__(self, columns, null_value, percentile):
+		BitPackingEstimatorTrain.__init__(self, columns, null_value)
+		self.percentile = percentile
+
+	@overrides
+	def get_metadata(self, col_item):
+		values = bitpacking.to_int_array(col_item["values"])
+		if len(values) == 0:
+			return {
+				"reference": 0,
+				"bit_width": 1
+			}
+
+		reference = int(values.min())
+		offsets = bitpacking.to_offsets(values, reference)
+		return {
+			"reference": reference,
+			"bit_width": bitpacking.percentile_bit_width(offsets, self.percentile)
+		}
+
+
+class PforEstimatorTest(BitPackingEstimatorTest):
+	def __init__(self, columns, metadata, null_value):
+		BitPackingEstimatorTest.__init__(self, columns, metadata, null_value)
+
+	@classmethod
+	def select_column(cls, col):
+		return PforEstimatorTrain.select_column(col)
+
+	@overrides
+	def count_packed(self, values, col_metadata):
+		# NOTE: values smaller than the reference wrap around and become exceptions
+		offsets = bitpacking.to_offsets(values, col_metadata["reference"])
+		exception_count = int(bitpacking.exception_mask(offsets, col_metadata["bit_width"]).sum())
+		return (len(values) - exception_count, exception_count)
+
+	@overrides
+	def get_metadata_size(self, col_item):
+		# reference + bit width
+		return 8 + 1
+
+
+# =========================================================================== #
+# Delta
+# =========================================================================== #
+
+
+class DeltaEstimatorTrain(BitPackingEstimatorTrain):
+	"""
+	Stores the first value and the (zigzag encoded) differences between
+	consecutive values
+	"""
+	def __init__(self, columns, null_value):
+		BitPackingEstimatorTrain.__init__(self, columns, null_value)
+
+	@overrides
+	def get_metadata(self, col_item):
+		values = bitpacking.to_int_array(col_item["values"])
+		return {
+			"bit_width": bitpacking.max_bit_width(bitpacking.zigzag_encode(bitpacking.deltas(values)))
+		}
+
+
+class DeltaEstimatorTest(BitPackingEstimatorTest):
+	def __init__(self, columns, metadata, null_value):
+		BitPackingEstimatorTest.__init__(self, columns, metadata, null_value)
+
+	@classmethod
+	def select_column(cls, col):
+		return DeltaEstimatorTrain.select_column(col)
+
+	@overrides
+	def count_packed(self, values, col_metadata):
+		if len(values) == 0:
+			return (0, 0)
+		# NOTE: the first value is stored in full, as an exception
+		zz_deltas = bitpacking.zigzag_encode(bitpacking.deltas(values))
+		exception_count = int(bitpacking.exception_mask(zz_deltas, col_metadata["bit_width"]).sum())
+		return (len(zz_deltas) - exception_count, exception_count + 1)
+
+	@overrides
+	def get_metadata_size(self, col_item):
+		# bit width
+		return 1
+
+
+# =========================================================================== #
+# DeltaFor
+# =========================================================================== #
+
+
+class DeltaForEstimatorTrain(BitPackingEstimatorTrain):
+	"""
+	Delta followed by FOR on the differences; constant-stride columns (e.g.
+	ids, timestamps) pack into a single bit per value
+	"""
+	def __init__(self, columns, null_value):
+		BitPackingEstimatorTrain.__init__(self, columns, null_value)
+
+	@overrides
+	def get_metadata(self, col_item):
+		values_deltas = bitpacking.deltas(bitpacking.to_int_array(col_item["values"]))
+		if len(values_deltas) == 0:
+			return {
+				"reference": 0,
+				"bit_width": 1
+			}
+
+		reference = int(values_deltas.min())
+		offsets = bitpacking.to_offsets(values_deltas, reference)
+		return {
+			"reference": reference,
+			"bit_width": bitpacking.max_bit_width(offsets)
+		}
+
+
+class DeltaForEstimatorTest(BitPackingEstimatorTest):
+	def __init__(self, columns, metadata, null_value):
+		BitPackingEstimatorTest.__init__(self, columns, metadata, null_value)
+
+	@classmethod
+	def select_column(cls, col):
+		return DeltaForEstimatorTrain.select_column(col)
+
+	@overrides
+	def count_packed(self, values, col_metadata):
+		if len(values) == 0:
+			return (0, 0)
+		# NOTE: the first value is stored in full, as an exception
+		offsets = bitpacking.to_offsets(bitpacking.deltas(values), col_metadata["reference"])
+		exception_count = int(bitpacking.exception_mask(offsets, col_metadata["bit_width"]).sum())
+		return (len(offsets) - exception_count, exception_count + 1)
+
+	@overrides
+	def get_metadata_size(self, col_item):
+		# reference + bit width
+		return 8 + 1
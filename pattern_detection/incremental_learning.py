@@ -0,0 +1,382 @@
+import os
+import re
+import sys
+import json
+import random
+import string
+from collections import Counter
+from lib.util import *
+from lib.expression_tree import ExpressionTree, read_expr_tree, write_expr_tree, get_expr_tree_file
+
+
+"""
+Incremental learning: updates the expression tree of a table with the rows of
+a new partition, without re-reading the data it was learned from
+
+Learning state (persisted in the expression tree output dir):
+	- for each input column, the statistics of the data its subtree was
+	  learned from (ColumnStats: nulls, value dictionary, value formats)
+	- a reservoir sample of all the rows seen so far (the data the drifted
+	  columns are re-learned from)
+	- the versions of the expression tree: versions/v_<N>/{c_tree,dec_tree}.<ext>,
+	  with the diff to the previous version (diff.json)
+
+Update with a new partition:
+	1) the statistics of the partition are compared with the learning time
+	   statistics of each column (get_drift()); columns with a drift score
+	   above the threshold are re-learned
+	2) the re-learned columns are extended to the whole connected components
+	   of the tree they are part of (e.g. column correlations), so that the
+	   kept subtrees do not depend on re-learned ones
+	3) the subtrees of the other columns are kept as they are
+NOTE: without drift the tree is not changed and no version is written
+"""
+STATE_FILE = "learning_state.json"
+SAMPLE_FILE = "learning_state.sample.csv"
+VERSIONS_DIR = "versions"
+DIFF_FILE = "diff.json"
+DEFAULT_DRIFT_THRESHOLD = 0.1
+DEFAULT_MAX_DICT_SIZE = 64 * 1024
+# NOTE: same as the DictPattern config; new values are only a drift for dictionary-like columns
+DICT_MAX_KEY_RATIO = 0.1
+# value format: digits -> D, letters -> A, runs collapsed (e.g. "AB-0012" -> "A-D")
+# NOTE: without the lengths; e.g. growing ids (999 -> 1000) are not a drift
+FORMAT_TABLE = str.maketrans(string.digits + string.ascii_letters, "D" * len(string.digits) + "A" * len(string.ascii_letters))
+FORMAT_RUN_REGEX = re.compile(r"([DA])\1+")
+OTHER_KEY = "__other__"
+
+
+class ColumnStats(object):
+	"""
+	Counters of the values of a column; the value dictionary and the formats
+	have at most <max_dict_size> keys, the other values are counted in
+	<overflow_count> (and under OTHER_KEY for the formats)
+	"""
+	def __init__(self, max_dict_size=DEFAULT_MAX_DICT_SIZE):
+		self.max_dict_size = max_dict_size
+		self.nb_rows = 0
+		self.nb_nulls = 0
+		self.values = Counter()
+		self.overflow_count = 0
+		self.formats = Counter()
+
+	def feed(self, attr, null_value):
+		self.nb_rows += 1
+		if attr == null_value:
+			self.nb_nulls += 1
+			return
+		if attr in self.values or len(self.values) < self.max_dict_size:
+			self.values[attr] += 1
+		else:
+			self.overflow_count += 1
+		fmt = FORMAT_RUN_REGEX.sub(r"\1", attr.translate(FORMAT_TABLE))
+		if fmt in self.formats or len(self.formats) < self.max_dict_size:
+			self.formats[fmt] += 1
+		else:
+			self.formats[OTHER_KEY] += 1
+
+	def to_dict(self):
+		return {
+			"max_dict_size": self.max_dict_size,
+			"nb_rows": self.nb_rows,
+			"nb_nulls": self.nb_nulls,
+			"values": self.values,
+			"overflow_count": self.overflow_count,
+			"formats": self.formats
+		}
+
+	@classmethod
+	def from_dict(cls, in_d):
+		res = cls(in_d["max_dict_size"])
+		res.nb_rows = in_d["nb_rows"]
+		res.nb_nulls = in_d["nb_nulls"]
+		res.values = Counter(in_d["values"])
+		res.overflow_count = in_d["overflow_count"]
+		# NOTE: collapse the runs of the formats saved with their lengths
+		for fmt, count in in_d["formats"].items():
+			res.formats[FORMAT_RUN_REGEX.sub(r"\1", fmt)] += count
+		return res
+
+	@classmethod
+	def from_tuples(cls, tuples, columns, null_value):
+		"""
+		Returns: dict(col_id: ColumnStats)
+		NOTE: tuples with an invalid number of attributes are ignored
+		"""
+		stats = [cls() for col in columns]
+		for tpl in tuples:
+			if len(tpl) != len(columns):
+				continue
+			for idx, attr in enumerate(tpl):
+				stats[idx].feed(attr, null_value)
+		return {col.col_id: stats[idx] for idx, col in enumerate(columns)}
+
+
+def get_drift(ref, new):
+	"""
+	Params:
+		ref: ColumnStats of the data the column was learned from
+		new: ColumnStats of the new data
+	Returns: dict with the drift metrics (in [0, 1]):
+		- null_ratio: difference between the null ratios
+		- format_distance: total variation distance between the format distributions
+		- new_value_ratio: ratio of non-null new values missing from the reference
+		  dictionary (i.e. dictionary exceptions); None if <ref> is not
+		  dictionary-like (more than DICT_MAX_KEY_RATIO distinct values) or its
+		  dictionary is incomplete
+		- score: maximum of the metrics
+	"""
+	res = {"null_ratio": 0.0, "format_distance": 0.0, "new_value_ratio": None}
+	if ref.nb_rows == 0 or new.nb_rows == 0:
+		res["score"] = 1.0 if ref.nb_rows != new.nb_rows else 0.0
+		return res
+
+	res["null_ratio"] = abs(float(new.nb_nulls) / new.nb_rows - float(ref.nb_nulls) / ref.nb_rows)
+
+	ref_count, new_count = ref.nb_rows - ref.nb_nulls, new.nb_rows - new.nb_nulls
+	if ref_count > 0 and new_count > 0:
+		res["format_distance"] = 0.5 * sum(abs(float(ref.formats[fmt]) / ref_count - float(new.formats[fmt]) / new_count)
+										   for fmt in set(ref.formats.keys()) | set(new.formats.keys()))
+		if ref.overflow_count == 0 and len(ref.values) <= DICT_MAX_KEY_RATIO * ref_count:
+			missing_count = new.overflow_count + sum(count for value, count in new.values.items() if value not in ref.values)
+			res["new_value_ratio"] = float(missing_count) / new_count
+	elif ref_count != new_count:
+		res["format_distance"] = 1.0
+
+	res["score"] = max(v for v in res.values() if v is not None)
+	return res
+
+
+def get_node_key(expr_n):
+	return (expr_n.p_id,
+			expr_n.pattern_signature,
+			",".join(sorted([c.col_id for c in expr_n.cols_in])),
+			",".join(sorted([c.col_id for c in expr_n.cols_out])))
+
+
+def get_tree_diff(tree_a, tree_b):
+	"""
+	Returns: dict with the nodes and output columns added & removed from
+			 tree_a to tree_b; nodes are identified by pattern & columns
+			 (see get_node_key()); "changed": same node, other operator_info
+	"""
+	nodes_a = {get_node_key(n): n for n in tree_a.nodes.values()} if tree_a is not None else {}
+	nodes_b = {get_node_key(n): n for n in tree_b.nodes.values()}
+	out_columns_a = set(tree_a.get_out_columns()) if tree_a is not None else set()
+	out_columns_b = set(tree_b.get_out_columns())
+
+	def node_summary(key):
+		(p_id, pattern_signature, cols_in, cols_out) = key
+		return {"p_id": p_id, "cols_in": cols_in.split(","), "cols_out": cols_out.split(",") if cols_out else []}
+
+	changed = []
+	for key in sorted(nodes_a.keys() & nodes_b.keys()):
+		n_a, n_b = nodes_a[key], nodes_b[key]
+		# NOTE: kept nodes share the (maybe not loaded) operator_info with the previous tree
+		if n_a._operator_info is not n_b._operator_info and n_a.operator_info != n_b.operator_info:
+			changed.append(node_summary(key))
+
+	return {
+		"nodes": {
+			"added": [node_summary(key) for key in sorted(nodes_b.keys() - nodes_a.keys())],
+			"removed": [node_summary(key) for key in sorted(nodes_a.keys() - nodes_b.keys())],
+			"changed": changed
+		},
+		"out_columns": {
+			"added": sorted(out_columns_b - out_columns_a),
+			"removed": sorted(out_columns_a - out_columns_b)
+		}
+	}
+
+
+def get_relearn_columns(tree, drifted_col_ids):
+	"""
+	Returns: set(col_id): <drifted_col_ids> plus the input columns that are in
+			 the same connected component of <tree> with any of them
+	"""
+	res = set(drifted_col_ids)
+	for cc in tree.get_connected_components():
+		cc_in_columns = set(cc.get_in_columns())
+		if len(cc_in_columns & res) > 0:
+			res |= cc_in_columns
+	return res
+
+
+def replace_subtrees(tree, columns, relearn_tree):
+	"""
+	Returns: ExpressionTree with the subtrees of the input columns of
+			 <relearn_tree> replaced by <relearn_tree>
+
+	NOTE: output column ids only depend on the input column & the pattern (see
+		  OutputColumnManager), so the subtrees of <tree> and <relearn_tree> do
+		  not clash
+	"""
+	relearn_col_ids = set(relearn_tree.get_in_columns())
+	ccs = [cc for cc in tree.get_connected_components() if len(set(cc.get_in_columns()) & relearn_col_ids) == 0]
+	ccs.extend(relearn_tree.get_connected_components())
+	tree_res = ExpressionTree._unify_ccs(ccs, tree.type)
+
+	# add unused columns
+	for col in columns:
+		if col.col_id not in tree_res.columns:
+			tree_res._set_column(col.col_id, {
+				"col_info": col,
+				"output_of": [],
+				"input_of": []
+			})
+
+	return tree_res
+
+
+class IncrementalLearning(object):
+	"""
+	Usage:
+		inc = IncrementalLearning(state_dir, ...)
+		(compression_tree, report) = inc.learn(in_data_manager, columns, learn_f)
+		inc.save(compression_tree, decompression_tree, report)
+
+	NOTE: learn_f(in_data_manager, columns) -> compression tree of <columns>;
+		  used for the first learning and for the re-learning of drifted columns
+	"""
+	def __init__(self, state_dir, fdelim, null_value, drift_threshold=DEFAULT_DRIFT_THRESHOLD, sample_size=None, tree_format="binary"):
+		self.state_dir = state_dir
+		self.fdelim = fdelim
+		self.null_value = null_value
+		self.drift_threshold = drift_threshold
+		self.tree_format = tree_format
+		self.state = None
+		self.sample = []
+		self.sample_size = sample_size
+
+		state_file = os.path.join(state_dir, STATE_FILE)
+		if os.path.isfile(state_file):
+			with open(state_file, 'r') as fd:
+				self.state = json.load(fd)
+			with open(os.path.join(state_dir, SAMPLE_FILE), 'r') as fd:
+				self.sample = [line.rstrip('\r\n').split(fdelim) for line in fd]
+			if sample_size is None:
+				self.sample_size = self.state["sample_size"]
+
+	def add_to_sample(self, tuples):
+		"""
+		Reservoir sampling (algorithm R) over all the rows seen so far
+		"""
+		rand = random.Random(self.state["nb_rows_seen"])
+		for tpl in tuples:
+			self.state["nb_rows_seen"] += 1
+			if len(self.sample) < self.sample_size:
+				self.sample.append(tpl)
+				continue
+			idx = rand.randrange(self.state["nb_rows_seen"])
+			if idx < self.sample_size:
+				self.sample[idx] = tpl
+
+	def learn(self, in_data_manager, columns, learn_f):
+		"""
+		Returns: (compression_tree, report); report["changed"]: False if the
+				 tree of the previous version is returned as it is
+		"""
+		tuples = in_data_manager.tuples
+		stats = ColumnStats.from_tuples(tuples, columns, self.null_value)
+
+		# first version: learn from the input
+		if self.state is None:
+			print("[incremental] no learning state: learning from the input")
+			self.state = {
+				"version": 0,
+				"columns": [col.to_dict() for col in columns],
+				"nb_rows_seen": 0,
+				"sample_size": self.sample_size if self.sample_size is not None else len(tuples),
+				"ref_stats": {},
+				"history": []
+			}
+			self.sample_size = self.state["sample_size"]
+			self.add_to_sample(tuples)
+			compression_tree = learn_f(in_data_manager, columns)
+			self.state["ref_stats"] = {col_id: s.to_dict() for col_id, s in stats.items()}
+			report = {
+				"changed": True,
+				"nb_rows": len(tuples),
+				"drift": {},
+				"relearned_columns": [col.col_id for col in columns],
+				"diff": get_tree_diff(None, compression_tree)
+			}
+			return (compression_tree, report)
+
+		if [c["name"] for c in self.state["columns"]] != [col.name for col in columns]:
+			raise Exception("Columns do not match the learning state")
+		prev_tree = read_expr_tree(os.path.join(self.state_dir, self.state["c_tree_file"]))
+
+		# drift detection
+		drift = {}
+		for col in columns:
+			drift[col.col_id] = get_drift(ColumnStats.from_dict(self.state["ref_stats"][col.col_id]), stats[col.col_id])
+			drift[col.col_id]["drifted"] = drift[col.col_id]["score"] > self.drift_threshold
+		drifted_col_ids = [col_id for col_id, d in drift.items() if d["drifted"]]
+		print("[incremental] drifted columns: {}".format(drifted_col_ids))
+
+		self.add_to_sample(tuples)
+		report = {
+			"changed": False,
+			"nb_rows": len(tuples),
+			"drift": drift,
+			"relearned_columns": []
+		}
+		if len(drifted_col_ids) == 0:
+			print("[incremental] no drift: keeping version {}".format(self.state["version"]))
+			return (prev_tree, report)
+
+		# re-learn the drifted columns (and their connected components) from the sample
+		relearn_col_ids = get_relearn_columns(prev_tree, drifted_col_ids)
+		relearn_idxs = [idx for idx, col in enumerate(columns) if col.col_id in relearn_col_ids]
+		relearn_columns = [columns[idx] for idx in relearn_idxs]
+		print("[incremental] re-learning columns: {}".format([col.col_id for col in relearn_columns]))
+		sample_data_manager = DataManager()
+		for tpl in self.sample:
+			if len(tpl) == len(columns):
+				sample_data_manager.write_tuple([tpl[idx] for idx in relearn_idxs])
+		relearn_tree = learn_f(sample_data_manager, relearn_columns)
+		compression_tree = replace_subtrees(prev_tree, columns, relearn_tree)
+
+		# the re-learned columns are compared with the sample from now on
+		sample_stats = ColumnStats.from_tuples(sample_data_manager.tuples, relearn_columns, self.null_value)
+		for col_id, s in sample_stats.items():
+			self.state["ref_stats"][col_id] = s.to_dict()
+
+		report.update({
+			"changed": True,
+			"relearned_columns": [col.col_id for col in relearn_columns],
+			"diff": get_tree_diff(prev_tree, compression_tree)
+		})
+		return (compression_tree, report)
+
+	def save(self, compression_tree, decompression_tree, report, input_file=None):
+		"""
+		Writes the new tree version (if the tree changed), its diff & the learning state
+
+		Returns: version of the tree
+		"""
+		if report["changed"]:
+			self.state["version"] += 1
+			version_dir = os.path.join(VERSIONS_DIR, "v_{}".format(self.state["version"]))
+			if not os.path.exists(os.path.join(self.state_dir, version_dir)):
+				os.makedirs(os.path.join(self.state_dir, version_dir))
+			self.state["c_tree_file"] = get_expr_tree_file(version_dir, "c_tree", self.tree_format)
+			write_expr_tree(compression_tree, os.path.join(self.state_dir, self.state["c_tree_file"]), self.tree_format)
+			write_expr_tree(decompression_tree, os.path.join(self.state_dir, get_expr_tree_file(version_dir, "dec_tree", self.tree_format)), self.tree_format)
+			with open(os.path.join(self.state_dir, version_dir, DIFF_FILE), 'w') as fd:
+				json.dump(dict(version=self.state["version"], input_file=input_file, **report), fd, indent=2)
+
+		self.state["history"].append({
+			"version": self.state["version"],
+			"input_file": input_file,
+			"nb_rows": report["nb_rows"],
+			"relearned_columns": report["relearned_columns"]
+		})
+		with open(os.path.join(self.state_dir, STATE_FILE), 'w') as fd:
+			json.dump(self.state, fd)
+		with open(os.path.join(self.state_dir, SAMPLE_FILE), 'w') as fd:
+			for tpl in self.sample:
+				fd.write(self.fdelim.join(tpl) + "\n")
+
+		return self.state["version"]
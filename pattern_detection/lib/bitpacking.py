@@ -0,0 +1,142 @@
+import os
+import sys
+import math
+import numpy as np
+
+
+"""
+Vectorized bit-width kernels for integer columns
+
+NOTE: all kernels work on np.int64/np.uint64 arrays; differences that do not
+	  fit in int64 (e.g. max - min of a bigint column) are computed modulo
+	  2^64 and reinterpreted as np.uint64, which gives the exact result for
+	  non-negative differences
+"""
+POWERS_OF_TWO = np.array([1 << k for k in range(64)], dtype=np.uint64)
+MAX_BIT_WIDTH = 64
+# NOTE: a multiple of 8, so that the packed chunks are byte aligned
+PACK_CHUNK_SIZE = 8 * 1024
+
+
+def to_int_array(values):
+	return np.array(values, dtype=np.int64)
+
+
+def to_offsets(values, reference):
+	"""
+	Returns: values - reference as np.uint64; values must be >= reference
+	"""
+	return (values - np.int64(reference)).view(np.uint64)
+
+
+def bit_widths(values):
+	"""
+	Vectorized lib.util.nb_bits_int()
+
+	Params:
+		values: np.ndarray of non-negative integers
+	Returns:
+		np.ndarray with the number of bits needed for each value (at least 1)
+	"""
+	res = np.searchsorted(POWERS_OF_TWO, values.astype(np.uint64, copy=False), side="right")
+	return np.maximum(res, 1)
+
+
+def max_bit_width(values):
+	if len(values) == 0:
+		return 1
+	# NOTE: the bit width is monotonic in the value
+	return max(1, int(values.max()).bit_length())
+
+
+def bit_width_histogram(values):
+	"""
+	Returns: np.ndarray hist where hist[b] is the number of values with bit width b
+	"""
+	return np.bincount(bit_widths(values), minlength=MAX_BIT_WIDTH+1)
+
+
+def percentile_bit_width(values, percentile):
+	"""
+	Returns: smallest bit width that fits at least a percentile (in [0, 1]) of the values
+	"""
+	if len(values) == 0:
+		return 1
+	cumulative = np.cumsum(bit_width_histogram(values))
+	target = math.ceil(percentile * len(values))
+	b = int(np.searchsorted(cumulative, target, side="left"))
+	return max(1, min(b, MAX_BIT_WIDTH))
+
+
+def zigzag_encode(values):
+	"""
+	Maps signed integers to unsigned integers: 0, -1, 1, -2, 2, ... -> 0, 1, 2, 3, 4, ...
+	"""
+	values = values.astype(np.int64, copy=False)
+	return ((values << np.int64(1)) ^ (values >> np.int64(63))).view(np.uint64)
+
+
+def zigzag_decode(values):
+	values = values.astype(np.uint64, copy=False)
+	return ((values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(np.int64))
+
+
+def deltas(values):
+	return np.diff(values.astype(np.int64, copy=False))
+
+
+def exception_mask(offsets, bit_width):
+	"""
+	Returns: boolean np.ndarray marking the offsets that do not fit in bit_width bits
+	"""
+	if bit_width >= MAX_BIT_WIDTH:
+		return np.zeros(len(offsets), dtype=bool)
+	return offsets.astype(np.uint64, copy=False) >= np.uint64(1 << bit_width)
+
+
+def packed_size(count, bit_width):
+	"""
+	Returns: size in bytes of count values packed with bit_width bits each
+	"""
+	return math.ceil(count * bit_width / 8)
+
+
+def pack(values, bit_width):
+	"""
+	Packs non-negative integers into bit_width bits each, least significant
+	bit first
+
+	Returns: bytes of size packed_size(len(values), bit_width)
+
+	NOTE: packs PACK_CHUNK_SIZE values at a time; the bits of a chunk take
+		  len(chunk) x bit_width uint64 temporaries
+	"""
+	values = values.astype(np.uint64, copy=False)
+	shifts = np.arange(bit_width, dtype=np.uint64)
+	res = []
+	for start in range(0, len(values), PACK_CHUNK_SIZE):
+		bits = ((values[start:start + PACK_CHUNK_SIZE, None] >> shifts) & np.uint64(1)).astype(np.uint8)
+		res.append(np.packbits(bits.reshape(-1), bitorder="little").tobytes())
+	return b"".join(res)
+
+
+def unpack(buf, bit_width, count):
+	"""
+	Inverse of pack()
+
+	Returns: np.ndarray of count np.uint64 values
+
+	NOTE: unpacks PACK_CHUNK_SIZE values at a time, like pack()
+	"""
+	buf = np.frombuffer(buf, dtype=np.uint8)
+	shifts = np.arange(bit_width, dtype=np.uint64)
+	chunk_size_B = PACK_CHUNK_SIZE * bit_width // 8
+	res = np.empty(count, dtype=np.uint64)
+	for start in range(0, count, PACK_CHUNK_SIZE):
+		chunk_count = min(PACK_CHUNK_SIZE, count - start)
+		start_B = start * bit_width // 8
+		bits = np.unpackbits(buf[start_B:start_B + chunk_size_B], count=chunk_count * bit_width, bitorder="little")
+		bits = bits.reshape(chunk_count, bit_width).astype(np.uint64)
+		# NOTE: the shifted bits are disjoint, so the sum is the bitwise or
+		res[start:start + chunk_count] = (bits << shifts).sum(axis=1, dtype=np.uint64)
+	return res
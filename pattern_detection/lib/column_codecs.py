@@ -0,0 +1,411 @@
+import os
+import sys
+import struct
+import json
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(1, SCRIPT_DIR)
+
+from pattern_detection.lib.datatype_analyzer import *
+from pattern_detection.lib.bitpacking import *
+
+
+"""
+Pure numpy implementation of lightweight compression codecs over typed column
+arrays; the actual counterpart of the estimators in estimators.py
+
+Typed column arrays are either:
+	- np.int64 arrays, for integer columns
+	- np.ndarray(dtype=object) of str, for all other columns
+Nulls are kept in a separate null mask; the codecs never see them
+
+Column file format: a sequence of blocks, each one encoded with the codec that
+produced the smallest payload for it:
+	[uint32 header_size][header (json)][nulls (bit-packed)][payload]
+"""
+DEFAULT_BLOCK_SIZE = 64 * 1024
+INT_KIND = "int"
+STR_KIND = "str"
+
+
+def get_kind(values):
+	return INT_KIND if values.dtype == np.int64 else STR_KIND
+
+
+def encode_strings(values):
+	"""
+	Returns: (metadata, payload) where payload is the bit-packed utf-8 lengths
+			 followed by the concatenated utf-8 strings
+	"""
+	encoded = [v.encode("utf-8") for v in values]
+	lengths = np.array([len(v) for v in encoded], dtype=np.uint64)
+	bit_width = max_bit_width(lengths)
+	packed_lengths = pack(lengths, bit_width)
+	metadata = {
+		"bit_width": bit_width,
+		"lengths_size": len(packed_lengths)
+	}
+	return (metadata, packed_lengths + b"".join(encoded))
+
+
+def decode_strings(metadata, payload, count):
+	lengths_size = metadata["lengths_size"]
+	lengths = unpack(payload[:lengths_size], metadata["bit_width"], count)
+	ends = np.cumsum(lengths).tolist()
+	blob = payload[lengths_size:]
+	res = np.empty(count, dtype=object)
+	start = 0
+	for idx, end in enumerate(ends):
+		res[idx] = blob[start:end].decode("utf-8")
+		start = end
+	return res
+
+
+class Codec(object):
+	"""
+	Interface for column codecs; codecs are stateless
+
+	encode(values) -> (metadata, payload)
+		metadata: json serializable dict needed for decoding
+		payload: bytes
+	decode(metadata, payload, count) -> values
+	"""
+
+	@classmethod
+	def get_name(cls):
+		return cls.__name__[:-len("Codec")]
+
+	@classmethod
+	def supports(cls, values):
+		raise Exception("Not implemented")
+
+	@classmethod
+	def encode(cls, values):
+		raise Exception("Not implemented")
+
+	@classmethod
+	def decode(cls, metadata, payload, count):
+		raise Exception("Not implemented")
+
+
+class PlainCodec(Codec):
+	@classmethod
+	def supports(cls, values):
+		return True
+
+	@classmethod
+	def encode(cls, values):
+		kind = get_kind(values)
+		if kind == INT_KIND:
+			metadata, payload = {}, values.astype("<i8").tobytes()
+		else:
+			metadata, payload = encode_strings(values)
+		metadata["kind"] = kind
+		return (metadata, payload)
+
+	@classmethod
+	def decode(cls, metadata, payload, count):
+		if metadata["kind"] == INT_KIND:
+			return np.frombuffer(payload, dtype="<i8", count=count).astype(np.int64)
+		return decode_strings(metadata, payload, count)
+
+
+class DictCodec(Codec):
+	"""
+	Dictionary (plain encoded) followed by the bit-packed codes
+	"""
+
+	@classmethod
+	def supports(cls, values):
+		return True
+
+	@classmethod
+	def encode(cls, values):
+		dictionary, codes = np.unique(values, return_inverse=True)
+		bit_width = max_bit_width(np.array([max(0, len(dictionary) - 1)], dtype=np.uint64))
+		dict_metadata, dict_payload = PlainCodec.encode(dictionary)
+		metadata = {
+			"dict_size": len(dictionary),
+			"dict_metadata": dict_metadata,
+			"dict_payload_size": len(dict_payload),
+			"bit_width": bit_width
+		}
+		return (metadata, dict_payload + pack(codes, bit_width))
+
+	@classmethod
+	def decode(cls, metadata, payload, count):
+		dict_payload_size = metadata["dict_payload_size"]
+		dictionary = PlainCodec.decode(metadata["dict_metadata"], payload[:dict_payload_size], metadata["dict_size"])
+		codes = unpack(payload[dict_payload_size:], metadata["bit_width"], count)
+		return dictionary[codes.astype(np.int64)]
+
+
+class RleCodec(Codec):
+	"""
+	Run values (plain encoded) followed by the bit-packed run lengths
+	"""
+
+	@classmethod
+	def supports(cls, values):
+		return True
+
+	@classmethod
+	def encode(cls, values):
+		if len(values) == 0:
+			starts = np.array([], dtype=np.int64)
+		else:
+			starts = np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+		run_lengths = np.diff(np.append(starts, len(values)))
+		bit_width = max_bit_width(run_lengths)
+		run_metadata, run_payload = PlainCodec.encode(values[starts])
+		metadata = {
+			"run_count": len(starts),
+			"run_metadata": run_metadata,
+			"run_payload_size": len(run_payload),
+			"bit_width": bit_width
+		}
+		return (metadata, run_payload + pack(run_lengths, bit_width))
+
+	@classmethod
+	def decode(cls, metadata, payload, count):
+		run_payload_size, run_count = metadata["run_payload_size"], metadata["run_count"]
+		run_values = PlainCodec.decode(metadata["run_metadata"], payload[:run_payload_size], run_count)
+		run_lengths = unpack(payload[run_payload_size:], metadata["bit_width"], run_count)
+		return np.repeat(run_values, run_lengths.astype(np.int64))
+
+
+class ForCodec(Codec):
+	"""
+	Frame of reference: the minimum value followed by the bit-packed offsets
+	"""
+
+	@classmethod
+	def supports(cls, values):
+		return get_kind(values) == INT_KIND
+
+	@classmethod
+	def encode(cls, values):
+		reference = int(values.min()) if len(values) > 0 else 0
+		offsets = to_offsets(values, reference)
+		bit_width = max_bit_width(offsets)
+		metadata = {
+			"reference": reference,
+			"bit_width": bit_width
+		}
+		return (metadata, pack(offsets, bit_width))
+
+	@classmethod
+	def decode(cls, metadata, payload, count):
+		offsets = unpack(payload, metadata["bit_width"], count)
+		# NOTE: wraps around modulo 2^64, like to_offsets()
+		return offsets.view(np.int64) + np.int64(metadata["reference"])
+
+
+codec_list = [
+	PlainCodec,
+	DictCodec,
+	RleCodec,
+	ForCodec,
+]
+codec_map = {codec.get_name().lower(): codec for codec in codec_list}
+
+def get_codec(name):
+	if name.lower() not in codec_map:
+		raise Exception("Invalid codec name: {}".format(name))
+	return codec_map[name.lower()]
+
+
+def to_typed_array(attrs, datatype, null_value):
+	"""
+	Returns: (values, null_mask) where values is a typed column array (nulls
+			 replaced by a filler value) and null_mask a boolean np.ndarray
+
+	NOTE: integer columns fall back to str if any attr does not round-trip
+		  through int() (e.g. leading zeros), to keep the encoding lossless
+	"""
+	null_mask = np.array([attr == null_value for attr in attrs], dtype=bool)
+	if NumericDatatype.is_integer_datatype(datatype):
+		try:
+			ints = [0 if attr == null_value else int(attr) for attr in attrs]
+			if all(is_null or str(v) == attr for (v, attr, is_null) in zip(ints, attrs, null_mask)):
+				return (np.array(ints, dtype=np.int64), null_mask)
+		except (ValueError, OverflowError):
+			pass
+	values = np.empty(len(attrs), dtype=object)
+	values[:] = ["" if attr == null_value else attr for attr in attrs]
+	return (values, null_mask)
+
+
+def to_attrs(values, null_mask, null_value):
+	"""
+	Inverse of to_typed_array()
+	"""
+	return [null_value if is_null else str(v) for (v, is_null) in zip(values.tolist(), null_mask.tolist())]
+
+
+def encode_block(values, null_mask, codecs=None):
+	"""
+	Encodes the block with all the supported codecs and keeps the smallest result
+
+	Returns: (header, block) where block is the encoded block (bytes)
+	"""
+	if codecs is None:
+		codecs = codec_list
+
+	best = None
+	for codec in codecs:
+		if not codec.supports(values):
+			continue
+		(metadata, payload) = codec.encode(values)
+		if best is None or len(payload) < len(best[2]):
+			best = (codec, metadata, payload)
+	(codec, metadata, payload) = best
+
+	nulls = pack(null_mask, 1)
+	header = {
+		"count": len(values),
+		"codec": codec.get_name(),
+		"metadata": metadata,
+		"nulls_size": len(nulls),
+		"payload_size": len(payload)
+	}
+	header_bytes = json.dumps(header).encode("utf-8")
+
+	return (header, struct.pack("<I", len(header_bytes)) + header_bytes + nulls + payload)
+
+
+def read_block_header(fd):
+	"""
+	Returns: header of the next block or None at the end of the file; fd is
+			 positioned at the nulls of the block
+	"""
+	buf = fd.read(4)
+	if len(buf) == 0:
+		return None
+	(header_size,) = struct.unpack("<I", buf)
+	return json.loads(fd.read(header_size).decode("utf-8"))
+
+
+def decode_blocks(fd):
+	"""
+	Generator over the blocks of a column file
+
+	Yields: (header, values, null_mask)
+	"""
+	while True:
+		header = read_block_header(fd)
+		if header is None:
+			break
+		count = header["count"]
+		null_mask = unpack(fd.read(header["nulls_size"]), 1, count).astype(bool)
+		payload = fd.read(header["payload_size"])
+		values = get_codec(header["codec"]).decode(header["metadata"], payload, count)
+		yield (header, values, null_mask)
+
+
+def read_column_file(in_file, null_value):
+	"""
+	Returns: list of attrs (str) of the column
+	"""
+	res = []
+	with open(in_file, 'rb') as fd:
+		for (header, values, null_mask) in decode_blocks(fd):
+			res.extend(to_attrs(values, null_mask, null_value))
+	return res
+
+
+def iter_column_file(in_file, null_value, row_start=0):
+	"""
+	Generator over the attrs (str) of a column, starting at row <row_start>
+
+	NOTE: the blocks before row_start are skipped using only their headers
+		  (they are not decoded)
+	"""
+	row = 0
+	with open(in_file, 'rb') as fd:
+		while True:
+			header = read_block_header(fd)
+			if header is None:
+				break
+			count = header["count"]
+			if row + count <= row_start:
+				fd.seek(header["nulls_size"] + header["payload_size"], os.SEEK_CUR)
+				row += count
+				continue
+			null_mask = unpack(fd.read(header["nulls_size"]), 1, count).astype(bool)
+			values = get_codec(header["codec"]).decode(header["metadata"], fd.read(header["payload_size"]), count)
+			attrs = to_attrs(values, null_mask, null_value)
+			for attr in attrs[max(row_start - row, 0):]:
+				yield attr
+			row += count
+
+
+class ColumnFileWriter(object):
+	"""
+	Buffers the attrs of a column and writes them as encoded blocks
+	"""
+
+	def __init__(self, out_file, datatype, null_value, block_size=DEFAULT_BLOCK_SIZE):
+		self.out_file = out_file
+		self.datatype = datatype
+		self.null_value = null_value
+		self.block_size = block_size
+		self.fd = open(out_file, 'wb')
+		self.buffer = []
+		self.stats = {
+			"row_count": 0,
+			"block_count": 0,
+			"size_B": 0,
+			"codecs": {}
+		}
+
+	def append(self, attr):
+		self.buffer.append(attr)
+		if len(self.buffer) >= self.block_size:
+			self.flush()
+
+	def flush(self):
+		if len(self.buffer) == 0:
+			return
+		(values, null_mask) = to_typed_array(self.buffer, self.datatype, self.null_value)
+		(header, block) = encode_block(values, null_mask)
+		self.fd.write(block)
+
+		codec_name = header["codec"]
+		self.stats["codecs"][codec_name] = self.stats["codecs"].get(codec_name, 0) + 1
+		self.stats["row_count"] += len(self.buffer)
+		self.stats["block_count"] += 1
+		self.stats["size_B"] += len(block)
+		self.buffer = []
+
+	def close(self):
+		self.flush()
+		self.fd.close()
+
+
+class CompressedColumnsWriter(object):
+	"""
+	Writes each column of a table to its own column file: <output_dir>/<col_id>.col
+	"""
+
+	def __init__(self, columns, output_dir, null_value, block_size=DEFAULT_BLOCK_SIZE):
+		self.columns = columns
+		self.output_dir = output_dir
+		self.writers = [ColumnFileWriter(self.get_column_file(output_dir, col.col_id), col.datatype, null_value, block_size)
+						for col in columns]
+
+	@classmethod
+	def get_column_file(cls, output_dir, col_id):
+		return os.path.join(output_dir, "{}.col".format(col_id))
+
+	def append_tpl(self, tpl):
+		for writer, attr in zip(self.writers, tpl):
+			writer.append(attr)
+
+	def close(self):
+		for writer in self.writers:
+			writer.close()
+
+	def get_stats(self):
+		return {col.col_id: writer.stats for col, writer in zip(self.columns, self.writers)}
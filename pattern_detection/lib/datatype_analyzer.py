@@ -67,10 +67,22 @@ class NumericDatatype(object):
 		"double"
 	}
 
+	integer_datatypes = {
+		"tinyint",
+		"smallint",
+		"int",
+		"bigint",
+		"integer"
+	}
+
 	@classmethod
 	def is_numeric_datatype(cls, datatype):
 		return datatype.name.lower() in cls.numeric_datatypes
 
+	@classmethod
+	def is_integer_datatype(cls, datatype):
+		return datatype.name.lower() in cls.integer_datatypes
+
 
 class DatatypeCast(object):
 	@classmethod
@@ -1,6 +1,8 @@
 import os
 import sys
 import json
+import struct
+from array import array
 from copy import deepcopy
 from lib.util import *
 # debug
@@ -34,6 +36,17 @@ class ExpressionTree(object):
 	3-1) all exception columns are input columns
 	3-2) no exception column is input of a decompression node
 	3-3) exception columns are not considered output columns
+	Copy-on-write:
+	1) copy() shares the nodes and the column items with the original tree; a
+	   shared node or column item is copied (see ExpressionNode.copy()) right
+	   before the first update (add_level()), so copy() & add_level() cost
+	   O(references) instead of a deepcopy of the whole tree
+	2) operator_info, details and the Column objects are never copied; they
+	   must be treated as immutable once the node is added to a tree
+	Indexes:
+	1) consumed_by, column_names and the in/out/unused column sets are kept
+	   up to date by _set_column() & add_level(); code that changes "columns"
+	   directly must call _update_column_index() (or _build_indexes())
 	"""
 	def __init__(self, in_columns, tree_type):
 		self.levels = []
@@ -47,13 +60,90 @@ class ExpressionTree(object):
 			} """
 		self.type = tree_type
 		self.node_class = self.get_node_class()
+		# node_ids & col_ids that are not shared with other trees (copy-on-write)
+		self.owned_nodes, self.owned_columns = set(), set()
+		# indexes
+		self.consumed_by = {}
+		""" consumed_by item format: col_id (str): tuple(node_id) # nodes that consume col_id """
+		self.column_names = {}
+		""" column_names item format: col_name (str): col_id (str) """
+		self.in_column_ids, self.out_column_ids, self.unused_column_ids = set(), set(), set()
 		# add input columns
 		for in_col in in_columns:
-			self.columns[in_col.col_id] = {
+			self._set_column(in_col.col_id, {
 				"col_info": deepcopy(in_col),
 				"output_of": [],
 				"input_of": []
+			})
+
+	def copy(self):
+		"""
+		Returns: ExpressionTree that shares the nodes & columns with this tree;
+				 see NOTES: Copy-on-write
+		"""
+		res = self.__class__([], self.type)
+		res.levels = list(self.levels)
+		res.nodes = dict(self.nodes)
+		res.columns = dict(self.columns)
+		res.consumed_by = dict(self.consumed_by)
+		res.column_names = dict(self.column_names)
+		res.in_column_ids, res.out_column_ids, res.unused_column_ids = set(self.in_column_ids), set(self.out_column_ids), set(self.unused_column_ids)
+		# NOTE: both trees lose ownership of the shared nodes & columns
+		self.owned_nodes, self.owned_columns = set(), set()
+		return res
+
+	def _get_node_for_update(self, node_id):
+		if node_id not in self.owned_nodes:
+			self.nodes[node_id] = self.nodes[node_id].copy()
+			self.owned_nodes.add(node_id)
+		return self.nodes[node_id]
+
+	def _get_column_for_update(self, col_id):
+		if col_id not in self.owned_columns:
+			col_item = self.columns[col_id]
+			self.columns[col_id] = {
+				"col_info": col_item["col_info"],
+				"output_of": list(col_item["output_of"]),
+				"input_of": list(col_item["input_of"])
 			}
+			self.owned_columns.add(col_id)
+		return self.columns[col_id]
+
+	def _set_column(self, col_id, col_item, owned=True):
+		self.columns[col_id] = col_item
+		if owned:
+			self.owned_columns.add(col_id)
+		else:
+			self.owned_columns.discard(col_id)
+		self._update_column_index(col_id)
+
+	def _update_column_index(self, col_id):
+		col_item = self.columns[col_id]
+		self.column_names.setdefault(col_item["col_info"].name, col_id)
+		is_in = len(col_item["output_of"]) == 0
+		is_unused = is_in and len(col_item["input_of"]) == 0
+		is_out = (col_id not in self.consumed_by and
+				  (self.node_class == CompressionNode or
+				   not OutputColumnManager.is_exception_col(col_item["col_info"])))
+		for col_ids, member in [(self.in_column_ids, is_in), (self.out_column_ids, is_out), (self.unused_column_ids, is_unused)]:
+			if member:
+				col_ids.add(col_id)
+			else:
+				col_ids.discard(col_id)
+
+	def _build_indexes(self):
+		self.consumed_by, self.column_names = {}, {}
+		self.in_column_ids, self.out_column_ids, self.unused_column_ids = set(), set(), set()
+		for node_id, expr_n in self.nodes.items():
+			self._index_consumed_columns(node_id, expr_n)
+		for col_id in self.columns.keys():
+			self._update_column_index(col_id)
+
+	def _index_consumed_columns(self, node_id, expr_n):
+		cols_in_consumed = {c.col_id for c in expr_n.cols_in_consumed}
+		for in_col in expr_n.cols_in:
+			if in_col.col_id in cols_in_consumed:
+				self.consumed_by[in_col.col_id] = self.consumed_by.get(in_col.col_id, ()) + (node_id,)
 
 	def get_node_class(self):
 		if self.type == "compression":
@@ -66,7 +156,7 @@ class ExpressionTree(object):
 	def to_dict(self):
 		res = {
 			"type": self.type,
-			"levels": deepcopy(self.levels),
+			"levels": [list(level) for level in self.levels],
 			"nodes": {},
 			"columns": {},
 			"in_columns": self.get_in_columns()
@@ -82,12 +172,31 @@ class ExpressionTree(object):
 		return res
 
 	@classmethod
-	def from_dict(cls, expr_tree_dict):
+	def from_dict(cls, expr_tree_dict, validate=True):
+		"""
+		Params:
+			validate: rebuild the tree with add_level() (validates nodes & columns);
+					  otherwise, the nodes and columns are restored as they are
+					  (only for trees written by to_dict())
+		"""
 		# json.dumps(expr_tree_dict, indent=2)
 
 		in_columns = [Column.from_dict(expr_tree_dict["columns"][col_id]["col_info"]) for col_id in expr_tree_dict["in_columns"]]
 		expr_tree = cls(in_columns, expr_tree_dict["type"])
 
+		if not validate:
+			for col_id, col_item in expr_tree_dict["columns"].items():
+				expr_tree.columns[col_id] = {
+					"col_info": Column.from_dict(col_item["col_info"]),
+					"output_of": col_item["output_of"],
+					"input_of": col_item["input_of"]
+				}
+			for node_id, node_d in expr_tree_dict["nodes"].items():
+				expr_tree.nodes[node_id] = expr_tree.node_class.from_dict(node_d)
+			expr_tree.levels = [list(level) for level in expr_tree_dict["levels"]]
+			expr_tree._build_indexes()
+			return expr_tree
+
 		for level in expr_tree_dict["levels"]:
 			expr_nodes = [expr_tree.node_class.from_dict(expr_tree_dict["nodes"][node_id]) for node_id in level]
 			expr_tree.add_level(expr_nodes)
@@ -112,16 +221,20 @@ class ExpressionTree(object):
 				raise Exception("Duplicate expression node: node_id={}".format(node_id))
 
 			# add expression node
+			# NOTE: the tree takes ownership of expr_n
 			self.nodes[node_id] = expr_n
+			self.owned_nodes.add(node_id)
+			self._index_consumed_columns(node_id, expr_n)
 			level.append(node_id)
 
 			# validate input columns; add parent & child nodes; fill in "input_of"
 			for in_col in expr_n.cols_in:
 				if in_col.col_id not in self.columns:
 					raise Exception("Invalid input column: in_col={}".format(in_col))
-				col_item = self.columns[in_col.col_id]
+				col_item = self._get_column_for_update(in_col.col_id)
 				# fill in "input_of"
 				col_item["input_of"].append(node_id)
+				self._update_column_index(in_col.col_id)
 				# add parent & child nodes
 				for p_node_id in col_item["output_of"]:
 					# check if not already added
@@ -129,32 +242,34 @@ class ExpressionTree(object):
 						expr_n.parents.add(p_node_id)
 					if p_node_id not in self.nodes:
 						raise Exception("Inexistent parent node: p_node_id={}".format(p_node_id))
-					p_node = self.nodes[p_node_id]
+					p_node = self._get_node_for_update(p_node_id)
 					p_node.children.add(node_id)
 
 			# add output columns; fill in "output_of"
 			for out_col in expr_n.cols_out:
 				if out_col.col_id not in self.columns:
-					self.columns[out_col.col_id] = {
+					self._set_column(out_col.col_id, {
 						"col_info": deepcopy(out_col),
 						"output_of": [],
 						"input_of": []
-					}
+					})
 				if (len(self.columns[out_col.col_id]["output_of"]) > 0 and
 					self.node_class == CompressionNode):
 					raise Exception("Duplicate output column: out_col={}".format(out_col))
-				self.columns[out_col.col_id]["output_of"].append(node_id)
+				self._get_column_for_update(out_col.col_id)["output_of"].append(node_id)
+				self._update_column_index(out_col.col_id)
 
 			# if CompressionNode: add exception columns; append to "output_of"
 			if self.node_class == CompressionNode:
 				for ex_col in expr_n.cols_ex:
 					if ex_col.col_id not in self.columns:
-						self.columns[ex_col.col_id] = {
+						self._set_column(ex_col.col_id, {
 							"col_info": deepcopy(ex_col),
 							"output_of": [],
 							"input_of": []
-						}
-					self.columns[ex_col.col_id]["output_of"].append(node_id)
+						})
+					self._get_column_for_update(ex_col.col_id)["output_of"].append(node_id)
+					self._update_column_index(ex_col.col_id)
 
 		# add new level
 		self.levels.append(level)
@@ -164,6 +279,14 @@ class ExpressionTree(object):
 			return None
 		return self.nodes[node_id]
 
+	def update_operator_info(self, node_id, operator_info):
+		"""
+		NOTE: the node is copied if it is shared with other trees (copy-on-write)
+		"""
+		if node_id not in self.nodes:
+			raise Exception("Node not found: node_id={}".format(node_id))
+		self._get_node_for_update(node_id).operator_info = operator_info
+
 	def get_node_levels(self):
 		return self.levels
 
@@ -172,8 +295,13 @@ class ExpressionTree(object):
 			return None
 		return self.columns[col_id]
 
+	def get_column_by_name(self, col_name):
+		if col_name not in self.column_names:
+			return None
+		return self.columns[self.column_names[col_name]]
+
 	def get_in_columns(self):
-		return sorted(list(filter(lambda col_id: len(self.columns[col_id]["output_of"]) == 0, self.columns.keys())))
+		return sorted(self.in_column_ids)
 
 	def get_out_columns(self):
 		"""
@@ -182,92 +310,46 @@ class ExpressionTree(object):
 		Decompression:
 			same as Compression, but excluding exception columns
 		"""
-		res = []
-		for col_id, col_item in self.columns.items():
-			for node_id in col_item["input_of"]:
-				if col_id in {cic_col.col_id for cic_col in self.nodes[node_id].cols_in_consumed}:
-					break
-			else:
-				if (self.node_class == CompressionNode or
-					(self.node_class == DecompressionNode and
-					 not OutputColumnManager.is_exception_col(col_item["col_info"]))
-				   ):
-					res.append(col_id)
-		return sorted(res)
+		return sorted(self.out_column_ids)
 
 	def get_unused_columns(self):
 		# NOTE: used but not consumed columns have len(input_of) > 0
-		return sorted(list(filter(lambda col_id: len(self.columns[col_id]["output_of"]) == 0 and len(self.columns[col_id]["input_of"]) == 0, self.columns.keys())))
-
-	def _dfs(self, node_id, visited):
-		visited.add(node_id)
-		yield node_id
-		for child_id in self.nodes[node_id].children:
-			if child_id in visited:
-				continue
-			yield from self._dfs(child_id, visited)
+		return sorted(self.unused_column_ids)
 
 	def get_connected_components(self, debug=False):
 		"""
 		Returns: List[ExpressionTree]
 		"""
-		unused_nodes = set(self.nodes.keys())
-		connected_components = {}
-
-		def _get_component_id(node_id):
-			for c_id, component in connected_components.items():
-				if node_id in component:
-					return c_id
-			return None
-
 		# unify expr_nodes based on children property
-		cnt = 0
-		while len(unused_nodes) > 0:
-			cnt += 1
-			node_id = unused_nodes.pop()
-			component = set()
-
-			for n_node_id in self._dfs(node_id, set()):
-				n_c_id = _get_component_id(n_node_id)
-				if n_c_id is not None:
-					component = component.union(connected_components[n_c_id])
-					del connected_components[n_c_id]
-				else:
-					component.add(n_node_id)
-					unused_nodes.discard(n_node_id)
-			connected_components[cnt] = component
+		node_sets = DisjointSet(self.nodes.keys())
+		for node_id, expr_n in self.nodes.items():
+			for child_id in expr_n.children:
+				node_sets.union(node_id, child_id)
 
 		# merge first level expr_nodes that have common input columns
 		for col_id in self.get_in_columns():
 			col = self.columns[col_id]
-			if len(col["input_of"]) < 2:
-				continue
-			node_id = col["input_of"][0]
-			component_id = _get_component_id(node_id)
-			if component_id is None:
-				raise Exception("No component for node_id={}".format(node_id))
 			for n_node_id in col["input_of"][1:]:
-				n_c_id = _get_component_id(n_node_id)
-				if n_c_id is None:
-					raise Exception("No component for n_node_id={}".format(n_node_id))
-				if component_id != n_c_id:
-					connected_components[component_id] |= connected_components[n_c_id]
-					del connected_components[n_c_id]
+				node_sets.union(col["input_of"][0], n_node_id)
+
+		connected_components = node_sets.get_sets()
 
 		if debug:
 			print(self.get_in_columns(), connected_components)
 			print(json.dumps(self.to_dict(), indent=2))
 
+		# split the levels by connected component
+		cc_node_levels = {node_sets.find(cc[0]): [] for cc in connected_components}
+		for level in self.levels:
+			level_nodes = {}
+			for node_id in level:
+				level_nodes.setdefault(node_sets.find(node_id), []).append(self.nodes[node_id].copy())
+			for cc_root, expr_nodes in level_nodes.items():
+				cc_node_levels[cc_root].append(expr_nodes)
+
 		# create an expression tree for each connected component
 		res = []
-		for cc in connected_components.values():
-			# print("\ncc:", cc)
-			expr_node_levels = []
-			for level in self.levels:
-				expr_nodes = [deepcopy(self.nodes[node_id]) for node_id in level if node_id in cc]
-				if len(expr_nodes) > 0:
-					expr_node_levels.append(expr_nodes)
-				# print("l:", [en.p_id for en in expr_nodes])
+		for cc_root, expr_node_levels in cc_node_levels.items():
 			if len(expr_node_levels) == 0:
 				raise Exception("No expression nodes in connected component")
 			in_columns_unique_ids = {col.col_id for expr_node in expr_node_levels[0] for col in expr_node.cols_in}
@@ -297,6 +379,33 @@ class ExpressionTree(object):
 
 		return explored_nodes[::-1]
 
+	def get_required_nodes(self, col_ids):
+		"""
+		Returns: (node_ids, required_col_ids), where:
+			node_ids: set(node_id) of the nodes needed to compute the columns
+					  <col_ids>: the nodes that output them and, recursively,
+					  the nodes that output the input columns of these nodes
+			required_col_ids: set(col_id) of <col_ids> and all the columns they
+							  depend on
+		NOTE: meant for decompression trees: a column projection only needs
+			  this sub-DAG
+		"""
+		node_ids, required_col_ids = set(), set()
+		stack = list(col_ids)
+		while len(stack) > 0:
+			col_id = stack.pop()
+			if col_id in required_col_ids:
+				continue
+			if col_id not in self.columns:
+				raise Exception("Invalid column: col_id={}".format(col_id))
+			required_col_ids.add(col_id)
+			for node_id in self.columns[col_id]["output_of"]:
+				if node_id in node_ids:
+					continue
+				node_ids.add(node_id)
+				stack.extend(c.col_id for c in self.nodes[node_id].cols_in)
+		return (node_ids, required_col_ids)
+
 	@classmethod
 	def merge(cls, tree_a, tree_b, tree_type="compression"):
 		""" NOTE: this method assumes that either:
@@ -372,7 +481,7 @@ class ExpressionTree(object):
 		for tree_tmp in [tree_a, tree_b]:
 			for col_id in tree_tmp.get_unused_columns():
 				if col_id not in tree_res.columns:
-					tree_res.columns[col_id] = tree_tmp.columns[col_id]
+					tree_res._set_column(col_id, tree_tmp.columns[col_id], owned=False)
 
 		# debug
 		# out_file =  out_dir+"/ab.svg"
@@ -445,7 +554,173 @@ class ExpressionTree(object):
 		return tree_res
 
 
+"""
+Binary expression tree format:
+	[magic][uint32 version][uint64 skeleton_size][skeleton (json)][blocks]
+	- skeleton: ExpressionTree.to_dict() without the operator_info of the nodes;
+	  the operator_info of each node is a block: "operator_info_block": [offset, size]
+	- operator_info block:
+		[uint64 small_size][small (json)][arenas]
+		small: the operator_info items that are not stored in arenas, plus
+			   "__arenas__": [[key, arena_type, size], ...]
+	- arenas (large maps & lists of str):
+		- ARENA_STR_LIST: list(str) -> strings
+		- ARENA_STR_INT_MAP: dict(str, int) -> strings (keys) + int64 values
+		- ARENA_STR_STR_MAP: dict(str, str) -> strings (keys) + strings (values)
+	- strings: [uint8 mode][uint32 count]...
+		- STRINGS_SEP: utf-8 of the strings joined by STRINGS_SEP_CHAR
+		- STRINGS_LEN: uint32 utf-8 lengths followed by the utf-8 strings (if any
+		  string contains STRINGS_SEP_CHAR)
+NOTE: operator_info blocks are decoded lazily, on first access (see
+	  ExpressionNode.operator_info)
+"""
+TREE_FORMATS = ["binary", "json"]
+TREE_FILE_EXTENSIONS = {"binary": "bin", "json": "json"}
+BINARY_MAGIC = b"EXPRTREE"
+BINARY_VERSION = 1
+ARENA_MIN_SIZE = 64
+ARENA_STR_LIST, ARENA_STR_INT_MAP, ARENA_STR_STR_MAP = "str_list", "str_int_map", "str_str_map"
+STRINGS_SEP, STRINGS_LEN = 0, 1
+STRINGS_SEP_CHAR = "\x00"
+INT64_MIN, INT64_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def encode_strings(strs):
+	if any(STRINGS_SEP_CHAR in v for v in strs):
+		encoded = [v.encode("utf-8") for v in strs]
+		lengths = array("I", [len(v) for v in encoded])
+		return struct.pack("<BI", STRINGS_LEN, len(strs)) + lengths.tobytes() + b"".join(encoded)
+	return struct.pack("<BI", STRINGS_SEP, len(strs)) + STRINGS_SEP_CHAR.join(strs).encode("utf-8")
+
+
+def decode_strings(buf):
+	(mode, count) = struct.unpack_from("<BI", buf)
+	buf = buf[5:]
+	if count == 0:
+		return []
+	if mode == STRINGS_SEP:
+		return str(buf, "utf-8").split(STRINGS_SEP_CHAR)
+	lengths = array("I")
+	lengths.frombytes(buf[:4 * count])
+	res, pos = [], 4 * count
+	for length in lengths:
+		res.append(str(buf[pos:pos + length], "utf-8"))
+		pos += length
+	return res
+
+
+def get_arena_type(value):
+	if isinstance(value, list):
+		if len(value) >= ARENA_MIN_SIZE and all(type(v) is str for v in value):
+			return ARENA_STR_LIST
+	elif isinstance(value, dict):
+		if len(value) < ARENA_MIN_SIZE or not all(type(k) is str for k in value.keys()):
+			return None
+		if all(type(v) is int and INT64_MIN <= v <= INT64_MAX for v in value.values()):
+			return ARENA_STR_INT_MAP
+		if all(type(v) is str for v in value.values()):
+			return ARENA_STR_STR_MAP
+	return None
+
+
+def encode_arena(arena_type, value):
+	if arena_type == ARENA_STR_LIST:
+		return encode_strings(value)
+	keys = encode_strings(list(value.keys()))
+	if arena_type == ARENA_STR_INT_MAP:
+		values = array("q", value.values()).tobytes()
+	else:
+		values = encode_strings(list(value.values()))
+	return struct.pack("<Q", len(keys)) + keys + values
+
+
+def decode_arena(arena_type, buf):
+	if arena_type == ARENA_STR_LIST:
+		return decode_strings(buf)
+	(keys_size,) = struct.unpack_from("<Q", buf)
+	keys = decode_strings(buf[8:8 + keys_size])
+	if arena_type == ARENA_STR_INT_MAP:
+		values = array("q")
+		values.frombytes(buf[8 + keys_size:])
+	else:
+		values = decode_strings(buf[8 + keys_size:])
+	return dict(zip(keys, values))
+
+
+def encode_operator_info(operator_info):
+	small, arenas = {}, []
+	for key, value in operator_info.items():
+		arena_type = get_arena_type(value)
+		if arena_type is None:
+			small[key] = value
+		else:
+			arenas.append((key, arena_type, encode_arena(arena_type, value)))
+	small["__arenas__"] = [[key, arena_type, len(arena)] for (key, arena_type, arena) in arenas]
+	small_bytes = json.dumps(small).encode("utf-8")
+	return struct.pack("<Q", len(small_bytes)) + small_bytes + b"".join(arena for (_, _, arena) in arenas)
+
+
+def decode_operator_info(buf):
+	(small_size,) = struct.unpack_from("<Q", buf)
+	res = json.loads(str(buf[8:8 + small_size], "utf-8"))
+	pos = 8 + small_size
+	for (key, arena_type, size) in res.pop("__arenas__"):
+		res[key] = decode_arena(arena_type, buf[pos:pos + size])
+		pos += size
+	return res
+
+
+def dumps_expr_tree_binary(expr_tree):
+	expr_tree_dict = expr_tree.to_dict()
+	blocks, offset = [], 0
+	for node_id, node_d in expr_tree_dict["nodes"].items():
+		block = encode_operator_info(node_d.pop("operator_info"))
+		node_d["operator_info_block"] = [offset, len(block)]
+		blocks.append(block)
+		offset += len(block)
+	skeleton = json.dumps(expr_tree_dict, separators=(",", ":")).encode("utf-8")
+	return BINARY_MAGIC + struct.pack("<IQ", BINARY_VERSION, len(skeleton)) + skeleton + b"".join(blocks)
+
+
+def loads_expr_tree_binary(buf):
+	buf = memoryview(buf)
+	(version, skeleton_size) = struct.unpack_from("<IQ", buf, len(BINARY_MAGIC))
+	if version != BINARY_VERSION:
+		raise Exception("Unsupported expression tree version: {}".format(version))
+	pos = len(BINARY_MAGIC) + struct.calcsize("<IQ")
+	expr_tree_dict = json.loads(str(buf[pos:pos + skeleton_size], "utf-8"))
+	blocks = buf[pos + skeleton_size:]
+	for node_d in expr_tree_dict["nodes"].values():
+		(offset, size) = node_d.pop("operator_info_block")
+		node_d["operator_info"] = LazyValue(lambda block=blocks[offset:offset + size]: decode_operator_info(block))
+	return ExpressionTree.from_dict(expr_tree_dict, validate=False)
+
+
+def get_expr_tree_file(output_dir, name, tree_format):
+	"""
+	Returns: <output_dir>/<name>.<extension of tree_format>; e.g. c_tree.bin
+	"""
+	return os.path.join(output_dir, "{}.{}".format(name, TREE_FILE_EXTENSIONS[tree_format]))
+
+
+def write_expr_tree(expr_tree, expr_tree_file, tree_format="binary"):
+	if tree_format == "binary":
+		with open(expr_tree_file, 'wb') as f:
+			f.write(dumps_expr_tree_binary(expr_tree))
+	elif tree_format == "json":
+		with open(expr_tree_file, 'w') as f:
+			json.dump(expr_tree.to_dict(), f, indent=2)
+	else:
+		raise Exception("Invalid tree format: {}".format(tree_format))
+
+
 def read_expr_tree(expr_tree_file):
-	with open(expr_tree_file, 'r') as f:
-		expr_tree_dict = json.load(f)
-		return ExpressionTree.from_dict(expr_tree_dict)
+	"""
+	NOTE: the format (binary or json) is detected from the content of the file
+	"""
+	with open(expr_tree_file, 'rb') as f:
+		buf = f.read()
+	if buf.startswith(BINARY_MAGIC):
+		return loads_expr_tree_binary(buf)
+	expr_tree_dict = json.loads(buf.decode("utf-8"))
+	return ExpressionTree.from_dict(expr_tree_dict)
@@ -3,7 +3,6 @@ Source: https://github.com/shakedzy/dython
 """
 
 import math
-import scipy.stats as ss
 from collections import Counter
 
 
@@ -43,6 +42,8 @@ def theils_u(x, y):
     :return: float
         in the range of [0,1]
     """
+    # NOTE: scipy.stats takes ~1s to import; only load it when needed
+    import scipy.stats as ss
     s_xy = conditional_entropy(x,y)
     x_counter = Counter(x)
     total_occurrences = sum(x_counter.values())
@@ -2,7 +2,6 @@ import os
 import sys
 import itertools
 from copy import deepcopy
-from bitstring import *
 from overrides import overrides
 from lib.util import *
 from patterns import *
@@ -99,6 +98,7 @@ class CoveragePatternSelector(PatternSelector):
 		self.max_candidate_patterns_exhaustive = max_candidate_patterns_exhaustive
 
 	def _select_patterns_exhaustive(self, candidate_patterns, nb_rows):
+		from bitstring import BitArray
 		candidate_patterns_idxs = [i for i in range(0, len(candidate_patterns))]
 		row_mask_list = []
 		for col_p in candidate_patterns:
@@ -249,27 +249,13 @@ class CorrelationPatternSelector(PatternSelector):
 		NOTE: We need the connected components considering the graph as undirected (even though it is directed)
 		"""
 
-		nodes = {node_id for edge in corrs for node_id in edge[:2]}
-		ccs = {idx:{node_id} for idx, node_id in enumerate(nodes)}
-
-		def get_cc(node_id):
-			for cc, node_ids in ccs.items():
-				if node_id in node_ids:
-					return cc
-			raise Exception("node_id not found in any cc: node_id={}".format(node_id))
-
+		node_sets = DisjointSet(node_id for edge in corrs for node_id in edge[:2])
 		for edge in corrs:
-			src, dst = edge[0], edge[1]
-			src_cc, dst_cc = get_cc(src), get_cc(dst)
-			if src_cc == dst_cc:
-				continue
-			ccs[src_cc] |= ccs[dst_cc]
-			del ccs[dst_cc]
+			node_sets.union(edge[0], edge[1])
 
-		res = {cc:[] for cc in ccs.keys()}
+		res = {}
 		for edge in corrs:
-			cc = get_cc(edge[0])
-			res[cc].append(edge)
+			res.setdefault(node_sets.find(edge[0]), []).append(edge)
 
 		return list(res.values())
 
@@ -281,11 +267,15 @@ class CorrelationPatternSelector(PatternSelector):
 			nodes[src]["out"].add(dst)
 			nodes[dst]["in"].add(src)
 
+		# edge index: (src, dst) -> corr
+		corr_index = {}
+		for corr in corr_cc:
+			corr_index.setdefault((corr[0], corr[1]), corr)
+
 		def get_corr(src, dst):
-			for corr in corr_cc:
-				if corr[0] == src and corr[1] == dst:
-					return corr
-			raise Exception("Invalid (src, dst) pair: src={}, dst={}".format(src, dst))
+			if (src, dst) not in corr_index:
+				raise Exception("Invalid (src, dst) pair: src={}, dst={}".format(src, dst))
+			return corr_index[(src, dst)]
 
 		def get_node_score(node_id):
 			in_d = len(nodes[node_id]["in"])
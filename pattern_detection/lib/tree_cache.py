@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+from lib.expression_tree import read_expr_tree, write_expr_tree
+
+
+"""
+On-disk cache of learned expression trees (c_tree.bin & dec_tree.bin)
+
+Cache entries are dirs named after the cache key: <cache_dir>/<key>/
+The key is a content hash of everything the learning depends on (input files,
+learning config, source code of the learning phase); see get_key()
+
+Eviction: least recently used entries are removed until the total size of the
+cache is at most max_size_B
+"""
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pattern_detection", "expr_trees")
+DEFAULT_CACHE_MAX_SIZE_MiB = 1024
+TREE_FILES = ["c_tree.bin", "dec_tree.bin"]
+META_FILE = "meta.json"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(h, in_file):
+	with open(in_file, 'rb') as fd:
+		while True:
+			buf = fd.read(HASH_BLOCK_SIZE)
+			if len(buf) == 0:
+				break
+			h.update(buf)
+
+
+def json_default(obj):
+	if isinstance(obj, (set, frozenset)):
+		return sorted(obj)
+	return str(obj)
+
+
+class ExpressionTreeCache(object):
+	def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size_B=DEFAULT_CACHE_MAX_SIZE_MiB * 1024 * 1024):
+		self.cache_dir = cache_dir
+		self.max_size_B = max_size_B
+		if not os.path.exists(cache_dir):
+			os.makedirs(cache_dir)
+
+	@classmethod
+	def get_key(cls, input_files, config, source_files):
+		"""
+		Params:
+			input_files: list(file); None items are allowed (e.g. optional files)
+			config: json serializable object (sets are allowed)
+			source_files: list(file); source code the learning depends on
+		Returns: hex digest
+		"""
+		h = hashlib.sha256()
+		h.update("version={}".format(CACHE_VERSION).encode("utf-8"))
+		for in_file in input_files:
+			h.update(b"\0file\0")
+			if in_file is not None:
+				hash_file(h, in_file)
+		h.update(b"\0config\0")
+		h.update(json.dumps(config, sort_keys=True, default=json_default).encode("utf-8"))
+		for src_file in source_files:
+			h.update(b"\0source\0")
+			hash_file(h, src_file)
+		return h.hexdigest()
+
+	def get_entry_dir(self, key):
+		return os.path.join(self.cache_dir, key)
+
+	def get(self, key):
+		"""
+		Returns: (compression_tree, decompression_tree) or None if not cached
+		"""
+		entry_dir = self.get_entry_dir(key)
+		tree_files = [os.path.join(entry_dir, f) for f in TREE_FILES]
+		if not all(os.path.isfile(f) for f in tree_files):
+			return None
+		# mark as recently used
+		os.utime(entry_dir)
+		return tuple(read_expr_tree(f) for f in tree_files)
+
+	def put(self, key, compression_tree, decompression_tree, meta=None):
+		"""
+		NOTE: the entry is written to a temporary dir first and then renamed, so
+			  that concurrent runs never see a partial entry
+		"""
+		entry_dir = self.get_entry_dir(key)
+		tmp_dir = "{}.tmp.{}".format(entry_dir, os.getpid())
+		if os.path.exists(tmp_dir):
+			shutil.rmtree(tmp_dir)
+		os.makedirs(tmp_dir)
+		for tree_file, tree in zip(TREE_FILES, [compression_tree, decompression_tree]):
+			write_expr_tree(tree, os.path.join(tmp_dir, tree_file), "binary")
+		with open(os.path.join(tmp_dir, META_FILE), 'w') as fd:
+			json.dump(dict(key=key, created=time.time(), **(meta or {})), fd, indent=2, default=json_default)
+		try:
+			os.rename(tmp_dir, entry_dir)
+		except OSError:
+			shutil.rmtree(tmp_dir, ignore_errors=True)
+			# NOTE: only expected if a concurrent run already cached the entry
+			if not os.path.isdir(entry_dir):
+				raise
+			print("[tree_cache] already cached by a concurrent run: {}".format(key))
+		self.evict()
+
+	@classmethod
+	def get_dir_size(cls, target_dir):
+		return sum(os.path.getsize(os.path.join(target_dir, f)) for f in os.listdir(target_dir))
+
+	def evict(self):
+		"""
+		Returns: list of evicted keys
+		"""
+		entries = []
+		for key in os.listdir(self.cache_dir):
+			entry_dir = self.get_entry_dir(key)
+			if not os.path.isdir(entry_dir) or ".tmp." in key:
+				continue
+			entries.append((os.path.getmtime(entry_dir), self.get_dir_size(entry_dir), key))
+
+		total_size_B = sum(size_B for (_, size_B, _) in entries)
+		evicted = []
+		# least recently used first
+		for (_, size_B, key) in sorted(entries):
+			if total_size_B <= self.max_size_B:
+				break
+			shutil.rmtree(self.get_entry_dir(key))
+			total_size_B -= size_B
+			evicted.append(key)
+			print("[tree_cache] evicted: {}".format(key))
+		return evicted
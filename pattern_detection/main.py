@@ -4,17 +4,19 @@ import os
 import sys
 import argparse
 import json
+import glob
 import string
 from copy import deepcopy
 from lib.util import *
+from lib.instrumentation import instrumentation, add_instrumentation_arguments
 from lib.pattern_selectors import *
 from patterns import *
 from apply_expression import ExpressionManager, apply_expression_manager_list
-from lib.expression_tree import ExpressionTree
-from plot_expression_tree import plot_expression_tree
-from plot_correlation_graph import plot_correlation_graph
-import plot_pattern_distribution, plot_ngram_freq_masks, plot_correlation_coefficients
+from lib.expression_tree import ExpressionTree, TREE_FORMATS, get_expr_tree_file, write_expr_tree
+from lib.tree_cache import ExpressionTreeCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_SIZE_MiB
+from render import RenderManifest, RENDER_MODES, MANIFEST_FILE
 import recursive_exhaustive_learning as rec_exh
+from incremental_learning import IncrementalLearning, DEFAULT_DRIFT_THRESHOLD
 
 
 # TODO: read this from a config file
@@ -66,6 +68,8 @@ class PatternDetectionEngine(object):
 		self.pattern_detectors = pattern_detectors
 		self.total_tuple_count = 0
 		self.valid_tuple_count = 0
+		self.feed_functions = [instrumentation.instrument("detector.{}.feed_tuple".format(pd.name), pd.feed_tuple)
+							   for pd in pattern_detectors]
 
 	def is_valid_tuple(self, tpl):
 		if len(tpl) != len(self.columns):
@@ -79,8 +83,8 @@ class PatternDetectionEngine(object):
 			return False
 		self.valid_tuple_count += 1
 
-		for pd in self.pattern_detectors:
-			pd.feed_tuple(tpl)
+		for feed_f in self.feed_functions:
+			feed_f(tpl)
 
 		return True
 
@@ -88,14 +92,19 @@ class PatternDetectionEngine(object):
 		patterns = {}
 
 		for pd in self.pattern_detectors:
+			with instrumentation.timer("detector.{}.evaluate".format(pd.name)):
+				columns = pd.evaluate()
 			patterns[pd.name] = {
 				"name": pd.name,
-				"columns": pd.evaluate()
+				"columns": columns
 			}
 
 		return (patterns, self.total_tuple_count, self.valid_tuple_count)
 
 
+render_manifest = RenderManifest()
+
+
 class OutputManager(object):
 	@staticmethod
 	def output_stats(columns, patterns):
@@ -118,7 +127,12 @@ class OutputManager(object):
 					# end-debug
 
 	@staticmethod
-	def output_pattern_distribution(stage, level, columns, patterns, pattern_distribution_output_dir, fdelim=",", plot_file_format="svg"):
+	def output_pattern_distribution(stage, level, columns, patterns, pattern_distribution_output_dir, plot_file_format="svg"):
+		"""
+		Writes one .npz file per column (see plot_pattern_distribution.read_data())
+		"""
+		import numpy as np
+
 		# group patterns by columns
 		column_patterns = {}
 		for c in columns:
@@ -133,41 +147,19 @@ class OutputManager(object):
 			if len(col_p.keys()) == 0:
 				continue
 
-			out_file = "{}/s_{}_l_{}_col_{}.csv".format(pattern_distribution_output_dir, stage, level, col_id)
-			with open(out_file, 'w') as fd:
-				# write header
-				header = sorted(col_p.keys())
-				fd.write(fdelim.join(header) + "\n")
-
-				# write one row at a time
-				# TODO: make the implementation easier by using bitmaps instead of row ids
-				for p_id in header:
-					col_p[p_id]["rows"] = sorted(col_p[p_id]["rows"])
-
-				row_iterators = {p:0 for p in col_p.keys()}
-				row_count = 0
-				while True:
-					current_row = []
-					done_cnt = 0
-					for p in header:
-						rows, r_it = col_p[p]["rows"], row_iterators[p]
-						if r_it == len(rows):
-							current_row.append("0")
-							done_cnt += 1
-						elif row_count < rows[r_it]:
-							current_row.append("0")
-						elif row_count == rows[r_it]:
-							row_iterators[p] += 1
-							current_row.append("1")
-						else:
-							raise Exception("Rows are not sorted: col_id={}, p={}, row_count={}, rows[{}]={}".format(col_id, p, row_count, r_it, rows[r_it]))
-					if done_cnt == len(header):
-						break
-					fd.write(fdelim.join(current_row) + "\n")
-					row_count += 1
+			header = sorted(col_p.keys())
+			rows_list = [np.fromiter(col_p[p_id]["rows"], dtype=np.int64) for p_id in header]
+			# NOTE: rows after the last matched row (of any pattern) are not included
+			nb_rows = max((int(rows.max()) + 1 for rows in rows_list if len(rows) > 0), default=0)
+			bitmaps = np.zeros((len(header), nb_rows), dtype=np.bool_)
+			for p_idx, rows in enumerate(rows_list):
+				bitmaps[p_idx, rows] = True
+
+			out_file = "{}/s_{}_l_{}_col_{}.npz".format(pattern_distribution_output_dir, stage, level, col_id)
+			np.savez(out_file, header=np.array(header), nb_rows=nb_rows, bitmaps=np.packbits(bitmaps, axis=1))
 
 			plot_file="{}/s_{}_l_{}_col_{}.{}".format(pattern_distribution_output_dir, stage, level, col_id, plot_file_format)
-			plot_pattern_distribution.main(in_file=out_file, out_file=plot_file, out_file_format=plot_file_format)
+			render_manifest.add("pattern_distribution", in_file=out_file, out_file=plot_file, out_file_format=plot_file_format)
 
 	@staticmethod
 	def output_ngram_freq_masks(stage, level, ngram_freq_masks, ngram_freq_masks_output_dir, plot_file_format="svg"):
@@ -178,7 +170,7 @@ class OutputManager(object):
 					fd.write(v + "\n")
 
 			plot_file="{}/s_{}_l_{}_col_{}.{}".format(ngram_freq_masks_output_dir, stage, level, col_id, plot_file_format)
-			plot_ngram_freq_masks.main(in_file=out_file, out_file=plot_file, out_file_format=plot_file_format)
+			render_manifest.add("ngram_freq_masks", in_file=out_file, out_file=plot_file, out_file_format=plot_file_format)
 
 	@staticmethod
 	def output_corr_coefs(stage, level, corr_coefs, corrs, expr_nodes, corr_coefs_output_dir, fdelim=",", plot_file_format="svg"):
@@ -195,7 +187,7 @@ class OutputManager(object):
 				fd.write(fdelim.join(values) + "\n")
 
 		plot_file = "{}/s_{}_l_{}.coefs.{}".format(corr_coefs_output_dir, stage, level, plot_file_format)
-		plot_correlation_coefficients.main(in_file=out_file, out_file=plot_file, out_file_format=plot_file_format)
+		render_manifest.add("correlation_coefficients", in_file=out_file, out_file=plot_file, out_file_format=plot_file_format)
 
 		# mark selected corrs
 		corrs_res = []
@@ -217,20 +209,19 @@ class OutputManager(object):
 		with open(out_file, 'w') as fd:
 			json.dump(corrs_res, fd)
 		plot_file = "{}/s_{}_l_{}.graph.svg".format(corr_coefs_output_dir, stage, level)
-		plot_correlation_graph(corrs_res, plot_file)
+		render_manifest.add("correlation_graph", in_file=out_file, out_file=plot_file)
 
 	@staticmethod
-	def output_expression_trees(compression_tree, decompression_tree, output_dir, plot=True):
-		c_tree_out_file, dec_tree_out_file = os.path.join(output_dir, "c_tree.json"), os.path.join(output_dir, "dec_tree.json")
-		with open(c_tree_out_file, 'w') as c_f, open(dec_tree_out_file, 'w') as dec_f:
-			json.dump(compression_tree.to_dict(), c_f, indent=2)
-			json.dump(decompression_tree.to_dict(), dec_f, indent=2)
+	def output_expression_trees(compression_tree, decompression_tree, output_dir, plot=True, tree_format="binary"):
+		c_tree_out_file, dec_tree_out_file = get_expr_tree_file(output_dir, "c_tree", tree_format), get_expr_tree_file(output_dir, "dec_tree", tree_format)
+		write_expr_tree(compression_tree, c_tree_out_file, tree_format)
+		write_expr_tree(decompression_tree, dec_tree_out_file, tree_format)
 		if plot:
 			c_tree_plot_file, dec_tree_plot_file = os.path.join(output_dir, "c_tree.svg"), os.path.join(output_dir, "dec_tree.svg")
-			plot_expression_tree(compression_tree, c_tree_plot_file,
-								 ignore_unused_columns=False)
-			plot_expression_tree(decompression_tree, dec_tree_plot_file,
-								 ignore_unused_columns=True)
+			render_manifest.add("expression_tree", in_file=c_tree_out_file, out_file=c_tree_plot_file,
+								ignore_unused_columns=False)
+			render_manifest.add("expression_tree", in_file=dec_tree_out_file, out_file=dec_tree_plot_file,
+								ignore_unused_columns=True)
 
 
 def parse_args():
@@ -255,6 +246,10 @@ def parse_args():
 		help="Output dir to write ngram frequency masks to")
 	parser.add_argument('--corr-coefs-output-dir', dest='corr_coefs_output_dir', type=str,
 		help="Output dir to write column correlation coefficients to")
+	parser.add_argument("--render", dest="render", type=str, choices=RENDER_MODES,
+		help="When to render the plots; deferred: only write <expr-tree-output-dir>/{} (see render.py)".format(MANIFEST_FILE), default="background")
+	parser.add_argument("--render-workers", dest="render_workers", type=int,
+		help="Number of background rendering processes (default: number of CPUs)")
 	parser.add_argument("-F", "--fdelim", dest="fdelim",
 		help="Use <fdelim> as delimiter between fields", default="|")
 	parser.add_argument("--null", dest="null", type=str,
@@ -265,6 +260,23 @@ def parse_args():
 		help="Sample used for estimator test in the recursive exhausting algorithm")
 	parser.add_argument('--full-file-linecount', dest='full_file_linecount', type=int,
 		help="Number of lines in the full file that the sample was taken from")
+	parser.add_argument("--incremental", dest="incremental", action='store_true',
+		help="Incremental learning: update the expression tree of <expr-tree-output-dir> with FILE (new rows); only the columns that drifted are re-learned (see incremental_learning.py)")
+	parser.add_argument("--drift-threshold", dest="drift_threshold", type=float,
+		help="Incremental learning: re-learn the columns with a drift score above <drift-threshold> (0..1)", default=DEFAULT_DRIFT_THRESHOLD)
+	parser.add_argument("--incremental-sample-size", dest="incremental_sample_size", type=int,
+		help="Incremental learning: number of rows kept to re-learn drifted columns (default: number of rows of the first input)")
+	parser.add_argument("--tree-format", dest="tree_format", type=str, choices=TREE_FORMATS,
+		help="Format of the expression tree files: <expr-tree-output-dir>/{c_tree,dec_tree}.{bin,json}", default="binary")
+	parser.add_argument("--cache", dest="cache", action='store_true',
+		help="Read the expression tree from the expression tree cache if it was already learned on the same inputs; write it there otherwise")
+	parser.add_argument("--no-cache", dest="cache", action='store_false',
+		help="Always learn the expression tree; do not read from or write to the expression tree cache (default)")
+	parser.add_argument("--cache-dir", dest="cache_dir", type=str,
+		help="Expression tree cache dir", default=DEFAULT_CACHE_DIR)
+	parser.add_argument("--cache-max-size", dest="cache_max_size", type=int,
+		help="Maximum size of the expression tree cache in MiB; least recently used trees are evicted", default=DEFAULT_CACHE_MAX_SIZE_MiB)
+	add_instrumentation_arguments(parser)
 
 	return parser.parse_args()
 
@@ -373,14 +385,16 @@ def build_compression_tree_iteration(args, stage, it, in_columns, pattern_detect
 	# end-debug
 
 	# select patterns for each column
-	expr_nodes = pattern_selector.select_patterns(patterns, in_columns, valid_tuple_count)
+	with instrumentation.timer("selector.{}.select_patterns".format(pattern_selector.__class__.__name__)):
+		expr_nodes = pattern_selector.select_patterns(patterns, in_columns, valid_tuple_count)
 
 	# debug
 	# for en in expr_nodes: print(en)
 	# end-debug
 
 	# output iteration results
-	output_iteration_results(args, stage, it, in_columns, pattern_detectors, patterns, expr_nodes)
+	with instrumentation.timer("io.output_iteration_results"):
+		output_iteration_results(args, stage, it, in_columns, pattern_detectors, patterns, expr_nodes)
 
 	# stop if no more patterns can be applied
 	if len(expr_nodes) == 0:
@@ -395,7 +409,8 @@ def build_compression_tree_iteration(args, stage, it, in_columns, pattern_detect
 	expr_manager = ExpressionManager(in_columns, expr_nodes, args.null)
 	out_columns = expr_manager.get_out_columns()
 
-	apply_expressions(expr_manager, in_data_manager, out_data_manager)
+	with instrumentation.timer("stage.apply_expressions"):
+		apply_expressions(expr_manager, in_data_manager, out_data_manager)
 
 	# debug
 	# for oc in out_columns: print(oc.col_id)
@@ -476,6 +491,13 @@ def build_compression_tree_rec_exh(args, in_data_manager, columns):
 	
 	return compression_tree
 
+def build_compression_tree(args, in_data_manager, columns):
+	if args.rec_exh:
+		print("[algorithm] recursive exhaustive")
+		return build_compression_tree_rec_exh(args, in_data_manager, columns)
+	print("[algorithm] iterative greedy")
+	return build_compression_tree_greedy(args, in_data_manager, columns)
+
 def build_decompression_tree(c_tree):
 	in_columns = [c_tree.get_column(col_id)["col_info"] for col_id in c_tree.get_out_columns()]
 	dec_tree = ExpressionTree(in_columns, "decompression")
@@ -497,9 +519,41 @@ def build_decompression_tree(c_tree):
 	return dec_tree
 
 
+def get_tree_cache_key(args):
+	"""
+	Returns: cache key of the expression tree or None if the cache can not be used
+	"""
+	if not args.cache:
+		return None
+	if args.file is None:
+		print("[tree_cache] disabled: input is stdin")
+		return None
+	if args.incremental:
+		print("[tree_cache] disabled: incremental learning")
+		return None
+	# NOTE: these outputs are only generated while learning
+	if any(d is not None for d in [args.pattern_distribution_output_dir, args.ngram_freq_masks_output_dir, args.corr_coefs_output_dir]):
+		print("[tree_cache] disabled: learning outputs requested")
+		return None
+
+	input_files = [args.file, args.header_file, args.datatypes_file, args.test_sample if args.rec_exh else None]
+	config = {
+		"iteration_stages": iteration_stages,
+		"rec_exh_config": rec_exh_config,
+		"rec_exh_pattern_detectors": rec_exh.pattern_detectors,
+		"args": {k: getattr(args, k) for k in ["fdelim", "null", "rec_exh", "full_file_linecount"]}
+	}
+	# NOTE: all the sources; any module may be imported by the learning phase
+	pd_dir = os.path.dirname(os.path.abspath(__file__))
+	source_files = sorted(glob.glob(os.path.join(pd_dir, "**", "*.py"), recursive=True))
+	return ExpressionTreeCache.get_key(input_files, config, source_files)
+
+
 def main():
 	args = parse_args()
 	print(args)
+	instrumentation.enable_from_args(args)
+	render_manifest.open(os.path.join(args.expr_tree_output_dir, MANIFEST_FILE), args.render, args.render_workers)
 
 	# read header and datatypes
 	with open(args.header_file, 'r') as fd:
@@ -515,27 +569,53 @@ def main():
 		col_id = str(idx)
 		columns.append(Column(col_id, col_name, datatypes[idx]))
 
-	# read data
-	in_data_manager = DataManager()
-	try:
-		if args.file is None:
-			fd = os.fdopen(os.dup(sys.stdin.fileno()))
-		else:
-			fd = open(args.file, 'r')
-		f_driver = FileDriver(fd)
-		read_data(f_driver, in_data_manager, args.fdelim)
-	finally:
-		fd.close()
-
-	# build compression tree
-	if args.rec_exh:
-		print("[algorithm] recursive exhaustive")
-		compression_tree = build_compression_tree_rec_exh(args, in_data_manager, columns)
+	# expression tree cache
+	tree_cache, cache_key, cached_trees = None, None, None
+	with instrumentation.timer("io.tree_cache_get"):
+		cache_key = get_tree_cache_key(args)
+		if cache_key is not None:
+			tree_cache = ExpressionTreeCache(args.cache_dir, args.cache_max_size * 1024 * 1024)
+			cached_trees = tree_cache.get(cache_key)
+	if cached_trees is not None:
+		print("[tree_cache] hit: {}".format(cache_key))
+		(compression_tree, decompression_tree) = cached_trees
 	else:
-		print("[algorithm] iterative greedy")
-		compression_tree = build_compression_tree_greedy(args, in_data_manager, columns)
-	# build decompression tree
-	decompression_tree = build_decompression_tree(compression_tree)
+		if cache_key is not None:
+			print("[tree_cache] miss: {}".format(cache_key))
+
+		# read data
+		in_data_manager = DataManager()
+		try:
+			if args.file is None:
+				fd = os.fdopen(os.dup(sys.stdin.fileno()))
+			else:
+				fd = open(args.file, 'r')
+			f_driver = FileDriver(fd)
+			with instrumentation.timer("io.read_data"):
+				read_data(f_driver, in_data_manager, args.fdelim)
+		finally:
+			fd.close()
+
+		# build compression tree
+		with instrumentation.timer("stage.build_compression_tree"):
+			if args.incremental:
+				incremental_learning = IncrementalLearning(args.expr_tree_output_dir, args.fdelim, args.null,
+					args.drift_threshold, args.incremental_sample_size, args.tree_format)
+				(compression_tree, incremental_report) = incremental_learning.learn(in_data_manager, columns,
+					lambda data_manager, in_columns: build_compression_tree(args, data_manager, in_columns))
+			else:
+				compression_tree = build_compression_tree(args, in_data_manager, columns)
+		# build decompression tree
+		decompression_tree = build_decompression_tree(compression_tree)
+
+		if args.incremental:
+			with instrumentation.timer("io.incremental_save"):
+				version = incremental_learning.save(compression_tree, decompression_tree, incremental_report, args.file)
+			print("[incremental] version={}, changed={}, relearned_columns={}".format(version, incremental_report["changed"], incremental_report["relearned_columns"]))
+
+		if tree_cache is not None:
+			with instrumentation.timer("io.tree_cache_put"):
+				tree_cache.put(cache_key, compression_tree, decompression_tree, meta={"file": os.path.abspath(args.file)})
 
 	# debug
 	print("\n[levels]")
@@ -556,7 +636,14 @@ def main():
 	# end-debug
 
 	# output expression trees
-	OutputManager.output_expression_trees(compression_tree, decompression_tree, args.expr_tree_output_dir, plot=True)
+	with instrumentation.timer("io.output_expression_trees"):
+		OutputManager.output_expression_trees(compression_tree, decompression_tree, args.expr_tree_output_dir, plot=True, tree_format=args.tree_format)
+
+	# write the render manifest & wait for background rendering
+	with instrumentation.timer("io.render"):
+		render_manifest.close()
+
+	instrumentation.dump_report(os.path.join(args.expr_tree_output_dir, "instrumentation.json"))
 
 
 
@@ -621,8 +708,16 @@ $test_sample \
 $full_file_linecount \
 $wbs_dir/$wb/$table.sample.csv
 
+#[pattern-detection-incremental]
+# first run: learns from the sample; next runs: update the tree with a new partition (new version in $expr_tree_output_dir/versions/)
+./pattern_detection/main.py --header-file $repo_wbs_dir/$wb/samples/$table.header-renamed.csv \
+--datatypes-file $repo_wbs_dir/$wb/samples/$table.datatypes.csv \
+--expr-tree-output-dir $expr_tree_output_dir \
+--incremental --drift-threshold 0.1 \
+$wbs_dir/$wb/$table.partition.csv
+
 #[plot-expr-tree]
-expr_tree_file=$expr_tree_output_dir/c_tree.json
+expr_tree_file=$expr_tree_output_dir/c_tree.bin
 expr_tree_plot_file=$expr_tree_output_dir/expr_tree_manual.svg
 ./pattern_detection/plot_expression_tree.py --out-file $expr_tree_plot_file $expr_tree_file
 
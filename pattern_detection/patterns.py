@@ -2,7 +2,6 @@ import os
 import sys
 from copy import deepcopy
 from statistics import mean, median
-import numpy as np
 from collections import Counter, defaultdict
 from overrides import overrides
 
@@ -180,6 +179,35 @@ class PatternDetector(object):
 		'''
 		raise Exception("Not implemented")
 
+	@classmethod
+	def get_operator_dispatch(cls, cols_in, operator_info, null_value):
+		'''
+		Optional cheap pre-check for the compression operator, used to skip
+		operators that cannot match without calling them
+
+		Returns: None (no pre-check) or (dispatch_id, key_f, key), where:
+				 dispatch_id: identifies key_f; expression nodes with the same
+				 			  input columns and dispatch_id share one key_f call
+				 key_f: function of attrs (same as the operator's)
+				 key: the operator can only succeed if key_f(attrs) == key
+				 note-1: key_f(attrs) == key is a necessary condition, not a
+				 		 sufficient one; the operator is still called
+		'''
+		return None
+
+	@classmethod
+	def get_adaptive_operator(cls, cols_in, cols_out, operator_info, null_value, max_size):
+		'''
+		Optional compression operator that extends its operator info with the
+		values it does not cover (instead of raising OperatorException), while
+		the metadata stays under <max_size> bytes
+
+		Returns: None (not supported; use get_operator()) or (operator, state), where:
+				 operator: same signature as the one of get_operator()
+				 state: keeps the extended operator info; see AdaptiveDictionary
+		'''
+		return None
+
 	@classmethod
 	def get_metadata_size(cls, operator_info):
 		return 0
@@ -221,6 +249,23 @@ class PatternDetector(object):
 		'''
 		raise Exception("Not implemented")
 
+	@classmethod
+	def get_predicate_dec(cls, cols_in, cols_out, operator_dec_info, null_value, predicate):
+		'''
+		Optional evaluation of <predicate> (see lib/predicates.py) on the output
+		column of the decompression operator, without decompressing it (i.e.
+		directly on the input attrs)
+
+		Returns: None (not supported; the output attr is decompressed with
+				 get_operator_dec() and the predicate is evaluated on it) or a
+				 function with the following signature:
+				 params: attrs (same as the decompression operator's)
+				 returns: predicate result on the output attr (bool)
+				 raises: OperatorException in the same cases as the decompression operator
+				 note-1: only called for decompression operators with one output column
+		'''
+		return None
+
 	@classmethod
 	def get_compression_node(cls, pd_item):
 		"""
@@ -430,6 +475,69 @@ class ConstantPatternDetector(PatternDetector):
 
 		return operator
 
+	@classmethod
+	def get_predicate_dec(cls, cols_in, cols_out, operator_dec_info, null_value, predicate):
+		# NOTE: the result is the same for all the rows; evaluate it once
+		res = predicate.evaluate(operator_dec_info["constant"])
+
+		def predicate_f(attrs):
+			return res
+
+		return predicate_f
+
+
+class AdaptiveDictionary(object):
+	"""
+	Dictionary of a DictPattern expression node, extended with new keys during
+	compression (see DictPattern.get_adaptive_operator())
+
+	NOTE-1: the learned map is not modified (operator_info is shared and must
+			be treated as immutable); the extended map is a copy
+	NOTE-2: a new key gets the next code (len(map)), so the codes only depend
+			on the order in which the rows are compressed (first occurrence);
+			parallel compression must use one AdaptiveDictionary per unit of
+			work (e.g. row group) or compress the rows in a fixed order
+	NOTE-3: new keys are rejected when the dictionary size would exceed
+			max_dict_size (same size as DictEstimatorTrain.optimize_dictionary())
+			or the code would not fit the datatype of the output column
+	"""
+
+	def __init__(self, map_obj, max_dict_size, max_code):
+		self.map = dict(map_obj)
+		self.learned_count = len(self.map)
+		self.size = DictEstimatorTest.get_dict_size(self.map.keys())
+		self.max_dict_size = max_dict_size
+		self.max_code = max_code
+		self.rejected_count = 0
+
+	def add(self, key):
+		"""
+		Returns: the code of the new key or None if the dictionary is full
+		"""
+		code = len(self.map)
+		# NOTE: +1 byte for each key: null terminator (since keys are strings)
+		size_key = DatatypeAnalyzer.get_value_size(key, bits=False) + 1
+		if code > self.max_code or self.size + size_key > self.max_dict_size:
+			self.rejected_count += 1
+			return None
+		self.map[key] = code
+		self.size += size_key
+		return code
+
+	def is_extended(self):
+		return len(self.map) > self.learned_count
+
+	def get_operator_info(self):
+		return dict(name="map", map=self.map)
+
+	def get_stats(self):
+		return {
+			"learned_keys": self.learned_count,
+			"new_keys": len(self.map) - self.learned_count,
+			"rejected_count": self.rejected_count,
+			"dict_size": self.size
+		}
+
 
 class DictPattern(PatternDetector):
 	def __init__(self, pd_obj_id, columns, pattern_log, expr_tree, null_value,
@@ -669,6 +777,33 @@ class DictPattern(PatternDetector):
 
 		return operator
 
+	@classmethod
+	def get_adaptive_operator(cls, cols_in, cols_out, operator_info, null_value, max_size):
+		# NOTE: same code-width limit as get_output_col_datatype()
+		datatype_name = cols_out[0].datatype.name.lower()
+		if datatype_name not in {"tinyint", "smallint"}:
+			raise Exception("Invalid dict output datatype: {}".format(datatype_name))
+		max_code = DATATYPES[datatype_name]["range"][1] - 1
+		adaptive_dict = AdaptiveDictionary(operator_info["map"], max_size, max_code)
+		map_obj = adaptive_dict.map
+
+		def operator(attrs):
+			val = attrs[0]
+
+			if val == null_value:
+				raise OperatorException("[{}] null value is not supported".format(cls.__name__))
+
+			n_val = map_obj.get(val)
+			if n_val is None:
+				n_val = adaptive_dict.add(val)
+				if n_val is None:
+					raise OperatorException("[{}] value not in dictionary and dictionary full: value={}".format(cls.__name__, val))
+
+			attrs_out = [n_val]
+			return attrs_out
+
+		return (operator, adaptive_dict)
+
 	@classmethod
 	def get_metadata_size(cls, operator_info):
 		map_obj = operator_info["map"]
@@ -694,6 +829,24 @@ class DictPattern(PatternDetector):
 
 		return operator
 
+	@classmethod
+	def get_predicate_dec(cls, cols_in, cols_out, operator_dec_info, null_value, predicate):
+		'''
+		NOTE: the predicate is evaluated once for each dictionary entry; the
+			  rows are then filtered by comparing their codes (as strings) with
+			  the codes of the matching entries (e.g. a single code for string
+			  equality)
+		'''
+		codes = {str(pos) for pos, attr in enumerate(operator_dec_info["map"]) if predicate.evaluate(attr)}
+
+		def predicate_f(attrs):
+			in_val = attrs[0]
+			if in_val == null_value:
+				raise OperatorException("[{}] expression node not used in the compression phase".format(cls.__name__))
+			return in_val in codes
+
+		return predicate_f
+
 
 class StringPatternDetector(PatternDetector):
 	def __init__(self, pd_obj_id, columns, pattern_log, expr_tree, null_value):
@@ -945,6 +1098,24 @@ class NumberAsString(StringPatternDetector):
 
 		return operator
 
+	@classmethod
+	def get_predicate_dec(cls, cols_in, cols_out, operator_dec_info, null_value, predicate):
+		'''
+		NOTE: numeric predicates are evaluated on the numeric column only;
+			  prefix & suffix (e.g. leading/trailing zeros) do not change the
+			  numeric value (see NumericDatatypeAnalyzer.cast_preview())
+		'''
+		if not predicate.numeric:
+			return None
+
+		def predicate_f(attrs):
+			in_val = attrs[0]
+			if in_val == null_value:
+				raise OperatorException("[{}] expression node not used in the compression phase".format(cls.__name__))
+			return predicate.evaluate_number(float(in_val))
+
+		return predicate_f
+
 
 class StringCommonPrefix(StringPatternDetector):
 	def __init__(self, pd_obj_id, columns, pattern_log, expr_tree, null_value):
@@ -1199,6 +1370,37 @@ class CharSetSplit(StringPatternDetector):
 
 		return operator
 
+	@classmethod
+	def get_operator_dispatch(cls, cols_in, operator_info, null_value):
+		'''
+		NOTE: if the char sets are disjoint, split_attr() succeeds iff the
+			  pattern string of the attr is operator_info["pattern_string"], so
+			  that string is the dispatch key
+
+		Returns: None if the char sets overlap (no pre-check)
+		'''
+		default_placeholder = None
+		char_map = {}
+		for ph, c_set in operator_info["char_sets"].items():
+			if c_set["name"] == "default":
+				default_placeholder = c_set["placeholder"]
+				continue
+			for c in c_set["char_set"]:
+				if c in char_map:
+					return None
+				char_map[c] = c_set["placeholder"]
+		dispatch_id = "{}:{}".format(cls.__name__, sorted(char_map.items()))
+
+		def key_f(attrs):
+			pattern_string = []
+			for c in attrs[0]:
+				ph = char_map.get(c, default_placeholder)
+				if len(pattern_string) == 0 or pattern_string[-1] != ph:
+					pattern_string.append(ph)
+			return "".join(pattern_string)
+
+		return (dispatch_id, key_f, operator_info["pattern_string"])
+
 	@classmethod
 	def get_metadata_size(cls, operator_info):
 		char_sets = operator_info["char_sets"]
@@ -1222,6 +1424,42 @@ class CharSetSplit(StringPatternDetector):
 
 		return operator
 
+	@classmethod
+	def match_fragments(cls, attrs, match_s, exact):
+		'''
+		Returns: True if "".join(attrs) starts with (exact=False) or is equal
+				 to (exact=True) match_s; stops at the first fragment that
+				 does not match
+		'''
+		pos = 0
+		for attr in attrs:
+			if not exact and len(attr) >= len(match_s) - pos:
+				return attr.startswith(match_s[pos:])
+			if not match_s.startswith(attr, pos):
+				return False
+			pos += len(attr)
+		return pos == len(match_s)
+
+	@classmethod
+	def get_predicate_dec(cls, cols_in, cols_out, operator_dec_info, null_value, predicate):
+		'''
+		NOTE: prefix (LIKE '<prefix>%') & string equality predicates are
+			  checked against the split fragments, without concatenating them
+		'''
+		if predicate.prefix is not None:
+			match_s, exact = predicate.prefix, False
+		elif predicate.is_string_equality():
+			match_s, exact = predicate.literal, True
+		else:
+			return None
+
+		def predicate_f(attrs):
+			if null_value in attrs:
+				raise OperatorException("[{}] expression node not used in the compression phase".format(cls.__name__))
+			return cls.match_fragments(attrs, match_s, exact)
+
+		return predicate_f
+
 
 class NGramFreqSplit(StringPatternDetector):
 	def __init__(self, pd_obj_id, columns, pattern_log, expr_tree, null_value,
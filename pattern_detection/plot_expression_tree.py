@@ -133,14 +133,14 @@ repo_wbs_dir=/scratch/bogdan/master-project/public_bi_benchmark-master_project/b
 wbs_dir=/export/scratch1/bogdan/tableau-public-bench/data/PublicBIbenchmark-poc_1
 repo_wbs_dir=/ufs/bogdan/work/master-project/public_bi_benchmark-master_project/benchmark
 
-input_file=$wbs_dir/CommonGovernment/CommonGovernment_1.expr_tree/c_tree.json
+input_file=$wbs_dir/CommonGovernment/CommonGovernment_1.expr_tree/c_tree.bin
 output_file=$wbs_dir/CommonGovernment/CommonGovernment_1.expr_tree/c_tree.svg
 
 ./pattern_detection/plot_expression_tree.py $input_file --out-file $output_file
 
 ================================================================================
 [debug_values]
-input_file=$wbs_dir/CommonGovernment/CommonGovernment_1.expr_tree/c_tree.json
+input_file=$wbs_dir/CommonGovernment/CommonGovernment_1.expr_tree/c_tree.bin
 c_output_file=$wbs_dir/CommonGovernment/CommonGovernment_1.expr_tree/c_debug_c_tree.svg
 dec_output_file=$wbs_dir/CommonGovernment/CommonGovernment_1.expr_tree/dec_debug_c_tree.svg
 c_debug_values_file=$wbs_dir/CommonGovernment/CommonGovernment_1.expr_tree/c_debug_values.json
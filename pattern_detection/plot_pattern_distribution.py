@@ -24,6 +24,18 @@ def plot(plt, header, rows, out_file=None, out_file_format="svg"):
 
 
 def read_data(input_file):
+	"""
+	Reads either:
+		- .npz: "header" (patterns) and "bitmaps" (one np.packbits() row
+		  bitmap per pattern) of <nb_rows> bits each
+		- csv: header line followed by one 0/1 line per row
+	"""
+	if input_file.endswith(".npz"):
+		with np.load(input_file) as data:
+			header = list(data["header"])
+			bitmaps = np.unpackbits(data["bitmaps"], axis=1, count=int(data["nb_rows"]))
+		return header, bitmaps.T
+
 	rows = []
 	with open(input_file, 'r') as fd:
 		header = fd.readline().split(",")
@@ -37,7 +49,7 @@ def parse_args():
 		description="""Plot pattern distribution accross the rows of a column."""
 	)
 
-	parser.add_argument('file', help='Pattern distribution file')
+	parser.add_argument('file', help='Pattern distribution file (.npz or csv)')
 	parser.add_argument('--out-file', dest='out_file', type=str,
 		help="Output file to save plot to")
 	parser.add_argument('--out-file-format', dest='out_file_format', type=str,
@@ -67,7 +79,7 @@ if __name__ == "__main__":
 
 """
 # input_file=/scratch/bogdan/tableau-public-bench/data/PublicBIbenchmark-test/CommonGovernment/CommonGovernment_1.patterns/col_48.csv
-input_file=/ufs/bogdan/work/master-project/whitebox-compression/pattern_detection/output/col_48.csv
+input_file=/ufs/bogdan/work/master-project/whitebox-compression/pattern_detection/output/col_48.npz
 output_file_format=svg
 output_file=/ufs/bogdan/work/master-project/whitebox-compression/pattern_detection/output/col_48.$output_file_format
 
@@ -3,8 +3,8 @@ import sys
 import argparse
 import json
 import string
-from copy import deepcopy
 from lib.util import *
+from lib.instrumentation import instrumentation
 from lib.pattern_selectors import *
 from patterns import *
 from apply_expression import ExpressionManager
@@ -12,7 +12,7 @@ from lib.expression_tree import ExpressionTree
 
 
 # debug
-from plot_expression_tree import plot_expression_tree
+# from plot_expression_tree import plot_expression_tree
 import shutil
 DEBUG_COUNTER = 0
 def rm_rf(target):
@@ -36,6 +36,7 @@ pattern_detectors = {
 			"drop_single_char_pattern": True
 	}
 }
+pfor_percentile = 0.9
 
 
 def init_pattern_detectors(col_in, expression_tree, null_value):
@@ -65,7 +66,11 @@ def init_estimators_train(col_in, null_value, no_compression=False):
 			# DictEstimatorTrain(columns, null_value,
 			# 			  	   max_dict_size),
 			RleEstimatorTrain(columns, null_value),
-			ForEstimatorTrain(columns, null_value)
+			ForEstimatorTrain(columns, null_value),
+			PforEstimatorTrain(columns, null_value,
+							   pfor_percentile),
+			DeltaEstimatorTrain(columns, null_value),
+			DeltaForEstimatorTrain(columns, null_value)
 		]
 	return res
 
@@ -80,7 +85,10 @@ def init_estimators_test(col_in, metadata, null_value, no_compression=False):
 			NoCompressionEstimatorTest(columns, metadata["NoCompressionEstimator"], null_value),
 			# DictEstimatorTest(columns, metadata["DictEstimator"], null_value),
 			RleEstimatorTest(columns, metadata["RleEstimator"], null_value),
-			ForEstimatorTest(columns, metadata["ForEstimator"], null_value)
+			ForEstimatorTest(columns, metadata["ForEstimator"], null_value),
+			PforEstimatorTest(columns, metadata["PforEstimator"], null_value),
+			DeltaEstimatorTest(columns, metadata["DeltaEstimator"], null_value),
+			DeltaForEstimatorTest(columns, metadata["DeltaForEstimator"], null_value)
 		]
 	return res
 
@@ -172,22 +180,27 @@ class RecursiveExhaustiveLearning(object):
 
 		# estimator train
 		estimator_train_list = init_estimators_train(col_in, self.args.null)
+		feed_functions = [instrumentation.instrument("estimator.{}.feed_tuple".format(estimator.__class__.__name__), estimator.feed_tuple)
+						  for estimator in estimator_train_list]
 		# data loop
 		data_mgr_in.read_seek_set()
 		while True:
 			attr = data_mgr_in.read_tuple()
 			if attr is None:
 				break
-			for estimator in estimator_train_list:
-				estimator.feed_tuple([attr])
+			for feed_f in feed_functions:
+				feed_f([attr])
 		# retrieve metadata
 		metadata = {}
 		for estimator in estimator_train_list:
-			res = estimator.evaluate()
+			with instrumentation.timer("estimator.{}.evaluate".format(estimator.__class__.__name__)):
+				res = estimator.evaluate()
 			metadata[estimator.name] = res
 
 		# estimator test
 		estimator_test_list = init_estimators_test(col_in, metadata, self.args.null)
+		feed_functions = [instrumentation.instrument("estimator.{}.feed_tuple".format(estimator.__class__.__name__), estimator.feed_tuple)
+						  for estimator in estimator_test_list]
 		# data loop
 		data_mgr_in.read_seek_set()
 		sample_tuple_count_test = 0
@@ -196,11 +209,12 @@ class RecursiveExhaustiveLearning(object):
 			if attr is None:
 				break
 			sample_tuple_count_test += 1
-			for estimator in estimator_test_list:
-				estimator.feed_tuple([attr])
+			for feed_f in feed_functions:
+				feed_f([attr])
 		# evaluate estimators
 		for estimator in estimator_test_list:
-			res = estimator.evaluate()
+			with instrumentation.timer("estimator.{}.evaluate".format(estimator.__class__.__name__)):
+				res = estimator.evaluate()
 			if col_in.col_id not in res:
 				continue
 			size_list = res[col_in.col_id]
@@ -220,15 +234,17 @@ class RecursiveExhaustiveLearning(object):
 		expr_node_list = []
 
 		# feed attrs to the pattern detector
+		feed_f = instrumentation.instrument("detector.{}.feed_tuple".format(pd.name), pd.feed_tuple)
 		data_mgr_in.read_seek_set()
 		while True:
 			attr = data_mgr_in.read_tuple()
 			if attr is None:
 				break
-			pd.feed_tuple([attr])
+			feed_f([attr])
 
 		# evaluate pattern detector
-		columns = pd.evaluate()
+		with instrumentation.timer("detector.{}.evaluate".format(pd.name)):
+			columns = pd.evaluate()
 		if col_in.col_id not in columns:
 			return []
 		patterns = columns[col_in.col_id]
@@ -273,7 +289,7 @@ class RecursiveExhaustiveLearning(object):
 
 	def _apply_expr_node(self, col_in, expr_node, tree_in, data_mgr_in):
 		# update tree
-		tree_out = deepcopy(tree_in)
+		tree_out = tree_in.copy()
 		tree_out.add_level([expr_node])
 
 		# apply expression node
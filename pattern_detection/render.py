@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+"""
+Deferred rendering of the learning diagnostics (plots)
+
+The learning loop (main.py) only writes data files and adds a render job for
+each plot to the RenderManifest; depending on the render mode, the jobs are:
+	- inline: rendered in the learning process, as soon as they are added
+	- background: rendered by a pool of worker processes, while learning goes on
+	- deferred: only written to the manifest file; render them later with:
+	  ./pattern_detection/render.py <manifest_file>
+
+Manifest file format (json):
+	{"mode": mode, "jobs": [{"renderer": renderer, "args": {...}}, ...]}
+NOTE: renderers import the plotting modules (matplotlib, pydot) on first use
+"""
+RENDER_MODES = ["inline", "background", "deferred"]
+MANIFEST_FILE = "render_manifest.json"
+
+
+def render_pattern_distribution(in_file, out_file, out_file_format="svg"):
+	import plot_pattern_distribution
+	plot_pattern_distribution.main(in_file=in_file, out_file=out_file, out_file_format=out_file_format)
+
+
+def render_ngram_freq_masks(in_file, out_file, out_file_format="svg"):
+	import plot_ngram_freq_masks
+	plot_ngram_freq_masks.main(in_file=in_file, out_file=out_file, out_file_format=out_file_format)
+
+
+def render_correlation_coefficients(in_file, out_file, out_file_format="svg"):
+	import plot_correlation_coefficients
+	plot_correlation_coefficients.main(in_file=in_file, out_file=out_file, out_file_format=out_file_format)
+
+
+def render_correlation_graph(in_file, out_file):
+	from plot_correlation_graph import plot_correlation_graph
+	with open(in_file, 'r') as fd:
+		corrs = json.load(fd)
+	plot_correlation_graph(corrs, out_file)
+
+
+def render_expression_tree(in_file, out_file, ignore_unused_columns=False):
+	from lib.expression_tree import read_expr_tree
+	from plot_expression_tree import plot_expression_tree
+	plot_expression_tree(read_expr_tree(in_file), out_file, ignore_unused_columns=ignore_unused_columns)
+
+
+RENDERERS = {
+	"pattern_distribution": render_pattern_distribution,
+	"ngram_freq_masks": render_ngram_freq_masks,
+	"correlation_coefficients": render_correlation_coefficients,
+	"correlation_graph": render_correlation_graph,
+	"expression_tree": render_expression_tree
+}
+
+
+def render_job(job):
+	if job["renderer"] not in RENDERERS:
+		raise Exception("Invalid renderer: {}".format(job["renderer"]))
+	RENDERERS[job["renderer"]](**job["args"])
+
+
+class RenderWorkerPool(object):
+	"""
+	Renders jobs in background processes
+
+	NOTE: max_workers=None uses one process per CPU
+	NOTE: wait() must be called before exiting; it reports failed jobs
+	"""
+	def __init__(self, max_workers=None):
+		self.max_workers = max_workers
+		self.executor = None
+		self.futures = []
+
+	def submit(self, job):
+		if self.executor is None:
+			self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+		self.futures.append((self.executor.submit(render_job, job), job))
+
+	def wait(self):
+		"""
+		Returns: number of failed jobs
+		"""
+		error_count = 0
+		for (future, job) in self.futures:
+			try:
+				future.result()
+			except Exception as e:
+				print("[render] error: {}, job={}".format(e, job))
+				error_count += 1
+		self.futures = []
+		if self.executor is not None:
+			self.executor.shutdown()
+			self.executor = None
+		return error_count
+
+
+class RenderManifest(object):
+	def __init__(self, manifest_file=None, mode="inline", max_workers=None):
+		self.open(manifest_file, mode, max_workers)
+
+	def open(self, manifest_file, mode, max_workers=None):
+		"""
+		Params:
+			manifest_file: written by close(); None: no manifest (only valid
+						   for the inline & background modes)
+		"""
+		if mode not in RENDER_MODES:
+			raise Exception("Invalid render mode: {}".format(mode))
+		if mode == "deferred" and manifest_file is None:
+			raise Exception("Deferred rendering needs a manifest file")
+		self.manifest_file = manifest_file
+		self.mode = mode
+		self.jobs = []
+		self.pool = RenderWorkerPool(max_workers) if mode == "background" else None
+
+	def add(self, renderer, **kwargs):
+		"""
+		NOTE: file args (*_file) are made absolute, so that deferred jobs can
+			  be rendered from any working dir
+		"""
+		if renderer not in RENDERERS:
+			raise Exception("Invalid renderer: {}".format(renderer))
+		args = {k: os.path.abspath(v) if k.endswith("_file") else v for k, v in kwargs.items()}
+		job = {"renderer": renderer, "args": args}
+		self.jobs.append(job)
+		if self.mode == "inline":
+			render_job(job)
+		elif self.mode == "background":
+			self.pool.submit(job)
+
+	def close(self):
+		"""
+		Writes the manifest & waits for the background jobs
+
+		Returns: number of failed jobs
+		"""
+		error_count = 0
+		if self.pool is not None:
+			error_count = self.pool.wait()
+		if self.manifest_file is not None:
+			with open(self.manifest_file, 'w') as fd:
+				json.dump({"mode": self.mode, "jobs": self.jobs}, fd, indent=2)
+			if self.mode == "deferred":
+				print("[render] deferred {} jobs; run: {} {}".format(len(self.jobs), os.path.abspath(__file__), self.manifest_file))
+		return error_count
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description="""Render the plots of a render manifest written by main.py."""
+	)
+
+	parser.add_argument('file', help='Render manifest file')
+	parser.add_argument('--workers', dest='workers', type=int,
+		help="Number of worker processes (default: number of CPUs); 0: render in this process")
+	parser.add_argument('--renderer', dest='renderers', type=str, action='append', choices=sorted(RENDERERS.keys()),
+		help="Render only the jobs of this renderer (can be repeated)")
+	parser.add_argument('--skip-existing', dest='skip_existing', action='store_true',
+		help="Skip jobs whose output file is newer than their input file")
+
+	return parser.parse_args()
+
+
+def is_up_to_date(job):
+	args = job["args"]
+	return (os.path.isfile(args["out_file"]) and
+			os.path.getmtime(args["out_file"]) >= os.path.getmtime(args["in_file"]))
+
+
+def main():
+	args = parse_args()
+	print(args)
+
+	with open(args.file, 'r') as fd:
+		manifest = json.load(fd)
+
+	jobs = manifest["jobs"]
+	if args.renderers is not None:
+		jobs = [job for job in jobs if job["renderer"] in args.renderers]
+	if args.skip_existing:
+		jobs = [job for job in jobs if not is_up_to_date(job)]
+
+	start = time.perf_counter()
+	render_manifest = RenderManifest(mode="inline" if args.workers == 0 else "background", max_workers=args.workers)
+	for job in jobs:
+		render_manifest.add(job["renderer"], **job["args"])
+	error_count = render_manifest.close()
+	print("[render] jobs={}, errors={}, duration={:.2f}s".format(len(jobs), error_count, time.perf_counter() - start))
+	if error_count > 0:
+		raise Exception("{} render jobs failed".format(error_count))
+
+
+if __name__ == "__main__":
+	main()
+
+
+"""
+expr_tree_output_dir=$wbs_dir/$wb/$table.expr_tree
+
+./pattern_detection/render.py $expr_tree_output_dir/render_manifest.json
+"""
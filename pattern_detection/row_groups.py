@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import json
+import random
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from lib.expression_tree import read_expr_tree, get_expr_tree_file, TREE_FORMATS
+from lib.row_index import parse_rows
+
+
+"""
+Row-group mode: the input file is split into blocks of <row-group-size> rows
+and each block gets its own expression tree, learned on the block (or on a
+sample of it), so that patterns that are local to a row range (constants,
+small dictionaries, formats of sorted/clustered tables) are captured
+
+compress: for each block, in parallel worker processes:
+	1) learn the expression tree (main.py)
+	2) apply it to the block (apply_expression.py)
+decompress: decompresses a row range (and a column projection) from the row
+			groups that overlap it (decompression/main.py --rows --columns)
+
+Output (<output-dir>):
+	<out-table-name>.row_groups.json: metadata (see get_metadata())
+	<out-table-name>.row_groups/rg_<idx>/: c_tree, dec_tree, <out-table-name>.{csv,nulls.csv,header.csv,table.sql,stats.json}
+
+NOTE-1: blocks with an empty expression tree (no pattern found) are raw: the
+		block is kept as it is (<out-table-name>.csv)
+NOTE-2: the sample of a block is drawn with a seed derived from the block
+		index, so that the trees do not depend on the order in which the
+		blocks are processed
+"""
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LEARNING_SCRIPT = os.path.join(SCRIPT_DIR, "main.py")
+APPLY_SCRIPT = os.path.join(SCRIPT_DIR, "apply_expression.py")
+DECOMPRESSION_SCRIPT = os.path.join(os.path.dirname(SCRIPT_DIR), "decompression", "main.py")
+DEFAULT_ROW_GROUP_SIZE = 100000
+METADATA_FILE_SUFFIX = "row_groups.json"
+BLOCK_INPUT_FILE = "input.csv"
+BLOCK_SAMPLE_FILE = "sample.csv"
+
+
+def get_metadata_file(output_dir, out_table_name):
+	return os.path.join(output_dir, "{}.{}".format(out_table_name, METADATA_FILE_SUFFIX))
+
+
+def run_step(cmd, log_file):
+	with open(log_file, 'w') as fd_log:
+		returncode = subprocess.call(cmd, stdout=fd_log, stderr=subprocess.STDOUT)
+	if returncode != 0:
+		raise Exception("Step failed: returncode={}, log_file={}".format(returncode, log_file))
+
+
+def iter_blocks(fd_in, row_group_size):
+	"""
+	Returns: iterator over list(line) with <row_group_size> lines (the last one may be shorter)
+	"""
+	block = []
+	for line in fd_in:
+		block.append(line.rstrip('\r\n'))
+		if len(block) == row_group_size:
+			yield block
+			block = []
+	if len(block) > 0:
+		yield block
+
+
+def write_lines(lines, file):
+	with open(file, 'w') as fd:
+		for line in lines:
+			fd.write(line + "\n")
+
+
+class RowGroupCompressor(object):
+	def __init__(self, args):
+		self.args = args
+		self.row_groups_dir = os.path.join(args.output_dir, "{}.row_groups".format(args.out_table_name))
+		self.common_args = ["--header-file", args.header_file, "--datatypes-file", args.datatypes_file,
+							"-F", args.fdelim, "--null", args.null]
+
+	def prepare_block(self, idx, block):
+		"""
+		Writes the block (and its sample) to its row group dir
+		Returns: (rg_dir, block_file, learning_file)
+		"""
+		rg_dir = os.path.join(self.row_groups_dir, "rg_{}".format(idx))
+		if os.path.exists(rg_dir):
+			shutil.rmtree(rg_dir)
+		os.makedirs(rg_dir)
+		block_file = os.path.join(rg_dir, BLOCK_INPUT_FILE)
+		write_lines(block, block_file)
+		learning_file = block_file
+		if self.args.sample_size is not None and len(block) > self.args.sample_size:
+			rows = sorted(random.Random(idx).sample(range(len(block)), self.args.sample_size))
+			learning_file = os.path.join(rg_dir, BLOCK_SAMPLE_FILE)
+			write_lines([block[r] for r in rows], learning_file)
+		return (rg_dir, block_file, learning_file)
+
+	def compress_block(self, idx, row_start, row_count, rg_dir, block_file, learning_file):
+		"""
+		Returns: row group metadata; file paths are relative to <output-dir>
+		"""
+		args = self.args
+		tree_format = args.tree_format
+		c_tree_file = get_expr_tree_file(rg_dir, "c_tree", tree_format)
+		dec_tree_file = get_expr_tree_file(rg_dir, "dec_tree", tree_format)
+		data_file = os.path.join(rg_dir, "{}.csv".format(args.out_table_name))
+
+		# learn
+		cmd = [sys.executable, LEARNING_SCRIPT] + self.common_args + ["--expr-tree-output-dir", rg_dir, "--tree-format", tree_format] + args.learning_args + [learning_file]
+		run_step(cmd, os.path.join(rg_dir, "learning.log"))
+		if learning_file != block_file:
+			os.remove(learning_file)
+
+		# apply
+		c_tree = read_expr_tree(c_tree_file)
+		raw = len(c_tree.levels) == 0
+		if raw:
+			os.rename(block_file, data_file)
+		else:
+			# NOTE: the drift monitor is meaningless here; the tree was learned on this block
+			cmd = [sys.executable, APPLY_SCRIPT] + self.common_args + ["--expr-tree-file", c_tree_file,
+				"--output-dir", rg_dir, "--out-table-name", args.out_table_name, "--drift-window", "0"] + args.apply_args + [block_file]
+			run_step(cmd, os.path.join(rg_dir, "apply.log"))
+			os.remove(block_file)
+
+		rel = lambda f: os.path.relpath(f, args.output_dir)
+		rg = {
+			"idx": idx,
+			"row_start": row_start,
+			"row_count": row_count,
+			"raw": raw,
+			"node_count": len(c_tree.nodes),
+			"data_file": rel(data_file)
+		}
+		if not raw:
+			rg.update({
+				"c_tree_file": rel(c_tree_file),
+				"dec_tree_file": rel(dec_tree_file),
+				"nulls_file": rel(os.path.join(rg_dir, "{}.nulls.csv".format(args.out_table_name))),
+				"header_file": rel(os.path.join(rg_dir, "{}.header.csv".format(args.out_table_name))),
+				"stats_file": rel(os.path.join(rg_dir, "{}.stats.json".format(args.out_table_name)))
+			})
+		rg["size_B"] = sum(os.path.getsize(os.path.join(args.output_dir, rg[k])) for k in ["data_file", "nulls_file", "dec_tree_file"] if k in rg)
+		return rg
+
+	def compress(self, fd_in):
+		"""
+		Returns: metadata (see get_metadata())
+		"""
+		args = self.args
+		futures = []
+		row_start = 0
+		with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+			for idx, block in enumerate(iter_blocks(fd_in, args.row_group_size)):
+				(rg_dir, block_file, learning_file) = self.prepare_block(idx, block)
+				futures.append(executor.submit(self.compress_block, idx, row_start, len(block), rg_dir, block_file, learning_file))
+				row_start += len(block)
+			row_groups = [f.result() for f in futures]
+		return get_metadata(args, row_groups, row_start)
+
+
+def get_metadata(args, row_groups, row_count):
+	"""
+	Metadata format (json):
+		row_group_size: int
+		row_count: int # total number of rows
+		fdelim, null: str
+		out_header_file: str # header of the original table
+		row_groups: list(
+			dict(
+				idx: int,
+				row_start: int, # index of the first row of the row group in the input file
+				row_count: int,
+				raw: bool, # see NOTE-1 of the module
+				node_count: int, # number of nodes of the expression tree
+				data_file, [nulls_file, header_file, c_tree_file, dec_tree_file, stats_file]: str, # relative to the metadata file dir
+				size_B: int # size of the data, nulls & dec_tree files
+			)
+		)
+	"""
+	return {
+		"row_group_size": args.row_group_size,
+		"row_count": row_count,
+		"fdelim": args.fdelim,
+		"null": args.null,
+		"out_header_file": os.path.abspath(args.header_file),
+		"row_groups": row_groups
+	}
+
+
+def get_row_groups(metadata, row_start, row_end):
+	"""
+	Returns: the row groups that overlap the row range [row_start, row_end)
+	NOTE: row groups are sorted by row_start; with fixed-size blocks, the
+		  first one is found directly
+	"""
+	row_groups = metadata["row_groups"]
+	first = min(row_start // metadata["row_group_size"], len(row_groups))
+	res = []
+	for rg in row_groups[first:]:
+		if rg["row_start"] >= row_end:
+			break
+		if rg["row_start"] + rg["row_count"] > row_start:
+			res.append(rg)
+	return res
+
+
+def read_raw_row_group(data_file, fdelim, rows, column_positions, fd_out):
+	"""
+	Returns: number of rows written
+	"""
+	(row_start, row_end) = rows
+	row_count = 0
+	with open(data_file, 'r') as fd:
+		for idx, line in enumerate(fd):
+			if idx < row_start:
+				continue
+			if idx >= row_end:
+				break
+			if column_positions is not None:
+				tpl = line.rstrip('\r\n').split(fdelim)
+				line = fdelim.join(tpl[pos] for pos in column_positions) + "\n"
+			fd_out.write(line)
+			row_count += 1
+	return row_count
+
+
+def decompress_row_group(rg, metadata_dir, metadata, out_header_file, rows, columns, tmp_dir):
+	"""
+	Decompresses the rows <rows> (relative to the row group) of <columns>
+	(None: all); see decompression/main.py --rows & --columns
+	Returns: output file
+	"""
+	data_file = os.path.join(metadata_dir, rg["data_file"])
+	output_file = os.path.join(tmp_dir, "rg_{}.csv".format(rg["idx"]))
+	cmd = [sys.executable, DECOMPRESSION_SCRIPT,
+		"--in-header-file", os.path.join(metadata_dir, rg["header_file"]),
+		"--out-header-file", out_header_file,
+		"--nulls-file", os.path.join(metadata_dir, rg["nulls_file"]),
+		"--expr-tree-file", os.path.join(metadata_dir, rg["dec_tree_file"]),
+		"--output-file", output_file,
+		"-F", metadata["fdelim"], "--null", metadata["null"],
+		"--rows", "{}:{}".format(*rows)]
+	if columns is not None:
+		cmd += ["--columns", ",".join(columns)]
+	run_step(cmd + [data_file], os.path.join(tmp_dir, "rg_{}.log".format(rg["idx"])))
+	return output_file
+
+
+def decompress(metadata_file, output_file, row_start=0, row_end=None, out_header_file=None, columns=None, jobs=None):
+	"""
+	Decompresses the rows [row_start, row_end) of <columns> (None: all) to <output_file>
+	Returns: number of rows written
+	"""
+	with open(metadata_file, 'r') as fd:
+		metadata = json.load(fd)
+	metadata_dir = os.path.dirname(os.path.abspath(metadata_file))
+	if row_end is None or row_end > metadata["row_count"]:
+		row_end = metadata["row_count"]
+	if out_header_file is None:
+		out_header_file = metadata["out_header_file"]
+	row_groups = get_row_groups(metadata, row_start, row_end)
+	# NOTE: raw row groups are projected here
+	column_positions = None
+	if columns is not None:
+		with open(out_header_file, 'r') as fd:
+			header = [x.strip() for x in fd.readline().split(metadata["fdelim"])]
+		for col_name in columns:
+			if col_name not in header:
+				raise Exception("Invalid projection column: {}".format(col_name))
+		column_positions = [header.index(col_name) for col_name in columns]
+
+	# row range of each row group, relative to the row group; row groups with an empty range are skipped
+	rg_rows = [(max(row_start - rg["row_start"], 0), min(row_end - rg["row_start"], rg["row_count"])) for rg in row_groups]
+	(row_groups, rg_rows) = ([rg for rg, rows in zip(row_groups, rg_rows) if rows[1] > rows[0]],
+							 [rows for rows in rg_rows if rows[1] > rows[0]])
+
+	row_count = 0
+	with tempfile.TemporaryDirectory() as tmp_dir, ThreadPoolExecutor(max_workers=jobs) as executor:
+		futures = [None if rg["raw"] else executor.submit(decompress_row_group, rg, metadata_dir, metadata, out_header_file, rows, columns, tmp_dir)
+				   for rg, rows in zip(row_groups, rg_rows)]
+		with open(output_file, 'w') as fd_out:
+			for rg, rows, future in zip(row_groups, rg_rows, futures):
+				if rg["raw"]:
+					row_count += read_raw_row_group(os.path.join(metadata_dir, rg["data_file"]), metadata["fdelim"], rows, column_positions, fd_out)
+					continue
+				with open(future.result(), 'r') as fd_rg:
+					for line in fd_rg:
+						fd_out.write(line)
+						row_count += 1
+	return row_count
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description="""Row-group mode: one expression tree per block of rows."""
+	)
+	subparsers = parser.add_subparsers(dest="command")
+	subparsers.required = True
+
+	parser_c = subparsers.add_parser("compress", help="Learn & apply one expression tree per row group")
+	parser_c.add_argument('file', metavar='FILE', nargs='?',
+		help='CSV file to process. Stdin if none given')
+	parser_c.add_argument('--header-file', dest='header_file', type=str,
+		help="CSV file containing the header row (<workbook>/samples/<table>.header-renamed.csv)",
+		required=True)
+	parser_c.add_argument('--datatypes-file', dest='datatypes_file', type=str,
+		help="CSV file containing the datatypes row (<workbook>/samples/<table>.datatypes.csv)",
+		required=True)
+	parser_c.add_argument('--output-dir', dest='output_dir', type=str,
+		help="Output dir to put output files in",
+		required=True)
+	parser_c.add_argument('--out-table-name', dest='out_table_name', type=str,
+		help="Name of the table",
+		required=True)
+	parser_c.add_argument("--row-group-size", dest="row_group_size", type=int,
+		help="Number of rows per row group", default=DEFAULT_ROW_GROUP_SIZE)
+	parser_c.add_argument("--sample-size", dest="sample_size", type=int,
+		help="Learn the tree of each row group on a sample of <sample-size> rows (default: all the rows)")
+	parser_c.add_argument("--jobs", dest="jobs", type=int,
+		help="Number of row groups processed in parallel (default: number of CPUs)")
+	parser_c.add_argument("--tree-format", dest="tree_format", type=str, choices=TREE_FORMATS,
+		help="Format of the expression tree files", default="binary")
+	parser_c.add_argument("--learning-args", dest="learning_args", type=str,
+		help="Extra arguments for main.py; e.g. --learning-args=\"--rec-exh\"", default="")
+	parser_c.add_argument("--apply-args", dest="apply_args", type=str,
+		help="Extra arguments for apply_expression.py; e.g. --apply-args=\"--operator-order coverage\"", default="")
+	parser_c.add_argument("-F", "--fdelim", dest="fdelim",
+		help="Use <fdelim> as delimiter between fields", default="|")
+	parser_c.add_argument("--null", dest="null", type=str,
+		help="Interprets <NULL> as NULLs", default="null")
+
+	parser_d = subparsers.add_parser("decompress", help="Decompress a row range")
+	parser_d.add_argument('metadata_file', metavar='METADATA_FILE',
+		help="<output-dir>/<out-table-name>.{}".format(METADATA_FILE_SUFFIX))
+	parser_d.add_argument('--output-file', dest='output_file', type=str,
+		help="Path to output file to write decompressed data to",
+		required=True)
+	parser_d.add_argument("--rows", dest="rows", type=parse_rows,
+		help="Row range <start>:<end> to decompress (end exclusive; default: all)", default=(0, None))
+	parser_d.add_argument("--columns", dest="columns", type=str,
+		help="Comma separated names of the columns to decompress, in this order (default: all)")
+	parser_d.add_argument('--out-header-file', dest='out_header_file', type=str,
+		help="Header of the original table (default: the one used for compression)")
+	parser_d.add_argument("--jobs", dest="jobs", type=int,
+		help="Number of row groups decompressed in parallel (default: number of CPUs)")
+
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+	print(args)
+
+	if args.command == "decompress":
+		(row_start, row_end) = args.rows
+		columns = args.columns.split(",") if args.columns is not None else None
+		row_count = decompress(args.metadata_file, args.output_file, row_start, row_end, args.out_header_file, columns, args.jobs)
+		print("[row_groups] rows={}:{}, row_count={}".format(row_start, row_end, row_count))
+		return
+
+	if args.row_group_size <= 0:
+		raise Exception("Invalid row group size: {}".format(args.row_group_size))
+	args.learning_args = args.learning_args.split()
+	args.apply_args = args.apply_args.split()
+	if not os.path.exists(args.output_dir):
+		os.makedirs(args.output_dir)
+
+	compressor = RowGroupCompressor(args)
+	try:
+		if args.file is None:
+			fd_in = os.fdopen(os.dup(sys.stdin.fileno()))
+		else:
+			fd_in = open(args.file, 'r')
+		metadata = compressor.compress(fd_in)
+	finally:
+		try:
+			fd_in.close()
+		except:
+			pass
+
+	metadata_file = get_metadata_file(args.output_dir, args.out_table_name)
+	with open(metadata_file, 'w') as fd:
+		json.dump(metadata, fd, indent=2)
+
+	for rg in metadata["row_groups"]:
+		print("[row_group] idx={}, row_start={}, row_count={}, raw={}, node_count={}, size_B={}".format(
+			rg["idx"], rg["row_start"], rg["row_count"], rg["raw"], rg["node_count"], rg["size_B"]))
+	print("[row_groups] row_count={}, row_groups={}, size_B={}, metadata_file={}".format(
+		metadata["row_count"], len(metadata["row_groups"]), sum(rg["size_B"] for rg in metadata["row_groups"]), metadata_file))
+
+
+if __name__ == "__main__":
+	main()
+
+
+"""
+wbs_dir=/scratch/bogdan/tableau-public-bench/data/PublicBIbenchmark-test
+repo_wbs_dir=/scratch/bogdan/master-project/public_bi_benchmark-master_project/benchmark
+
+================================================================================
+wb=CommonGovernment
+table=CommonGovernment_1
+
+================================================================================
+out_table="${table}_out"
+output_dir=$wbs_dir/$wb/$table.poc_1_out-row_groups
+
+# [compress]
+mkdir -p $output_dir && \
+time ./pattern_detection/row_groups.py compress --header-file $repo_wbs_dir/$wb/samples/$table.header-renamed.csv --datatypes-file $repo_wbs_dir/$wb/samples/$table.datatypes.csv \
+--output-dir $output_dir --out-table-name $out_table \
+--row-group-size 100000 --sample-size 10000 \
+$wbs_dir/$wb/$table.csv
+
+# [decompress]
+time ./pattern_detection/row_groups.py decompress --output-file $output_dir/$table.decompressed.csv \
+--rows 250000:260000 --columns col_1,col_5 \
+$output_dir/$out_table.row_groups.json
+"""
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import json
+import time
+import subprocess
+import numpy as np
+from lib.util import *
+
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+REPO_DIR = os.path.dirname(SCRIPT_DIR)
+
+"""
+Benchmark runner: generates synthetic tables with the schemas of a testset and
+runs sampling -> pattern_detection -> apply_expression -> theoretical
+evaluation on them, recording for each stage: wall time, peak RSS and rows/s;
+the size estimated by the theoretical evaluation is compared with the real
+size of the compressed columns written by apply_expression
+
+NOTE: each stage runs in its own process, so peak RSS is per stage
+NOTE: the estimate compared with the real size only uses the estimators of
+	  the codecs apply_expression implements (CODEC_ESTIMATORS); the estimate
+	  with all the estimators (PFOR, Delta, DeltaFOR) is reported as
+	  estimated_all_B
+"""
+# NOTE: same codecs as pattern_detection/lib/column_codecs.py (codec_list)
+CODEC_ESTIMATORS = ["NoCompressionEstimator", "DictEstimator", "RleEstimator", "ForEstimator"]
+VARCHAR_FORMATS = ["code", "number", "word", "prefixed"]
+LETTERS = list("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel",
+		 "india", "juliett", "kilo", "lima", "mike", "november", "oscar", "papa"]
+INTEGER_RANGES = {
+	"tinyint": (-128, 127),
+	"smallint": (-32768, 32767),
+	"int": (-2**31, 2**31 - 1),
+	"integer": (-2**31, 2**31 - 1),
+	"bigint": (-2**63, 2**63 - 1),
+}
+
+
+# =========================================================================== #
+# Synthetic data
+# =========================================================================== #
+
+
+def gen_varchar_value(fmt, max_len, rng):
+	if fmt == "code":
+		val = "{}-{:04d}-{}".format("".join(rng.choice(LETTERS, 2)), rng.integers(0, 10000), rng.choice(LETTERS))
+	elif fmt == "number":
+		val = str(rng.integers(0, 10**min(9, max_len)))
+	elif fmt == "word":
+		val = " ".join(rng.choice(WORDS, rng.integers(1, 3)))
+	elif fmt == "prefixed":
+		val = "ID{}".format(rng.integers(0, 10**6))
+	else:
+		raise Exception("Unknown varchar format: {}".format(fmt))
+	return val[:max_len]
+
+
+def gen_value(datatype, fmt, rng):
+	name = datatype.name.lower()
+	if name in INTEGER_RANGES:
+		(dmin, dmax) = INTEGER_RANGES[name]
+		# NOTE: keep the values in a realistic range instead of the full datatype range
+		return str(int(rng.integers(max(dmin, -10**6), min(dmax, 10**6), endpoint=True)))
+	if name == "decimal":
+		(precision, scale) = int(datatype.params[0]), int(datatype.params[1])
+		unscaled = int(rng.integers(0, 10**min(precision, 15)))
+		if scale == 0:
+			return str(unscaled)
+		return "{:.{}f}".format(unscaled / 10**scale, scale)
+	if name in ["float", "float4", "float8", "real", "double"]:
+		return str(round(float(rng.normal(1000, 250)), 4))
+	if name == "varchar":
+		return gen_varchar_value(fmt, int(datatype.params[0]), rng)
+	if name == "boolean":
+		return str(rng.choice(["true", "false"]))
+	if name == "date":
+		return "{:04d}-{:02d}-{:02d}".format(rng.integers(2000, 2020), rng.integers(1, 13), rng.integers(1, 29))
+	if name == "time":
+		return "{:02d}:{:02d}:{:02d}".format(rng.integers(0, 24), rng.integers(0, 60), rng.integers(0, 60))
+	if name == "timestamp":
+		return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(rng.integers(2000, 2020), rng.integers(1, 13), rng.integers(1, 29),
+																rng.integers(0, 24), rng.integers(0, 60), rng.integers(0, 60))
+	raise Exception("Unsupported datatype: {}".format(datatype))
+
+
+def gen_column(datatype, nb_rows, rng, cardinality, run_length, null_ratio, formats, null_value):
+	"""
+	Generates a column with (about) <cardinality> distinct values, in runs of
+	<run_length> values on average
+
+	Returns: list(str)
+	"""
+	fmt = rng.choice(formats)
+	pool = list({gen_value(datatype, fmt, rng) for i in range(cardinality)})
+
+	res = []
+	while len(res) < nb_rows:
+		val = pool[rng.integers(0, len(pool))]
+		res.extend([val] * int(rng.geometric(1.0 / run_length)))
+	res = res[:nb_rows]
+
+	if datatype.nullable and null_ratio > 0:
+		for idx in np.flatnonzero(rng.random(nb_rows) < null_ratio):
+			res[idx] = null_value
+
+	return res
+
+
+def gen_table(schema, nb_rows, seed, cardinality, run_length, null_ratio, formats, null_value, fdelim, out_file):
+	rng = np.random.default_rng(seed)
+	columns = []
+	for col_id, col_item in schema.items():
+		datatype = DataType.from_sql_str(col_item["datatype"])
+		columns.append(gen_column(datatype, nb_rows, rng, cardinality, run_length, null_ratio, formats, null_value))
+
+	with open(out_file, 'w') as fd:
+		for tpl in zip(*columns):
+			fd.write(fdelim.join(tpl) + "\n")
+
+
+def output_schema_rows(schema, header_file, datatypes_file, fdelim):
+	"""
+	Same as util/get-datatype-rows-from-schema.sh
+	"""
+	with open(header_file, 'w') as fd:
+		fd.write(fdelim.join([col_item["col_name"] for col_item in schema.values()]) + "\n")
+	with open(datatypes_file, 'w') as fd:
+		fd.write(fdelim.join([col_item["datatype"] for col_item in schema.values()]) + "\n")
+
+
+# =========================================================================== #
+# Stages
+# =========================================================================== #
+
+
+def run_stage(cmd, log_file, nb_rows):
+	"""
+	Runs cmd in a child process
+
+	Returns: dict(wall_s, peak_rss_KiB, rows_per_s, returncode)
+	"""
+	start = time.perf_counter()
+	with open(log_file, 'w') as fd_log:
+		p = subprocess.Popen(cmd, stdout=fd_log, stderr=subprocess.STDOUT, cwd=REPO_DIR)
+		# NOTE: wait4() returns the resource usage of this child only
+		(pid, status, rusage) = os.wait4(p.pid, 0)
+		p.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+	wall_s = time.perf_counter() - start
+
+	return {
+		"wall_s": wall_s,
+		# NOTE: ru_maxrss is in KiB on linux
+		"peak_rss_KiB": rusage.ru_maxrss,
+		"rows_per_s": nb_rows / wall_s if wall_s > 0 else None,
+		"returncode": p.returncode
+	}
+
+
+def check_stage(stage_name, stage_res, expected_files):
+	"""
+	NOTE: pattern_detection exits with an error if the expression tree plots
+		  cannot be rendered, after the trees are written; only fail if the
+		  output files are missing
+	"""
+	for f in expected_files:
+		if not os.path.isfile(f):
+			raise Exception("[{}] stage failed: returncode={}, missing output file: {}".format(stage_name, stage_res["returncode"], f))
+
+
+def count_lines(in_file):
+	with open(in_file, 'r') as fd:
+		return sum(1 for line in fd)
+
+
+def benchmark_table(table_name, schema, work_dir, args):
+	python = sys.executable
+	fdelim, null_value = args.fdelim, args.null
+
+	header_file = os.path.join(work_dir, "{}.header.csv".format(table_name))
+	datatypes_file = os.path.join(work_dir, "{}.datatypes.csv".format(table_name))
+	input_file = os.path.join(work_dir, "{}.csv".format(table_name))
+	sample_file = os.path.join(work_dir, "{}.sample.csv".format(table_name))
+	expr_tree_dir = os.path.join(work_dir, "{}.expr_tree".format(table_name))
+	out_dir = os.path.join(work_dir, "{}.poc_1_out".format(table_name))
+	eval_dir = os.path.join(work_dir, "{}.poc_1_out-theoretical".format(table_name))
+	out_table = "{}_out".format(table_name)
+	for d in [expr_tree_dir, out_dir, eval_dir]:
+		if not os.path.exists(d):
+			os.makedirs(d)
+
+	stages = {}
+
+	# generate
+	start = time.perf_counter()
+	output_schema_rows(schema, header_file, datatypes_file, fdelim)
+	gen_table(schema, args.nb_rows, args.seed, args.cardinality, args.run_length, args.null_ratio,
+			  args.formats, null_value, fdelim, input_file)
+	wall_s = time.perf_counter() - start
+	stages["generate"] = {
+		"wall_s": wall_s,
+		"rows_per_s": args.nb_rows / wall_s if wall_s > 0 else None
+	}
+
+	# sampling
+	cmd = [python, os.path.join(REPO_DIR, "sampling", "main.py"),
+		   "--dataset-nb-rows", str(args.nb_rows),
+		   "--max-sample-size", str(args.max_sample_size),
+		   "--sample-block-nb-rows", "64",
+		   "--output-file", sample_file,
+		   input_file]
+	stages["sampling"] = run_stage(cmd, sample_file + ".log", args.nb_rows)
+	check_stage("sampling", stages["sampling"], [sample_file])
+	sample_nb_rows = count_lines(sample_file)
+
+	# pattern_detection
+	cmd = [python, os.path.join(REPO_DIR, "pattern_detection", "main.py"),
+		   "--header-file", header_file,
+		   "--datatypes-file", datatypes_file,
+		   "--expr-tree-output-dir", expr_tree_dir,
+		   "-F", fdelim, "--null", null_value]
+	if args.rec_exh:
+		cmd += ["--rec-exh", "--test-sample", sample_file, "--full-file-linecount", str(args.nb_rows)]
+	cmd += [sample_file]
+	c_tree_file = os.path.join(expr_tree_dir, "c_tree.bin")
+	stages["pattern_detection"] = run_stage(cmd, expr_tree_dir + ".log", sample_nb_rows)
+	check_stage("pattern_detection", stages["pattern_detection"], [c_tree_file])
+
+	# apply_expression
+	cmd = [python, os.path.join(REPO_DIR, "pattern_detection", "apply_expression.py"),
+		   "--expr-tree-file", c_tree_file,
+		   "--header-file", header_file,
+		   "--datatypes-file", datatypes_file,
+		   "--output-dir", out_dir,
+		   "--out-table-name", out_table,
+		   "--compressed-columns",
+		   "-F", fdelim, "--null", null_value,
+		   input_file]
+	out_file = os.path.join(out_dir, "{}.csv".format(out_table))
+	stats_file = os.path.join(out_dir, "{}.stats.json".format(out_table))
+	stages["apply_expression"] = run_stage(cmd, out_dir + ".log", args.nb_rows)
+	check_stage("apply_expression", stages["apply_expression"], [out_file, stats_file])
+
+	# theoretical evaluation (of the output table)
+	cmd = [python, os.path.join(REPO_DIR, "evaluation", "main-theoretical.py"),
+		   "--train-file", out_file,
+		   "--test-file", out_file,
+		   "--schema-file", os.path.join(out_dir, "{}.table.sql".format(out_table)),
+		   "--table-name", out_table,
+		   "--output-dir", eval_dir,
+		   "--full-file-linecount", str(args.nb_rows),
+		   "--fused",
+		   "-F", fdelim, "--null", null_value]
+	eval_file = os.path.join(eval_dir, "{}.eval-theoretical.json".format(out_table))
+	stages["theoretical_evaluation"] = run_stage(cmd, eval_dir + ".log", args.nb_rows)
+	check_stage("theoretical_evaluation", stages["theoretical_evaluation"], [eval_file])
+
+	# estimated vs real size
+	with open(eval_file, 'r') as fd:
+		eval_res = json.load(fd)
+	estimated_all_B = eval_res["table"]["data_files"]["size_B"]
+	estimated_B = get_codec_estimate(eval_res)
+	with open(stats_file, 'r') as fd:
+		real_B = sum(col_stats["size_B"] for col_stats in json.load(fd)["compressed_columns"].values())
+	input_B = os.path.getsize(input_file)
+
+	return {
+		"nb_rows": args.nb_rows,
+		"sample_nb_rows": sample_nb_rows,
+		"stages": stages,
+		"size": {
+			"input_B": input_B,
+			"estimated_B": estimated_B,
+			"estimated_all_B": estimated_all_B,
+			"real_B": real_B,
+			"error_ratio": float(estimated_B - real_B) / real_B if real_B > 0 else None
+		}
+	}
+
+
+def get_codec_estimate(eval_res):
+	"""
+	Returns: estimated size of the table with the best of CODEC_ESTIMATORS for
+			 each column (see evaluation/main-theoretical.py aggregate_stats())
+	"""
+	res = 0
+	for col_res in eval_res["columns"].values():
+		estimators = col_res["data_files"]["data_file"]["estimators"]
+		res += min(estimators[name]["size_B"] for name in CODEC_ESTIMATORS if name in estimators)
+	return res
+
+
+def get_tables(args):
+	"""
+	Returns: list((table_name, schema_file))
+	"""
+	if args.schema_file is not None:
+		table_name = os.path.basename(args.schema_file).split(".")[0]
+		return [(table_name, args.schema_file)]
+
+	res = []
+	for wb in sorted(os.listdir(args.testset_dir)):
+		with open(os.path.join(args.testset_dir, wb), 'r') as fp_wb:
+			for table in fp_wb:
+				table = table.strip()
+				if table == "":
+					continue
+				schema_file = os.path.join(args.repo_wbs_dir, wb, "tables", "{}.table.sql".format(table))
+				res.append((table, schema_file))
+	return res
+
+
+def aggregate_stages(tables):
+	res = {}
+	for table_res in tables.values():
+		for stage_name, stage_res in table_res["stages"].items():
+			if stage_name not in res:
+				res[stage_name] = {"wall_s": 0, "peak_rss_KiB": 0}
+			res[stage_name]["wall_s"] += stage_res["wall_s"]
+			res[stage_name]["peak_rss_KiB"] = max(res[stage_name]["peak_rss_KiB"], stage_res.get("peak_rss_KiB", 0))
+	return res
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description="""Benchmark learning and estimation on synthetic tables with the schemas of a testset."""
+	)
+
+	parser.add_argument('--testset-dir', dest='testset_dir', type=str,
+		help="Path to testset directory (e.g. testsets/testset_main)")
+	parser.add_argument('--repo-wbs-dir', dest='repo_wbs_dir', type=str,
+		help="Path to PBIB benchmark directory (schemas: <repo-wbs-dir>/<wb>/tables/<table>.table.sql)")
+	parser.add_argument('--schema-file', dest='schema_file', type=str,
+		help="Benchmark a single table schema instead of a testset")
+	parser.add_argument('--work-dir', dest='work_dir', type=str,
+		help="Directory to put the generated tables and intermediate files in", required=True)
+	parser.add_argument('--output-file', dest='output_file', type=str,
+		help="JSON file to write the results to", required=True)
+	parser.add_argument('--label', dest='label', type=str,
+		help="Label of this run (e.g. version); used as series name when plotting", default="current")
+	parser.add_argument('--nb-rows', dest='nb_rows', type=int,
+		help="Number of rows of each synthetic table", default=100000)
+	parser.add_argument('--max-sample-size', dest='max_sample_size', type=int,
+		help="Maximum size of the sample in bytes", default=1024*1024)
+	parser.add_argument('--cardinality', dest='cardinality', type=int,
+		help="Number of distinct values of each column", default=1000)
+	parser.add_argument('--run-length', dest='run_length', type=float,
+		help="Average length of runs of equal values", default=1.0)
+	parser.add_argument('--null-ratio', dest='null_ratio', type=float,
+		help="Ratio of nulls in the nullable columns", default=0.05)
+	parser.add_argument('--formats', dest='formats', type=str,
+		help="Comma separated varchar formats to choose from: {}".format(",".join(VARCHAR_FORMATS)),
+		default=",".join(VARCHAR_FORMATS))
+	parser.add_argument('--seed', dest='seed', type=int,
+		help="Seed of the data generator", default=0)
+	parser.add_argument("--rec-exh", dest="rec_exh", action='store_true',
+		help="Learn with the recursive exhaustive algorithm")
+	parser.add_argument("-F", "--fdelim", dest="fdelim",
+		help="Use <fdelim> as delimiter between fields", default="|")
+	parser.add_argument("--null", dest="null", type=str,
+		help="Interprets <NULL> as NULLs", default="null")
+
+	args = parser.parse_args()
+	if args.schema_file is None and (args.testset_dir is None or args.repo_wbs_dir is None):
+		parser.error("either --schema-file or --testset-dir and --repo-wbs-dir are required")
+	args.formats = args.formats.split(",")
+	for fmt in args.formats:
+		if fmt not in VARCHAR_FORMATS:
+			parser.error("unknown varchar format: {}".format(fmt))
+	return args
+
+
+def main():
+	args = parse_args()
+	print(args)
+
+	tables = {}
+	for (table_name, schema_file) in get_tables(args):
+		print("[benchmark][start] {} {}".format(time.strftime("%c"), table_name))
+		try:
+			schema = parse_schema_file(schema_file)
+			work_dir = os.path.join(args.work_dir, table_name)
+			if not os.path.exists(work_dir):
+				os.makedirs(work_dir)
+			tables[table_name] = benchmark_table(table_name, schema, work_dir, args)
+		except Exception as e:
+			print("error: unable to benchmark {}: error={}".format(table_name, e))
+			continue
+		print("[benchmark][end]   {} {}".format(time.strftime("%c"), table_name))
+
+	params = {k: v for k, v in vars(args).items() if k not in ["output_file", "work_dir"]}
+	res = {
+		"label": args.label,
+		"params": params,
+		"tables": tables,
+		"stages": aggregate_stages(tables)
+	}
+	with open(args.output_file, 'w') as f:
+		json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import json
+import socket
+import subprocess
+from daemon import DEFAULT_SOCKET_FILE, TOOLS, FINISHED_STATES
+
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+"""
+Client for the poc_1 daemon (see daemon.py)
+
+Commands:
+	- submit: submits a single tool run (job)
+	- status, watch, shutdown: see the daemon methods
+	- process-all: same as process_all.sh, as jobs: for each table, sampling ->
+	  learning -> compression (full file & theoretical train/test samples)
+	- evaluate-theoretical-all: same as the theoretical part of evaluate_all.sh
+
+NOTE: the jobs run on the daemon; their log files are written next to the
+	  table files (<table>.poc_1.<job>.out), like the shell scripts
+"""
+REPO_WBS_DIR = os.path.join(SCRIPT_DIR, "..", "..", "public_bi_benchmark-master_project", "benchmark")
+TESTSET_DIR = os.path.join(SCRIPT_DIR, "..", "testsets", "testset_unique_schema_2")
+MAX_SAMPLE_SIZE = 1024 * 1024 * 10
+# drift monitoring of the full file compression (see apply_expression.py --drift-window)
+DRIFT_WINDOW = 100000
+
+
+class DaemonClient(object):
+	def __init__(self, socket_file=DEFAULT_SOCKET_FILE):
+		self.socket_file = socket_file
+		self.request_id = 0
+
+	def request(self, method, on_event=None, **params):
+		"""
+		Returns: the result of the request
+
+		NOTE: on_event(event) is called for the events streamed by the daemon
+		"""
+		self.request_id += 1
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			try:
+				sock.connect(self.socket_file)
+			except (FileNotFoundError, ConnectionRefusedError):
+				raise Exception("Daemon is not running; start it with: {} --socket-file {}".format(
+								os.path.join(SCRIPT_DIR, "daemon.py"), self.socket_file))
+			with sock.makefile('rw') as fd:
+				fd.write(json.dumps({"id": self.request_id, "method": method, "params": params}) + "\n")
+				fd.flush()
+				for line in fd:
+					msg = json.loads(line)
+					if "event" in msg:
+						if on_event is not None:
+							on_event(msg["event"])
+					elif "error" in msg:
+						raise Exception("Daemon error: {}".format(msg["error"]))
+					else:
+						return msg["result"]
+		raise Exception("Connection to the daemon closed")
+
+
+def print_event(event):
+	if event["event"] == "log":
+		print("[{}] {}".format(event["name"], event["line"]))
+	elif event["event"] in FINISHED_STATES:
+		print("[{}][{}] duration={}{}".format(event["name"], event["event"],
+			  "{:.2f}s".format(event["duration_s"]) if event["duration_s"] is not None else None,
+			  ", error={}".format(event["error"]) if event["error"] is not None else ""))
+	else:
+		print("[{}][{}]".format(event["name"], event["event"]))
+	sys.stdout.flush()
+
+
+def submit_and_watch(client, jobs, follow, log=False):
+	"""
+	Returns: number of failed jobs (0 if not <follow>)
+	"""
+	job_ids = client.request("submit", jobs=jobs)["job_ids"]
+	print("[submit] jobs={}".format(len(job_ids)))
+	if not follow:
+		return 0
+	res = client.request("watch", on_event=print_event, job_ids=job_ids, log=log)
+	failed = [job for job in res["jobs"] if job["state"] == "failed"]
+	for job in failed:
+		print("[failed] {}: {}".format(job["name"], job["error"]))
+	return len(failed)
+
+
+# =========================================================================== #
+# process_all.sh & evaluate_all.sh
+# =========================================================================== #
+
+
+def iter_tables(testset_dir):
+	for wb in sorted(os.listdir(testset_dir)):
+		with open(os.path.join(testset_dir, wb), 'r') as fd:
+			for table in fd.read().split():
+				yield (wb, table)
+
+
+def read_linecount(repo_wbs_dir, wb, table):
+	with open(os.path.join(repo_wbs_dir, wb, "samples", "{}.linecount".format(table)), 'r') as fd:
+		return fd.read().strip()
+
+
+def make_dirs(*dirs):
+	for d in dirs:
+		if not os.path.exists(d):
+			os.makedirs(d)
+
+
+def get_process_jobs(wbs_dir, repo_wbs_dir, wb, table, rec_exh):
+	"""
+	Returns: the jobs of process() in process_all.sh for <table>
+	"""
+	samples_dir = os.path.join(repo_wbs_dir, wb, "samples")
+	table_prefix = os.path.join(wbs_dir, wb, table)
+	header_file = os.path.join(samples_dir, "{}.header-renamed.csv".format(table))
+	datatypes_file = os.path.join(samples_dir, "{}.datatypes.csv".format(table))
+	linecount = read_linecount(repo_wbs_dir, wb, table)
+	expr_tree_file = "{}.expr_tree/c_tree.bin".format(table_prefix)
+	jobs = []
+
+	def add_job(step, tool, args, depends_on=[]):
+		name = "{}/{}/{}".format(wb, table, step)
+		jobs.append({
+			"name": name,
+			"tool": tool,
+			"args": args,
+			"cwd": os.getcwd(),
+			"log_file": "{}.poc_1.{}.out".format(table_prefix, step),
+			"depends_on": ["{}/{}/{}".format(wb, table, d) for d in depends_on]
+		})
+
+	# generate_sample
+	sample_steps = {}
+	for sample in ["sample", "sample-theoretical-train", "sample-theoretical-test"]:
+		sample_file = "{}.{}.csv".format(table_prefix, sample)
+		if os.path.isfile(sample_file):
+			print("debug: skipping sampling; sample already exists: {}".format(sample_file))
+			sample_steps[sample] = []
+			continue
+		add_job(sample, "sampling", [
+			"--dataset-nb-rows", linecount,
+			"--max-sample-size", MAX_SAMPLE_SIZE,
+			"--sample-block-nb-rows", 64,
+			"--output-file", sample_file,
+			"{}.csv".format(table_prefix)])
+		sample_steps[sample] = [sample]
+
+	# generate_expression
+	output_dirs = ["{}.{}".format(table_prefix, d) for d in ["patterns", "ngram_freq_masks", "corr_coefs", "expr_tree"]]
+	make_dirs(*output_dirs)
+	args = [
+		"--header-file", header_file,
+		"--datatypes-file", datatypes_file,
+		"--pattern-distribution-output-dir", output_dirs[0],
+		"--ngram-freq-masks-output-dir", output_dirs[1],
+		"--corr-coefs-output-dir", output_dirs[2],
+		"--expr-tree-output-dir", output_dirs[3]]
+	depends_on = sample_steps["sample"]
+	if rec_exh:
+		args += ["--rec-exh",
+				 "--test-sample", "{}.sample-theoretical-test.csv".format(table_prefix),
+				 "--full-file-linecount", linecount]
+		depends_on = depends_on + sample_steps["sample-theoretical-test"]
+	add_job("expr_tree", "pattern_detection", args + ["{}.sample.csv".format(table_prefix)], depends_on)
+
+	# apply_expression & apply_expression_theoretical
+	outputs = [
+		("poc_1_out", "{}.csv".format(table_prefix), [], DRIFT_WINDOW),
+		("poc_1_out-theoretical/train", "{}.sample-theoretical-train.csv".format(table_prefix), sample_steps["sample-theoretical-train"], 0),
+		("poc_1_out-theoretical/test", "{}.sample-theoretical-test.csv".format(table_prefix), sample_steps["sample-theoretical-test"], 0)
+	]
+	for (out, input_file, depends_on, drift_window) in outputs:
+		output_dir = "{}.{}".format(table_prefix, out)
+		make_dirs(output_dir)
+		add_job(out.replace("/", "-"), "apply_expression", [
+			"--expr-tree-file", expr_tree_file,
+			"--header-file", header_file,
+			"--datatypes-file", datatypes_file,
+			"--output-dir", output_dir,
+			"--out-table-name", "{}_out".format(table),
+			"--drift-window", str(drift_window),
+			input_file], ["expr_tree"] + depends_on)
+
+	return jobs
+
+
+def get_evaluate_theoretical_jobs(wbs_dir, repo_wbs_dir, wb, table):
+	"""
+	Returns: the jobs of evaluate_theoretical() in evaluate_all.sh for <table>
+
+	NOTE: the VectorWise schema is generated here, so the tables must be
+		  processed (process-all) before
+	"""
+	table_prefix = os.path.join(wbs_dir, wb, table)
+	output_dir = "{}.poc_1_out-theoretical".format(table_prefix)
+	out_table = "{}_out".format(table)
+	n_schema_file = os.path.join(output_dir, "test", "{}.table.sql".format(out_table))
+	wv_n_schema_file = os.path.join(output_dir, "test", "{}.table-vectorwise.sql".format(out_table))
+
+	subprocess.run([os.path.join(SCRIPT_DIR, "..", "util", "VectorWiseify-schema.sh"), n_schema_file, wv_n_schema_file],
+				   stdout=subprocess.DEVNULL, check=True)
+	return [{
+		"name": "{}/{}/evaluate-theoretical".format(wb, table),
+		"tool": "theoretical_evaluation",
+		"args": [
+			"--schema-file", wv_n_schema_file,
+			"--table-name", out_table,
+			"--output-dir", output_dir,
+			"--full-file-linecount", read_linecount(repo_wbs_dir, wb, table),
+			"--train-file", os.path.join(output_dir, "train", "{}.csv".format(out_table)),
+			"--test-file", os.path.join(output_dir, "test", "{}.csv".format(out_table))],
+		"cwd": os.getcwd(),
+		"log_file": "{}.poc_1.evaluate-theoretical.out".format(table_prefix)
+	}]
+
+
+# =========================================================================== #
+# Commands
+# =========================================================================== #
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description="""Submit jobs to the poc_1 daemon and follow their progress."""
+	)
+	parser.add_argument('--socket-file', dest='socket_file', type=str,
+		help="Unix socket of the daemon", default=DEFAULT_SOCKET_FILE)
+	subparsers = parser.add_subparsers(dest='command')
+	subparsers.required = True
+
+	p = subparsers.add_parser('submit', help="Run a tool as a job")
+	p.add_argument('tool', choices=sorted(TOOLS.keys()))
+	p.add_argument('tool_args', nargs=argparse.REMAINDER,
+		help="Arguments of the tool, after -- (the client options go before the tool)")
+	p.add_argument('--name', dest='name', type=str, default=None)
+	p.add_argument('--log-file', dest='log_file', type=str, default=None)
+	p.add_argument('--depends-on', dest='depends_on', type=str, action='append', default=[],
+		help="Name of a job that must finish first (can be repeated)")
+	p.add_argument('--follow', dest='follow', action='store_true',
+		help="Stream the job output until it finishes")
+
+	p = subparsers.add_parser('status', help="Print the state of the jobs")
+	p.add_argument('job_ids', type=int, nargs='*')
+
+	p = subparsers.add_parser('watch', help="Stream the progress of the jobs until they finish")
+	p.add_argument('job_ids', type=int, nargs='*')
+	p.add_argument('--log', dest='log', action='store_true',
+		help="Also stream the output of the jobs")
+
+	subparsers.add_parser('shutdown', help="Stop the daemon after the submitted jobs finish")
+
+	for (command, help_msg) in [('process-all', "Same as process_all.sh"),
+								('evaluate-theoretical-all', "Same as the theoretical evaluation of evaluate_all.sh")]:
+		p = subparsers.add_parser(command, help=help_msg)
+		p.add_argument('wbs_dir', help="Root directory with all the PBIB workbooks")
+		if command == 'process-all':
+			p.add_argument('rec_exh', choices=["true", "false"], help="Recursive exhaustive learning")
+		p.add_argument('--repo-wbs-dir', dest='repo_wbs_dir', type=str, default=REPO_WBS_DIR)
+		p.add_argument('--testset-dir', dest='testset_dir', type=str, default=TESTSET_DIR)
+		p.add_argument('--no-follow', dest='follow', action='store_false',
+			help="Only submit the jobs")
+
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+	client = DaemonClient(args.socket_file)
+	failed_count = 0
+
+	if args.command == "submit":
+		tool_args = args.tool_args[1:] if args.tool_args[:1] == ["--"] else args.tool_args
+		job = {"tool": args.tool, "args": tool_args, "name": args.name, "cwd": os.getcwd(),
+			   "log_file": os.path.abspath(args.log_file) if args.log_file is not None else None,
+			   "depends_on": args.depends_on}
+		failed_count = submit_and_watch(client, [job], args.follow, log=True)
+	elif args.command == "status":
+		for job in client.request("status", job_ids=args.job_ids if len(args.job_ids) > 0 else None)["jobs"]:
+			print(json.dumps(job))
+	elif args.command == "watch":
+		res = client.request("watch", on_event=print_event, job_ids=args.job_ids if len(args.job_ids) > 0 else None, log=args.log)
+		failed_count = len([job for job in res["jobs"] if job["state"] == "failed"])
+	elif args.command == "shutdown":
+		client.request("shutdown")
+	else:
+		wbs_dir = os.path.abspath(args.wbs_dir)
+		repo_wbs_dir = os.path.abspath(args.repo_wbs_dir)
+		jobs = []
+		for (wb, table) in iter_tables(args.testset_dir):
+			if args.command == "process-all":
+				jobs.extend(get_process_jobs(wbs_dir, repo_wbs_dir, wb, table, args.rec_exh == "true"))
+			else:
+				jobs.extend(get_evaluate_theoretical_jobs(wbs_dir, repo_wbs_dir, wb, table))
+		failed_count = submit_and_watch(client, jobs, args.follow)
+
+	if failed_count > 0:
+		raise Exception("{} jobs failed".format(failed_count))
+
+
+if __name__ == "__main__":
+	main()
+
+
+"""
+wbs_dir=/scratch/bogdan/tableau-public-bench/data/PublicBIbenchmark-test
+
+./poc_1/daemon.py &
+./poc_1/client.py process-all $wbs_dir true
+./poc_1/client.py evaluate-theoretical-all $wbs_dir
+./poc_1/client.py shutdown
+
+./poc_1/client.py submit --follow pattern_detection -- --header-file $header_file --datatypes-file $datatypes_file --expr-tree-output-dir $out_dir $sample_file
+"""
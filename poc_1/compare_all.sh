@@ -33,7 +33,7 @@ compare() {
 	stats_file_nocompression=$wbs_dir/$wb/$table.evaluation-nocompression/$table.eval-$baseline.json
 	stats_file_default=$wbs_dir/$wb/$table.evaluation/$table.eval-$baseline.json
 	stats_file_wc=$base_dir/$out_table.eval-$baseline.json
-	expr_tree_file=$wbs_dir/$wb/$table.expr_tree/c_tree.json
+	expr_tree_file=$wbs_dir/$wb/$table.expr_tree/c_tree.bin
 
 	if [ $baseline == "vectorwise" ]; then
 		apply_expr_stats_file=$base_dir/$out_table.stats.json
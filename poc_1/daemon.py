@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import json
+import time
+import queue
+import threading
+import socketserver
+import multiprocessing
+import multiprocessing.forkserver
+import multiprocessing.connection
+from collections import OrderedDict
+
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+"""
+Long-running service that runs the poc_1 tools (TOOLS: CLI entry points) with
+warm workers: the modules of all the tools are loaded once, in a fork server
+process; each job runs in a process forked from it, so it starts without
+re-importing anything and with a clean module state
+
+Jobs are scheduled across cores: at most <workers> jobs run at a time; a job
+starts when all the jobs it depends on are done and fails when one of them
+fails. The output of a job (stdout & stderr) is written to its log file and
+streamed to the clients that watch it.
+
+Protocol: json lines over a unix socket; one request per line:
+	{"id": id, "method": method, "params": {...}}
+answered with {"id": id, "result": {...}} or {"id": id, "error": message};
+"watch" also streams {"id": id, "event": {...}} lines before its result
+Methods:
+	- submit(jobs): jobs = [{"tool", "args", "name", "cwd", "log_file", "depends_on"}, ...]
+	  ("depends_on": names of jobs submitted before or in the same request)
+	  -> {"job_ids": [...]}
+	- status(job_ids=None) -> {"jobs": [...]}
+	- watch(job_ids=None, log=False): streams the state changes (and the log
+	  lines, with log=true) of the jobs until they finish; job_ids=None: all
+	  the unfinished jobs -> {"jobs": [...]}
+	- shutdown(): stops accepting jobs; the daemon exits after the submitted
+	  jobs finish -> {}
+
+NOTE: use client.py to talk to the daemon
+"""
+TOOLS = {
+	"sampling": "sampling/main.py",
+	"pattern_detection": "pattern_detection/main.py",
+	"apply_expression": "pattern_detection/apply_expression.py",
+	"decompression": "decompression/main.py",
+	"theoretical_evaluation": "evaluation/main-theoretical.py"
+}
+DEFAULT_SOCKET_FILE = os.path.join(os.path.expanduser("~"), ".cache", "pattern_detection", "daemon.sock")
+FINISHED_STATES = ["done", "failed"]
+LOG_POLL_INTERVAL = 0.2
+
+
+def run_job_process(tool, args, cwd, log_file):
+	# NOTE: redirect before the import: its errors must end up in the log of
+	#	   the job, not in the log of the daemon
+	fd_log = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+	os.dup2(fd_log, sys.stdout.fileno())
+	os.dup2(fd_log, sys.stderr.fileno())
+	os.close(fd_log)
+	# NOTE: already imported by the fork server (preload); never import it in
+	#	   the daemon process, it loads all the tools
+	import daemon_tools
+	daemon_tools.run_tool(tool, args, cwd)
+
+
+class Job(object):
+	def __init__(self, job_id, name, tool, args, cwd, log_file, depends_on):
+		self.job_id = job_id
+		self.name = name
+		self.tool = tool
+		self.args = args
+		self.cwd = cwd
+		self.log_file = log_file
+		self.depends_on = depends_on
+		self.state = "queued"
+		self.exitcode = None
+		self.error = None
+		self.submit_time = time.time()
+		self.start_time = None
+		self.end_time = None
+		self.process = None
+
+	def to_dict(self):
+		return {
+			"job_id": self.job_id,
+			"name": self.name,
+			"tool": self.tool,
+			"state": self.state,
+			"exitcode": self.exitcode,
+			"error": self.error,
+			"log_file": self.log_file,
+			"depends_on": self.depends_on,
+			"queued_s": (self.start_time or time.time()) - self.submit_time,
+			"duration_s": (self.end_time or time.time()) - self.start_time if self.start_time is not None else None
+		}
+
+
+class JobScheduler(object):
+	"""
+	NOTE: all the job state is guarded by <cond>; the listeners (watch
+		  requests) get the events through their queue
+	"""
+	def __init__(self, max_workers, log_dir):
+		self.max_workers = max_workers
+		self.log_dir = log_dir
+		self.ctx = multiprocessing.get_context("forkserver")
+		self.ctx.set_forkserver_preload(["daemon_tools"])
+		self.cond = threading.Condition()
+		self.jobs = OrderedDict()
+		self.jobs_by_name = {}
+		self.running_count = 0
+		self.listeners = []
+		self.closed = False
+
+	def start(self):
+		# NOTE: start the fork server now, so that the first job does not wait for the tools to load
+		# NOTE: the fork server does not get the sys.path of the daemon; it finds
+		#	   daemon_tools through PYTHONPATH (preload errors are ignored)
+		pythonpath = os.environ.get("PYTHONPATH")
+		os.environ["PYTHONPATH"] = os.pathsep.join([SCRIPT_DIR] + ([pythonpath] if pythonpath else []))
+		try:
+			multiprocessing.forkserver.ensure_running()
+		finally:
+			if pythonpath is None:
+				del os.environ["PYTHONPATH"]
+			else:
+				os.environ["PYTHONPATH"] = pythonpath
+		threading.Thread(target=self.schedule_loop, daemon=True).start()
+
+	def emit(self, job, event, **kwargs):
+		"""
+		NOTE: call with <cond> held
+		"""
+		event = dict(event=event, job_id=job.job_id, name=job.name, **kwargs)
+		for (q, job_ids, log) in self.listeners:
+			if job.job_id in job_ids and (log or event["event"] != "log"):
+				q.put(event)
+
+	def submit(self, jobs_params):
+		with self.cond:
+			if self.closed:
+				raise Exception("Daemon is shutting down")
+			new_jobs = []
+			batch_names = {}
+			for params in jobs_params:
+				if params["tool"] not in TOOLS:
+					raise Exception("Invalid tool: {}".format(params["tool"]))
+				depends_on = []
+				for name in params.get("depends_on", []):
+					dep = batch_names.get(name, self.jobs_by_name.get(name))
+					if dep is None:
+						raise Exception("Unknown dependency: {}".format(name))
+					depends_on.append(dep.job_id)
+				job_id = len(self.jobs) + len(new_jobs)
+				name = params.get("name") or "job_{}".format(job_id)
+				log_file = params.get("log_file") or os.path.join(self.log_dir, "job_{}.log".format(job_id))
+				job = Job(job_id, name, params["tool"], [str(a) for a in params.get("args", [])],
+						  params.get("cwd", os.getcwd()), log_file, depends_on)
+				new_jobs.append(job)
+				batch_names[name] = job
+
+			# NOTE: add the jobs only after the whole request is valid
+			for job in new_jobs:
+				self.jobs[job.job_id] = job
+				self.jobs_by_name[job.name] = job
+				self.emit(job, "queued")
+			self.cond.notify_all()
+			return [job.job_id for job in new_jobs]
+
+	def get_jobs(self, job_ids=None):
+		with self.cond:
+			if job_ids is None:
+				job_ids = self.jobs.keys()
+			return [self.jobs[job_id].to_dict() for job_id in job_ids if job_id in self.jobs]
+
+	def add_listener(self, job_ids, log):
+		"""
+		Returns: (queue, set of the unfinished jobs among <job_ids>)
+		"""
+		with self.cond:
+			if job_ids is None:
+				job_ids = self.jobs.keys()
+			unfinished = {job_id for job_id in job_ids if job_id in self.jobs and self.jobs[job_id].state not in FINISHED_STATES}
+			listener = (queue.Queue(), unfinished, log)
+			self.listeners.append(listener)
+			return (listener[0], set(unfinished))
+
+	def remove_listener(self, q):
+		with self.cond:
+			self.listeners = [l for l in self.listeners if l[0] is not q]
+
+	def schedule_loop(self):
+		with self.cond:
+			while True:
+				for job in self.jobs.values():
+					if job.state != "queued":
+						continue
+					deps = [self.jobs[job_id] for job_id in job.depends_on]
+					failed_deps = [dep.name for dep in deps if dep.state == "failed"]
+					if len(failed_deps) > 0:
+						self.finish_job(job, None, "dependency failed: {}".format(", ".join(failed_deps)))
+					elif all(dep.state == "done" for dep in deps) and self.running_count < self.max_workers:
+						self.start_job(job)
+				self.cond.wait()
+
+	def start_job(self, job):
+		"""
+		NOTE: call with <cond> held
+		"""
+		job.state = "running"
+		job.start_time = time.time()
+		self.running_count += 1
+		job.process = self.ctx.Process(target=run_job_process, args=(job.tool, job.args, job.cwd, job.log_file),
+									   name="job_{}".format(job.job_id))
+		job.process.start()
+		self.emit(job, "running")
+		threading.Thread(target=self.monitor_job, args=(job,), daemon=True).start()
+
+	def finish_job(self, job, exitcode, error=None):
+		"""
+		NOTE: call with <cond> held
+		"""
+		if job.state == "running":
+			self.running_count -= 1
+		job.exitcode = exitcode
+		job.error = error
+		job.state = "done" if exitcode == 0 else "failed"
+		job.end_time = time.time()
+		job.process = None
+		self.emit(job, job.state, **{k: v for k, v in job.to_dict().items() if k in ["exitcode", "error", "duration_s"]})
+		self.cond.notify_all()
+
+	def monitor_job(self, job):
+		"""
+		Streams the log file of <job> until its process exits
+		"""
+		fd_log = None
+		pending = ""
+		while True:
+			alive = job.process.is_alive()
+			if fd_log is None and os.path.isfile(job.log_file):
+				fd_log = open(job.log_file, 'r', errors='replace')
+			if fd_log is not None:
+				pending += fd_log.read()
+				lines = pending.split("\n")
+				pending = lines.pop()
+				with self.cond:
+					for line in lines:
+						self.emit(job, "log", line=line)
+			if not alive:
+				break
+			# NOTE: returns as soon as the process exits
+			multiprocessing.connection.wait([job.process.sentinel], LOG_POLL_INTERVAL)
+		if fd_log is not None:
+			fd_log.close()
+
+		job.process.join()
+		exitcode = job.process.exitcode
+		with self.cond:
+			if len(pending) > 0:
+				self.emit(job, "log", line=pending)
+			self.finish_job(job, exitcode, None if exitcode == 0 else "exit code: {}; see: {}".format(exitcode, job.log_file))
+
+	def close(self):
+		"""
+		Stops accepting jobs and waits for the submitted ones
+		"""
+		with self.cond:
+			self.closed = True
+			while any(job.state not in FINISHED_STATES for job in self.jobs.values()):
+				self.cond.wait()
+
+	def terminate(self):
+		with self.cond:
+			for job in self.jobs.values():
+				if job.process is not None:
+					job.process.terminate()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+	def send(self, msg):
+		self.wfile.write((json.dumps(msg) + "\n").encode())
+		self.wfile.flush()
+
+	def handle(self):
+		for line in self.rfile:
+			if len(line.strip()) == 0:
+				continue
+			request = json.loads(line)
+			try:
+				result = self.dispatch(request["id"], request["method"], request.get("params", {}))
+				self.send({"id": request["id"], "result": result})
+			except BrokenPipeError:
+				return
+			except Exception as e:
+				self.send({"id": request["id"], "error": str(e)})
+
+	def dispatch(self, request_id, method, params):
+		scheduler = self.server.scheduler
+		if method == "submit":
+			return {"job_ids": scheduler.submit(params["jobs"])}
+		if method == "status":
+			return {"jobs": scheduler.get_jobs(params.get("job_ids"))}
+		if method == "watch":
+			return self.watch(request_id, params.get("job_ids"), params.get("log", False))
+		if method == "shutdown":
+			threading.Thread(target=self.server.close, daemon=True).start()
+			return {}
+		raise Exception("Invalid method: {}".format(method))
+
+	def watch(self, request_id, job_ids, log):
+		scheduler = self.server.scheduler
+		(q, unfinished) = scheduler.add_listener(job_ids, log)
+		watched = sorted(unfinished) if job_ids is None else job_ids
+		try:
+			while len(unfinished) > 0:
+				event = q.get()
+				self.send({"id": request_id, "event": event})
+				if event["event"] in FINISHED_STATES:
+					unfinished.discard(event["job_id"])
+		finally:
+			scheduler.remove_listener(q)
+		return {"jobs": scheduler.get_jobs(watched)}
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+	daemon_threads = True
+
+	def __init__(self, socket_file, scheduler):
+		self.scheduler = scheduler
+		super().__init__(socket_file, RequestHandler)
+
+	def close(self):
+		self.scheduler.close()
+		self.shutdown()
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(
+		description="""Run the poc_1 tools (sampling, learning, compression, decompression, evaluation) with warm worker processes."""
+	)
+
+	parser.add_argument('--socket-file', dest='socket_file', type=str,
+		help="Unix socket to listen on", default=DEFAULT_SOCKET_FILE)
+	parser.add_argument('--workers', dest='workers', type=int,
+		help="Maximum number of jobs running at the same time (default: number of CPUs)", default=os.cpu_count())
+	parser.add_argument('--log-dir', dest='log_dir', type=str,
+		help="Log dir for the jobs submitted without a log file (default: the dir of the socket file)", default=None)
+
+	return parser.parse_args()
+
+
+def main():
+	args = parse_args()
+	print(args)
+
+	socket_dir = os.path.dirname(os.path.abspath(args.socket_file))
+	log_dir = args.log_dir if args.log_dir is not None else socket_dir
+	for d in [socket_dir, log_dir]:
+		if not os.path.exists(d):
+			os.makedirs(d)
+	if os.path.exists(args.socket_file):
+		# NOTE: stale socket of a previous daemon; fails below if a daemon is still listening on it
+		os.remove(args.socket_file)
+
+	start = time.perf_counter()
+	scheduler = JobScheduler(args.workers, log_dir)
+	scheduler.start()
+	print("[daemon] workers={}, startup={:.2f}s, socket={}".format(args.workers, time.perf_counter() - start, args.socket_file))
+	sys.stdout.flush()
+
+	server = DaemonServer(args.socket_file, scheduler)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		scheduler.terminate()
+	finally:
+		server.server_close()
+		os.remove(args.socket_file)
+	print("[daemon] exit: jobs={}".format(len(scheduler.jobs)))
+
+
+if __name__ == "__main__":
+	main()
+
+
+"""
+./poc_1/daemon.py --workers 8 &
+./poc_1/client.py process-all $wbs_dir true
+./poc_1/client.py shutdown
+"""
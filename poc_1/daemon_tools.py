@@ -0,0 +1,90 @@
+import os
+import sys
+import importlib.util
+from daemon import TOOLS
+
+
+"""
+Warm tools for the poc_1 daemon (see daemon.py)
+
+Importing this module loads the modules of all the CLI entry points (TOOLS)
+and the heavy dependencies they import lazily (WARM_MODULES), so that a
+process forked from it runs a tool without paying for the imports;
+run_tool() runs the main() of a tool in the current process, as if it was
+called from the command line
+
+NOTE: all tools share the pattern_detection/lib package (lib.util &
+	  lib.instrumentation are the same files in all the lib dirs)
+NOTE: each job must run in its own (forked) process: the tools keep state in
+	  module level objects (instrumentation, render_manifest, counters)
+"""
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+# NOTE: pattern_detection first: it provides the lib package for all the tools
+SYS_PATH = [os.path.join(REPO_DIR, d) for d in ["pattern_detection", "evaluation", "sampling"]] + [REPO_DIR]
+WARM_MODULES = ["numpy", "scipy.stats", "bitstring", "lib.column_codecs", "pattern_detection.lib.bitpacking"]
+tool_modules = {}
+
+
+def setup_sys_path():
+	for path in reversed(SYS_PATH):
+		if path in sys.path:
+			sys.path.remove(path)
+		sys.path.insert(0, path)
+
+
+def load_tool(tool):
+	if tool not in TOOLS:
+		raise Exception("Invalid tool: {}".format(tool))
+	if tool not in tool_modules:
+		setup_sys_path()
+		# NOTE: unique module names; several entry points are called main.py
+		spec = importlib.util.spec_from_file_location("tool_{}".format(tool), os.path.join(REPO_DIR, TOOLS[tool]))
+		module = importlib.util.module_from_spec(spec)
+		spec.loader.exec_module(module)
+		tool_modules[tool] = module
+	return tool_modules[tool]
+
+
+def run_tool(tool, args, cwd, log_file=None):
+	"""
+	Runs <tool> with the command line arguments <args>; log_file!=None:
+	stdout & stderr (also of the child processes) are redirected to <log_file>
+
+	NOTE: raises on failure; the job process then exits with a non-zero code
+	NOTE: a tool that failed to load in load_all() is loaded again here, so
+		  its error ends up in the log of the job
+	"""
+	if log_file is not None:
+		fd_log = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+		os.dup2(fd_log, sys.stdout.fileno())
+		os.dup2(fd_log, sys.stderr.fileno())
+		os.close(fd_log)
+
+	os.chdir(cwd)
+	# NOTE: the forked process gets the sys.path of the daemon
+	setup_sys_path()
+	module = load_tool(tool)
+	sys.argv = [TOOLS[tool]] + list(args)
+	module.main()
+	sys.stdout.flush()
+	sys.stderr.flush()
+
+
+def load_all():
+	"""
+	NOTE: a tool that fails to load only fails its own jobs (see run_tool)
+	"""
+	for tool in TOOLS:
+		try:
+			load_tool(tool)
+		except Exception as e:
+			print("[daemon_tools] warning: failed to load tool: tool={}, error={}".format(tool, repr(e)))
+	for module_name in WARM_MODULES:
+		try:
+			importlib.import_module(module_name)
+		except ImportError as e:
+			# NOTE: optional dependency; imported by the job if needed
+			print("[daemon_tools] warning: {}".format(e))
+
+
+load_all()
@@ -132,4 +132,8 @@ date; ./poc_1/evaluate_all.sh $wbs_dir; echo $?; date
 cat $wbs_dir/*/*.poc_1.evaluate.out | less
 cat $wbs_dir/*/*.poc_1.evaluate-theoretical.out | less
 
+================================================================================
+# theoretical evaluation only, with warm worker processes (see poc_1/daemon.py)
+date; ./poc_1/client.py evaluate-theoretical-all $wbs_dir; echo $?; date
+
 END_COMMENT
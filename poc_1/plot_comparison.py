@@ -93,7 +93,7 @@ def plot_barchart(x_ticks, series_list, series_labels, series_colors,
 	y_min, y_max = plt.gca().get_ylim()
 	aspect_ratio = target_aspect_ratio / (float(y_max - y_min) / (x_max - x_min))
 	# print(x_min, x_max, y_min, y_max, aspect_ratio)
-	plt.axes().set_aspect(aspect=aspect_ratio)
+	plt.gca().set_aspect(aspect=aspect_ratio)
 	plt.tight_layout()
 
 	plt.savefig(out_file, bbox_inches='tight', format=out_file_format)
@@ -593,6 +593,8 @@ def parse_args():
 		help="Output directory to save plots to")
 	parser.add_argument('--out-file-format', dest='out_file_format', type=str,
 		help="Format of the ouput files", default="svg")
+	parser.add_argument('--benchmark-files', dest='benchmark_files', type=str, nargs='+',
+		help="Plot the results of benchmark_all.py instead (one file per version, in order)")
 
 	return parser.parse_args()
 
@@ -785,7 +787,7 @@ def compute_applyexpr_stats(wbs_dir, repo_wbs_dir, testset_dir):
 					raise Exception("Table not found in statdump file: table={}".format(table))
 
 				exprtree_file = os.path.join(wbs_dir, wb, 
-											 "{}.expr_tree/c_tree.json".format(table))
+											 "{}.expr_tree/c_tree.bin".format(table))
 				applyexpr_stats_file = os.path.join(wbs_dir, wb, 
 													"{}.poc_1_out/".format(table),
 													"{}_out.stats.json".format(table))
@@ -895,9 +897,66 @@ def main(wbs_dir, repo_wbs_dir, testset_dir, out_dir, out_file_format):
 	print(json.dumps(applyexpr_stats, indent=2))
 
 
+def plot_benchmark(benchmark_files, out_dir, out_file_format):
+	benchmarks = []
+	for benchmark_file in benchmark_files:
+		with open(benchmark_file, 'r') as fp:
+			benchmarks.append(json.load(fp))
+
+	labels = [b["label"] for b in benchmarks]
+	colors = [DEFAULT_COLORS[idx % len(DEFAULT_COLORS)] for idx in range(len(benchmarks))]
+
+	# stages (one series per version)
+	stages = []
+	for b in benchmarks:
+		stages.extend([s for s in b["stages"].keys() if s not in stages])
+
+	series_list = [[b["stages"][s]["wall_s"] if s in b["stages"] else 0 for s in stages] for b in benchmarks]
+	out_file = os.path.join(out_dir, "benchmark_wall_time.{}".format(out_file_format))
+	plot_barchart(stages, series_list, labels, colors,
+				  "stage", "wall time (s)",
+				  out_file, out_file_format,
+				  "Wall time per stage (all tables)")
+
+	series_list = [[float(b["stages"][s]["peak_rss_KiB"]) / 1024 if s in b["stages"] else 0 for s in stages] for b in benchmarks]
+	out_file = os.path.join(out_dir, "benchmark_peak_rss.{}".format(out_file_format))
+	plot_barchart(stages, series_list, labels, colors,
+				  "stage", "peak RSS (MiB)",
+				  out_file, out_file_format,
+				  "Peak RSS per stage (max over tables)")
+
+	# tables (one series per version)
+	tables = []
+	for b in benchmarks:
+		tables.extend([t for t in sorted(b["tables"].keys()) if t not in tables])
+
+	def table_series(b, f):
+		return [f(b["tables"][t]) if t in b["tables"] else 0 for t in tables]
+
+	series_list = [table_series(b, lambda t: 100 * t["size"]["error_ratio"]) for b in benchmarks]
+	out_file = os.path.join(out_dir, "benchmark_estimation_error.{}".format(out_file_format))
+	plot_barchart(tables, series_list, labels, colors,
+				  "table", "(estimated - real) / real (%)",
+				  out_file, out_file_format,
+				  "Estimation error")
+
+	# estimated vs real size of the last version
+	b = benchmarks[-1]
+	series_list = [table_series(b, lambda t: to_gib(t["size"]["estimated_B"])),
+				   table_series(b, lambda t: to_gib(t["size"]["real_B"]))]
+	out_file = os.path.join(out_dir, "benchmark_estimated_vs_real.{}".format(out_file_format))
+	plot_barchart(tables, series_list, ["estimated", "real"], [COLORS["theoretical"], COLORS["wc"]],
+				  "table", "size (GiB)",
+				  out_file, out_file_format,
+				  "Estimated vs real size ({})".format(b["label"]))
+
+
 if __name__ == "__main__":
 	args = parse_args()
 	print(args)
 
 	out_file_format = "svg" if args.out_file_format is None else args.out_file_format
-	main(args.wbs_dir, args.repo_wbs_dir, args.testset_dir, args.out_dir, out_file_format)
+	if args.benchmark_files is not None:
+		plot_benchmark(args.benchmark_files, args.out_dir, out_file_format)
+	else:
+		main(args.wbs_dir, args.repo_wbs_dir, args.testset_dir, args.out_dir, out_file_format)
@@ -6,6 +6,8 @@ repo_wbs_dir=$SCRIPT_DIR/../../public_bi_benchmark-master_project/benchmark
 # testset_dir=$SCRIPT_DIR/../testsets/testset_full
 testset_dir=$SCRIPT_DIR/../testsets/testset_unique_schema_2
 # testset_dir=$SCRIPT_DIR/../testsets/testset_test
+# drift monitoring of the full file compression (see apply_expression.py --drift-window)
+drift_window=100000
 
 
 usage() {
@@ -88,12 +90,12 @@ apply_expression() {
 	echo "[apply_expression][start] $(date) $wb $table"
 
 	input_file=$wbs_dir/$wb/$table.csv
-	expr_tree_file=$wbs_dir/$wb/$table.expr_tree/c_tree.json
+	expr_tree_file=$wbs_dir/$wb/$table.expr_tree/c_tree.bin
 	output_dir=$wbs_dir/$wb/$table.poc_1_out
 	out_table="${table}_out"
 
 	mkdir -p $output_dir
-	time $SCRIPT_DIR/../pattern_detection/apply_expression.py --expr-tree-file $expr_tree_file --header-file $repo_wbs_dir/$wb/samples/$table.header-renamed.csv --datatypes-file $repo_wbs_dir/$wb/samples/$table.datatypes.csv --output-dir $output_dir --out-table-name $out_table $input_file
+	time $SCRIPT_DIR/../pattern_detection/apply_expression.py --expr-tree-file $expr_tree_file --header-file $repo_wbs_dir/$wb/samples/$table.header-renamed.csv --datatypes-file $repo_wbs_dir/$wb/samples/$table.datatypes.csv --output-dir $output_dir --out-table-name $out_table --drift-window $drift_window $input_file
 
 	echo "[apply_expression][end]   $(date) $wb $table"
 }
@@ -105,7 +107,7 @@ apply_expression_theoretical() {
 
 	echo "[apply_expression_theoretical][start] $(date) $wb $table"
 
-	expr_tree_file=$wbs_dir/$wb/$table.expr_tree/c_tree.json
+	expr_tree_file=$wbs_dir/$wb/$table.expr_tree/c_tree.bin
 
 	# apply on train sample
 	output_dir=$wbs_dir/$wb/$table.poc_1_out-theoretical/train
@@ -188,4 +190,10 @@ date; ./poc_1/process_all.sh $wbs_dir $recursive_exhaustive; echo $?; date
 
 cat $wbs_dir/*/*.poc_1.process.out | less
 
+================================================================================
+# same, with warm worker processes and per-step scheduling (logs: $wbs_dir/*/*.poc_1.*.out)
+./poc_1/daemon.py &
+date; ./poc_1/client.py process-all $wbs_dir $recursive_exhaustive; echo $?; date
+./poc_1/client.py shutdown
+
 END_COMMENT